@@ -0,0 +1,144 @@
+"""Binary cache for text (.dat) data files.
+
+load_dat(path) returns the same array as np.loadtxt(path),
+but the parsed array is also saved as a .npy file in a cache directory,
+and later calls for the same file load the .npy file instead of parsing the text.
+Cache entries are keyed by the absolute path, inode, modification time 
+(in nanoseconds, where available) and size of the data file, 
+so a modified or replaced file is parsed again.
+
+When the total size of the cache exceeds its limit,
+the least recently used entries are removed.
+The cache directory and size limit are set by configure().
+"""
+import os
+import hashlib
+import tempfile
+
+import numpy as np
+
+from . import pawstools
+
+default_cache_dir = os.path.join(pawstools.paws_scratch_dir,'dat_cache')
+default_max_size = 1000000000
+
+cache_dir = default_cache_dir
+max_size = default_max_size
+enabled = True
+
+# running estimate of the total size of the cache,
+# or None if the cache directory has not been scanned yet
+_cache_size = None
+
+def configure(cache_dir=None,max_size=None,enabled=None):
+    """Set the cache directory, the size limit (in bytes), or whether the cache is used."""
+    global _cache_size
+    g = globals()
+    if cache_dir is not None and not cache_dir == g['cache_dir']:
+        g['cache_dir'] = cache_dir
+        _cache_size = None
+    if max_size is not None:
+        g['max_size'] = max_size
+    if enabled is not None:
+        g['enabled'] = enabled
+
+def cache_path(path,st=None):
+    """Get the cache file path for data file `path`, given its os.stat() result `st`."""
+    if st is None:
+        st = os.stat(path)
+    mtime = getattr(st,'st_mtime_ns',st.st_mtime)
+    key = repr((os.path.abspath(path),st.st_ino,mtime,st.st_size))
+    return os.path.join(cache_dir,hashlib.sha1(key.encode()).hexdigest()+'.npy')
+
+def load_dat(path,mmap_mode=None):
+    """Load a text data file, as np.loadtxt(path), through the cache.
+
+    If mmap_mode is provided (e.g. 'r'),
+    cached arrays are memory-mapped instead of read.
+    """
+    if not enabled:
+        return np.loadtxt(path,dtype=float)
+    st = os.stat(path)
+    cpath = cache_path(path,st)
+    if os.path.exists(cpath):
+        try:
+            arr = np.load(cpath,mmap_mode=mmap_mode)
+        except (IOError,OSError,ValueError):
+            # the entry was evicted or is damaged: parse the file again
+            arr = None
+        if arr is not None:
+            try:
+                # mark the entry as recently used
+                os.utime(cpath,None)
+            except OSError:
+                # read-only cache
+                pass
+            return arr
+    arr = np.loadtxt(path,dtype=float)
+    save_entry(cpath,arr)
+    return arr
+
+def save_entry(cpath,arr):
+    """Save arr as the cache entry cpath.
+
+    The cache is an optimization only:
+    if the entry cannot be written (e.g. cache_dir is not writable),
+    nothing is saved, and no error is raised.
+    """
+    global _cache_size
+    tmp_path = None
+    try:
+        if not os.path.exists(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                # another process made the directory
+                if not os.path.isdir(cache_dir):
+                    raise
+        if _cache_size is None:
+            _cache_size = sum(sz for fp,sz,t in cache_entries())
+        # write to a temporary file and rename, so that readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp',dir=cache_dir)
+        with os.fdopen(fd,'wb') as f:
+            np.save(f,arr)
+        os.rename(tmp_path,cpath)
+        tmp_path = None
+        _cache_size += os.path.getsize(cpath)
+    except (IOError,OSError):
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+    if _cache_size > max_size:
+        evict(int(0.9*max_size))
+
+def cache_entries():
+    """List (path,size,last use time) for all entries in the cache."""
+    entries = []
+    for fn in os.listdir(cache_dir):
+        if fn.endswith('.npy'):
+            fp = os.path.join(cache_dir,fn)
+            try:
+                st = os.stat(fp)
+            except OSError:
+                continue
+            entries.append((fp,st.st_size,st.st_mtime))
+    return entries
+
+def evict(target_size=0):
+    """Remove the least recently used entries until the cache is no larger than target_size."""
+    global _cache_size
+    if not os.path.exists(cache_dir):
+        _cache_size = 0
+        return
+    entries = sorted(cache_entries(),key=lambda e: e[2])
+    total = sum(sz for fp,sz,t in entries)
+    for fp,sz,t in entries:
+        if total <= target_size:
+            break
+        try:
+            os.remove(fp)
+        except OSError:
+            pass
+        total -= sz
+    _cache_size = total
+
@@ -0,0 +1,199 @@
+"""SQLite index of sample header files.
+
+A HeaderIndex records, for each indexed header file,
+its path, modification time, size, time stamp, and header fields,
+so that samples can be selected by time window or by header field values
+without reading the header files.
+Header files are (re-)read only when they are new or modified.
+YAML (or JSON) headers and legacy SPEC .txt headers (see ReadSpecHeader) are supported.
+"""
+import os
+import glob
+import json
+import sqlite3
+import numbers
+
+from . import pawstools, serialization
+from .operations.SSRL_BEAMLINE_1_5.ReadSpecHeader import read_spec_file
+
+schema = [
+    'CREATE TABLE IF NOT EXISTS headers ('
+        'path TEXT PRIMARY KEY, dir_path TEXT, mtime REAL, size INTEGER, '
+        'time REAL, header TEXT)',
+    'CREATE INDEX IF NOT EXISTS headers_time ON headers (time)',
+    'CREATE INDEX IF NOT EXISTS headers_dir ON headers (dir_path)',
+    'CREATE TABLE IF NOT EXISTS fields ('
+        'path TEXT, key TEXT, num REAL, str TEXT, PRIMARY KEY (path,key))',
+    'CREATE INDEX IF NOT EXISTS fields_num ON fields (key,num)',
+    'CREATE INDEX IF NOT EXISTS fields_str ON fields (key,str)'
+    ]
+
+try:
+    string_types = (str,unicode)
+except NameError:
+    # python 3
+    string_types = (str,)
+
+header_readers = dict(
+    yaml = serialization.load_file,
+    spec = read_spec_file
+    )
+
+def header_time(hdr):
+    """Get a numerical time stamp from a header, or None."""
+    for k in ['t_utc','time']:
+        t = hdr.get(k)
+        if isinstance(t,numbers.Number) and not isinstance(t,bool):
+            return float(t)
+    return None
+
+class HeaderIndex(object):
+
+    def __init__(self,db_path=None):
+        """Open (or create) a header index.
+
+        Parameters
+        ----------
+        db_path : str
+            path to the SQLite database file
+            (default: paws_scratch_dir/header_index.sqlite)
+        """
+        super(HeaderIndex,self).__init__()
+        if db_path is None:
+            db_path = os.path.join(pawstools.paws_scratch_dir,'header_index.sqlite')
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.message_callback = self.tagged_print
+        with self.conn:
+            for stmt in schema:
+                self.conn.execute(stmt)
+
+    def tagged_print(self,msg):
+        print('[{}] {}'.format(type(self).__name__,msg))
+
+    def close(self):
+        self.conn.close()
+
+    def update(self,dir_path,regex='*.yml',header_format='yaml'):
+        """Index the header files in dir_path that match regex.
+
+        New and modified files are read and (re-)indexed,
+        and files that no longer exist are removed from the index.
+        Files that cannot be read (or that are removed while the index is updated)
+        are reported by message_callback(), removed from the index, and skipped.
+
+        Parameters
+        ----------
+        dir_path : str
+            directory containing the header files
+        regex : str
+            unix-like pattern for selecting the header files
+        header_format : str
+            either 'yaml' or 'spec'
+
+        Returns
+        -------
+        n_read : int
+            number of header files that were read
+        """
+        dir_path = os.path.abspath(dir_path)
+        read_header = header_readers[header_format]
+        paths = glob.glob(os.path.join(dir_path,regex))
+        known = dict(((p,(mt,sz)) for p,mt,sz in self.conn.execute(
+            'SELECT path, mtime, size FROM headers WHERE dir_path=?',(dir_path,))))
+        n_read = 0
+        with self.conn:
+            for p in paths:
+                prev = known.pop(p,None)
+                try:
+                    st = os.stat(p)
+                    if prev == (st.st_mtime,st.st_size):
+                        continue
+                    hdr = read_header(p)
+                except Exception as ex:
+                    self.message_callback('skipping header {}: {}'.format(p,ex))
+                    self.remove_header(p)
+                    continue
+                self.add_header(p,hdr,st)
+                n_read += 1
+            # remaining entries are for files that were removed,
+            # or that do not match regex
+            for p in known.keys():
+                if not os.path.exists(p):
+                    self.remove_header(p)
+        return n_read
+
+    def add_header(self,path,hdr,st=None):
+        if st is None:
+            st = os.stat(path)
+        hdr = pawstools.primitives(dict(hdr or {}))
+        self.remove_header(path)
+        self.conn.execute('INSERT INTO headers VALUES (?,?,?,?,?,?)',
+            (path,os.path.dirname(path),st.st_mtime,st.st_size,
+            header_time(hdr),json.dumps(hdr,default=str)))
+        fields = []
+        for k,v in hdr.items():
+            if isinstance(v,numbers.Number):
+                fields.append((path,k,float(v),None))
+            elif isinstance(v,string_types):
+                fields.append((path,k,None,v))
+        self.conn.executemany('INSERT INTO fields VALUES (?,?,?,?)',fields)
+
+    def remove_header(self,path):
+        self.conn.execute('DELETE FROM headers WHERE path=?',(path,))
+        self.conn.execute('DELETE FROM fields WHERE path=?',(path,))
+
+    def select(self,dir_path=None,t_min=None,t_max=None,fields=None):
+        """Select indexed header files, in order of time.
+
+        Parameters
+        ----------
+        dir_path : str
+            if provided, only headers in this directory are selected
+        t_min, t_max : float
+            if provided, only headers with t_min <= time < t_max are selected
+        fields : dict
+            header field requirements: each key maps either to a value,
+            which the field must equal, or to a (min,max) tuple,
+            which the (numerical) field must fall within (min <= value < max)
+
+        Returns
+        -------
+        paths : list
+            paths of the selected header files
+        """
+        conds = []
+        args = []
+        if dir_path is not None:
+            conds.append('dir_path=?')
+            args.append(os.path.abspath(dir_path))
+        if t_min is not None:
+            conds.append('time>=?')
+            args.append(t_min)
+        if t_max is not None:
+            conds.append('time<?')
+            args.append(t_max)
+        for k,v in (fields or {}).items():
+            if isinstance(v,(tuple,list)):
+                conds.append('path IN (SELECT path FROM fields WHERE key=? AND num>=? AND num<?)')
+                args.extend([k,v[0],v[1]])
+            elif isinstance(v,numbers.Number):
+                conds.append('path IN (SELECT path FROM fields WHERE key=? AND num=?)')
+                args.extend([k,float(v)])
+            else:
+                conds.append('path IN (SELECT path FROM fields WHERE key=? AND str=?)')
+                args.extend([k,v])
+        qry = 'SELECT path FROM headers'
+        if conds:
+            qry += ' WHERE '+' AND '.join(conds)
+        qry += ' ORDER BY time, path'
+        return [row[0] for row in self.conn.execute(qry,args)]
+
+    def header(self,path):
+        """Get the indexed header data for path, or None if path is not indexed."""
+        row = self.conn.execute('SELECT header FROM headers WHERE path=?',
+            (os.path.abspath(path),)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
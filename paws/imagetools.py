@@ -0,0 +1,259 @@
+"""Tools for reading detector images."""
+import os
+import struct
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import fabio
+
+# if memory_budget is set (in bytes), the least recently loaded images
+# are released whenever the loaded ImageHandles exceed the budget
+memory_budget = None
+
+# loaded handles, in order of loading: id(handle): (weakref to handle, nbytes)
+_loaded = OrderedDict()
+_loaded_lock = threading.Lock()
+
+def set_memory_budget(n_bytes=None):
+    """Set the memory budget (in bytes) for loaded ImageHandles (None for no limit)."""
+    global memory_budget
+    memory_budget = n_bytes
+    _enforce_budget()
+
+def loaded_bytes():
+    """Get the total size of the images held by loaded ImageHandles."""
+    with _loaded_lock:
+        return sum(nb for ref,nb in _loaded.values())
+
+def _enforce_budget():
+    to_release = []
+    with _loaded_lock:
+        total = sum(nb for ref,nb in _loaded.values())
+        while memory_budget is not None and total > memory_budget and _loaded:
+            hid, (ref, nb) = _loaded.popitem(last=False)
+            total -= nb
+            to_release.append(ref())
+    for h in to_release:
+        if h is not None:
+            h.release()
+
+def _forget(hid):
+    with _loaded_lock:
+        _loaded.pop(hid,None)
+
+class ImageHandle(object):
+    """Handle for an image file, which is read only when its pixels are accessed.
+
+    The image is opened and decoded (or memory-mapped, if mmap is True
+    and the file format allows it, see read_image()) on the first access to data,
+    and kept until release() is called, or until it is released
+    to keep the loaded images within the memory budget (see set_memory_budget()).
+    Copying or pickling a handle copies only its path.
+    """
+
+    def __init__(self,path,mmap=False):
+        super(ImageHandle,self).__init__()
+        self.path = path
+        self.mmap = mmap
+        self._lock = threading.Lock()
+        self._data = None
+        self._header = None
+
+    def __repr__(self):
+        return 'ImageHandle({!r})'.format(self.path)
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    @property
+    def data(self):
+        """The image pixels, as a numpy array (loaded on first access)."""
+        data = self._data
+        if data is None:
+            data = self.load()
+        return data
+
+    @property
+    def header(self):
+        """The image file header, as a dict (read on first access)."""
+        if self._header is None:
+            self._header = read_header(self.path)
+        return self._header
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    def load(self):
+        """Read the image, if it is not already loaded, and return its pixels."""
+        with self._lock:
+            if self._data is None:
+                data, header = read_image(self.path,self.mmap)
+                self._data = data
+                if header is not None:
+                    self._header = header
+                if not isinstance(data,np.memmap):
+                    with _loaded_lock:
+                        _loaded[id(self)] = (weakref.ref(self,lambda ref,hid=id(self): _forget(hid)),data.nbytes)
+            data = self._data
+        if memory_budget is not None:
+            _enforce_budget()
+        return data
+
+    def release(self):
+        """Drop the loaded pixels (they are read again on the next access)."""
+        with self._lock:
+            self._data = None
+        _forget(id(self))
+
+    def __array__(self,dtype=None,copy=None):
+        if dtype is None:
+            return np.asarray(self.data)
+        return np.asarray(self.data,dtype=dtype)
+
+    def __deepcopy__(self,memo):
+        return ImageHandle(self.path,self.mmap)
+
+    def __copy__(self):
+        return ImageHandle(self.path,self.mmap)
+
+    def __getstate__(self):
+        return dict(path=self.path,mmap=self.mmap)
+
+    def __setstate__(self,state):
+        self.__init__(state['path'],state['mmap'])
+
+def read_image(path,mmap=False):
+    """Read an image file, returning its pixels and header.
+
+    If mmap is True, .npy files and uncompressed single-channel TIFFs 
+    are memory-mapped (see tiff_memmap()), and their header is returned as None.
+    Otherwise, and for all other files, the image is decoded by fabio.
+    """
+    if mmap:
+        ext = os.path.splitext(path)[1].lower()
+        if ext == '.npy':
+            return np.load(path,mmap_mode='r'), None
+        if ext in ['.tif','.tiff']:
+            data = tiff_memmap(path)
+            if data is not None:
+                return data, None
+    img = fabio.open(path)
+    return img.data, dict(img.header)
+
+def read_header(path):
+    """Read the header of an image file (by fabio)."""
+    return dict(fabio.open(path).header)
+
+# TIFF tags used by tiff_memmap()
+TIFF_TAGS = dict(
+    width=256,
+    height=257,
+    bits_per_sample=258,
+    compression=259,
+    strip_offsets=273,
+    samples_per_pixel=277,
+    strip_byte_counts=279,
+    planar_config=284,
+    tile_width=322,
+    sample_format=339
+    )
+# struct formats of the TIFF field types (BYTE, ASCII, SHORT, LONG, RATIONAL, ...)
+TIFF_TYPES = {1:'B',2:'c',3:'H',4:'I',5:'II',6:'b',7:'B',8:'h',9:'i',10:'ii',11:'f',12:'d',16:'Q'}
+# numpy dtype kinds for the TIFF SampleFormat values
+TIFF_SAMPLE_KINDS = {1:'u',2:'i',3:'f'}
+
+# parsed TIFF layouts, keyed by (path,mtime,size): (offset,dtype,shape), or None
+_tiff_layouts = {}
+_tiff_layouts_lock = threading.Lock()
+
+def tiff_memmap(path):
+    """Memory-map the pixels of an uncompressed TIFF file.
+
+    The first image in the file must be uncompressed, single-channel,
+    8-, 16-, 32- or 64-bit, and stored in contiguous strips
+    (as written by e.g. MarCCD and Pilatus detectors).
+    The layout of each file is parsed once and cached.
+
+    Returns a read-only numpy memmap, or None if the file cannot be memory-mapped.
+    """
+    st = os.stat(path)
+    key = (os.path.abspath(path),st.st_mtime,st.st_size)
+    with _tiff_layouts_lock:
+        if key in _tiff_layouts:
+            layout = _tiff_layouts[key]
+        else:
+            try:
+                layout = tiff_layout(path,st.st_size)
+            except (IOError,ValueError,struct.error):
+                layout = None
+            _tiff_layouts[key] = layout
+    if layout is None:
+        return None
+    offset, dtype, shape = layout
+    return np.memmap(path,dtype=dtype,mode='r',offset=offset,shape=shape)
+
+def tiff_layout(path,file_size):
+    """Parse the first image directory of a TIFF file.
+
+    Returns (offset,dtype,shape) for the pixel data, 
+    or None if the image is not a simple uncompressed image in contiguous strips.
+    """
+    with open(path,'rb') as f:
+        bo = f.read(2)
+        if bo == b'II':
+            e = '<'
+        elif bo == b'MM':
+            e = '>'
+        else:
+            return None
+        magic, ifd_offset = struct.unpack(e+'HI',f.read(6))
+        if not magic == 42:
+            # not a classic TIFF (e.g. BigTIFF)
+            return None
+        f.seek(ifd_offset)
+        n_entries = struct.unpack(e+'H',f.read(2))[0]
+        entries = f.read(12*n_entries)
+        tags = {}
+        for ient in range(n_entries):
+            tag, typ, count = struct.unpack(e+'HHI',entries[12*ient:12*ient+8])
+            if not typ in TIFF_TYPES:
+                continue
+            fmt = e+TIFF_TYPES[typ]*count
+            nb = struct.calcsize(fmt)
+            if nb <= 4:
+                vals = struct.unpack(fmt,entries[12*ient+8:12*ient+8+nb])
+            else:
+                val_offset = struct.unpack(e+'I',entries[12*ient+8:12*ient+12])[0]
+                pos = f.tell()
+                f.seek(val_offset)
+                vals = struct.unpack(fmt,f.read(nb))
+                f.seek(pos)
+            tags[tag] = vals
+    T = TIFF_TAGS
+    if T['tile_width'] in tags \
+    or tags.get(T['compression'],(1,))[0] != 1 \
+    or tags.get(T['samples_per_pixel'],(1,))[0] != 1 \
+    or tags.get(T['planar_config'],(1,))[0] != 1 \
+    or not T['strip_offsets'] in tags or not T['strip_byte_counts'] in tags:
+        return None
+    width = tags[T['width']][0]
+    height = tags[T['height']][0]
+    bits = tags.get(T['bits_per_sample'],(1,))[0]
+    kind = TIFF_SAMPLE_KINDS.get(tags.get(T['sample_format'],(1,))[0])
+    if kind is None or not bits in [8,16,32,64] or (kind == 'f' and bits < 32):
+        return None
+    dtype = np.dtype(e+kind+str(bits//8))
+    offsets = tags[T['strip_offsets']]
+    counts = tags[T['strip_byte_counts']]
+    for off,cnt,next_off in zip(offsets[:-1],counts[:-1],offsets[1:]):
+        if not off+cnt == next_off:
+            return None
+    n_bytes = width*height*dtype.itemsize
+    if sum(counts) < n_bytes or offsets[0]+n_bytes > file_size:
+        return None
+    return offsets[0], dtype, (height,width)
+
@@ -0,0 +1,205 @@
+"""Journaled key-value store, for frequently updated state files.
+
+pawstools.update_file() reads and rewrites its whole file on every update.
+A JournalStore instead appends each update to a journal file (one JSON line per update),
+so an update costs one short write, regardless of the size of the state.
+When the journal grows past compact_size bytes,
+the journal is set aside, and a background thread writes the full state
+to a new snapshot file (by serialization.save_file()), which replaces the old one by rename.
+
+The state is the snapshot, updated by the set-aside journal (if any) and then the journal.
+A crash at any point leaves a readable state:
+an interrupted journal line is ignored (and removed at the next open),
+and an interrupted compaction leaves the old snapshot in place,
+or the new snapshot with a set-aside journal that it already contains.
+If a compaction fails (e.g. the disk is full), the set-aside journal is kept,
+the exception is raised by the next wait(), compact() or close(),
+and the compaction is retried by the next compaction.
+load_state() reads the state of a store without opening it for writing.
+"""
+import os
+import json
+import copy
+import threading
+
+from . import pawstools, serialization
+
+_replace = getattr(os,'replace',os.rename)
+
+def journal_paths(file_path):
+    return file_path+'.journal', file_path+'.journal.old'
+
+def read_journal(journal_path,d):
+    """Apply the updates in journal_path to dict d.
+
+    Returns the size of the complete lines in the journal, in bytes.
+    """
+    n_bytes = 0
+    if not os.path.exists(journal_path):
+        return n_bytes
+    with open(journal_path,'rb') as f:
+        for ln in f:
+            if not ln.endswith(b'\n'):
+                # interrupted append
+                break
+            try:
+                upd = json.loads(ln.decode('utf-8'))
+            except ValueError:
+                break
+            d.update(upd)
+            n_bytes += len(ln)
+    return n_bytes
+
+def load_state(file_path):
+    """Read the state of a JournalStore (or of a plain file written by pawstools.save_file()) as a dict."""
+    d = {}
+    if os.path.exists(file_path):
+        d = serialization.load_file(file_path) or {}
+    jpath, old_jpath = journal_paths(file_path)
+    read_journal(old_jpath,d)
+    read_journal(jpath,d)
+    return d
+
+class JournalStore(object):
+
+    def __init__(self,file_path,compact_size=1000000,sync=True):
+        """Open (or create) a JournalStore.
+
+        Parameters
+        ----------
+        file_path : str
+            path to the snapshot file- the journals are kept next to it,
+            at file_path+'.journal' and file_path+'.journal.old'.
+            An existing file written by pawstools.save_file() can be used as the snapshot.
+        compact_size : int
+            journal size (in bytes) at which the state is compacted into the snapshot
+        sync : bool
+            if True, each update is flushed to disk (by os.fsync()) before update() returns
+        """
+        super(JournalStore,self).__init__()
+        self.file_path = file_path
+        self.journal_path, self.old_journal_path = journal_paths(file_path)
+        self.compact_size = compact_size
+        self.sync = sync
+        # lock must be acquired before modifying self.state or the journal
+        self.lock = threading.Lock()
+        self.compact_thread = None
+        # an exception raised by the last compaction, re-raised by wait()
+        self.compact_error = None
+        self.state = {}
+        if os.path.exists(file_path):
+            self.state = serialization.load_file(file_path) or {}
+        read_journal(self.old_journal_path,self.state)
+        n_bytes = read_journal(self.journal_path,self.state)
+        self.journal = open(self.journal_path,'ab')
+        # drop any interrupted append
+        self.journal.truncate(n_bytes)
+        self.journal_size = n_bytes
+        if os.path.exists(self.old_journal_path):
+            # finish an interrupted compaction
+            self.start_compaction(rotate=False)
+
+    def __getitem__(self,key):
+        with self.lock:
+            return copy.deepcopy(self.state[key])
+
+    def __contains__(self,key):
+        return key in self.state
+
+    def get(self,key,default=None):
+        with self.lock:
+            return copy.deepcopy(self.state.get(key,default))
+
+    def to_dict(self):
+        """Get a copy of the current state."""
+        with self.lock:
+            return copy.deepcopy(self.state)
+
+    def update(self,d):
+        """Save the items in dict d, without removing items not included in d."""
+        d = pawstools.primitives(dict(d))
+        ln = (json.dumps(d,default=str)+'\n').encode('utf-8')
+        # keep the values as they will be read back from the journal
+        # (e.g. with string keys), so that the state matches a reopened store
+        d = json.loads(ln.decode('utf-8'))
+        with self.lock:
+            self.journal.write(ln)
+            self.journal.flush()
+            if self.sync:
+                os.fsync(self.journal.fileno())
+            self.state.update(d)
+            self.journal_size += len(ln)
+            compact = self.journal_size >= self.compact_size
+        if compact:
+            self.start_compaction()
+
+    def start_compaction(self,rotate=True):
+        """Start writing the state to the snapshot in a background thread.
+
+        Does nothing if a compaction is already running.
+        If a set-aside journal is left by a failed compaction,
+        the compaction is retried without setting aside the current journal.
+        """
+        with self.lock:
+            if self.compact_thread is not None and self.compact_thread.is_alive():
+                return
+            if rotate and os.path.exists(self.old_journal_path):
+                rotate = False
+            if rotate:
+                # updates after this point go to a new journal
+                self.journal.close()
+                _replace(self.journal_path,self.old_journal_path)
+                self.journal = open(self.journal_path,'ab')
+                self.journal_size = 0
+            # values are replaced, never modified, by update(),
+            # so a shallow copy is a consistent snapshot of the state
+            state = dict(self.state)
+            self.compact_thread = threading.Thread(target=self.write_snapshot,args=(state,))
+            self.compact_thread.start()
+
+    def write_snapshot(self,state):
+        tmp_path = self.file_path+'.tmp'
+        try:
+            serialization.save_file(tmp_path,state)
+            with open(tmp_path,'rb+') as f:
+                os.fsync(f.fileno())
+            _replace(tmp_path,self.file_path)
+            os.remove(self.old_journal_path)
+        except Exception as ex:
+            # the old snapshot and the set-aside journal still hold the state
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            self.compact_error = ex
+
+    def compact(self):
+        """Compact the journal into the snapshot, and wait for it to finish."""
+        self.wait()
+        if os.path.exists(self.old_journal_path):
+            # finish a failed compaction first
+            self.start_compaction(rotate=False)
+            self.wait()
+        with self.lock:
+            empty = self.journal_size == 0
+        if not empty:
+            self.start_compaction()
+            self.wait()
+
+    def wait(self):
+        """Wait for a running compaction to finish.
+
+        If the compaction failed, its exception is raised here (once).
+        """
+        thd = self.compact_thread
+        if thd is not None:
+            thd.join()
+        ex = self.compact_error
+        if ex is not None:
+            self.compact_error = None
+            raise ex
+
+    def close(self):
+        try:
+            self.wait()
+        finally:
+            with self.lock:
+                self.journal.close()
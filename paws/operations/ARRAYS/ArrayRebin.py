@@ -0,0 +1,168 @@
+from collections import OrderedDict
+
+import numpy as np
+from scipy import sparse
+
+from ..Operation import Operation
+
+inputs = OrderedDict(
+    q_I_arrays=[],
+    dI_arrays=None,
+    q_grid=None,
+    method='linear')
+outputs = OrderedDict(
+    q=None,
+    I_stack=None,
+    dI_stack=None)
+
+class ArrayRebin(Operation):
+    """
+    Resample one or more n-by-2 arrays onto a common grid 
+
+    The result is a dense n_arrays-by-n_q stack of intensities,
+    with one row per input array, all sampled at q_grid.
+    Each resampling is a sparse matrix of weights 
+    applied to the source intensities.
+    The weights are computed once for each distinct source grid,
+    and applied to all arrays that share that grid in one product.
+    Errors are propagated through the same weights, 
+    assuming independent errors at the source points.
+
+    Methods:
+    'linear' interpolates linearly between source points.
+    'flux' treats each source point as a bin (with edges 
+    halfway between neighboring points) of constant intensity,
+    and averages the intensity over each target bin, 
+    so that the integrated intensity is conserved.
+
+    Target points outside the range of a source grid are set to nan.
+    """
+
+    def __init__(self):
+        super(ArrayRebin, self).__init__(inputs,outputs)
+        self.input_doc['q_I_arrays'] = 'list of n-by-2 arrays- '\
+            'if the arrays have a third column, it is used as dI'
+        self.input_doc['dI_arrays'] = 'optional list of 1d arrays of intensity errors'
+        self.input_doc['q_grid'] = '1d array of target q values, '\
+            'in increasing order (default: q values of the first array)'
+        self.input_doc['method'] = 'resampling method- linear or flux'
+        self.output_doc['q'] = 'the target q values'
+        self.output_doc['I_stack'] = 'n_arrays-by-n_q array of resampled intensities'
+        self.output_doc['dI_stack'] = 'n_arrays-by-n_q array of resampled errors, '\
+            'or None if no errors were provided'
+
+    def run(self):
+        q_I_arrays = self.inputs['q_I_arrays']
+        dI_arrays = self.inputs['dI_arrays']
+        if dI_arrays is None and len(q_I_arrays) > 0 and all([q_I.shape[1] > 2 for q_I in q_I_arrays]):
+            dI_arrays = [q_I[:,2] for q_I in q_I_arrays]
+        q_grid = self.inputs['q_grid']
+        if q_grid is None:
+            q_grid = q_I_arrays[0][:,0]
+        q_grid = np.asarray(q_grid,dtype=float)
+        if self.inputs['method'] == 'flux':
+            weight_func = rebin_weights
+        else:
+            weight_func = linear_weights
+
+        # group the arrays by source grid
+        grids = OrderedDict()
+        for iarr,q_I in enumerate(q_I_arrays):
+            q_key = np.asarray(q_I[:,0],dtype=float).tobytes()
+            if not q_key in grids:
+                grids[q_key] = []
+            grids[q_key].append(iarr)
+
+        I_stack = np.empty((len(q_I_arrays),len(q_grid)))
+        dI_stack = None
+        if dI_arrays is not None:
+            dI_stack = np.empty((len(q_I_arrays),len(q_grid)))
+        for q_key,idx in grids.items():
+            q_src = np.asarray(q_I_arrays[idx[0]][:,0],dtype=float)
+            wts, valid = weight_func(q_src,q_grid)
+            I_src = np.array([q_I_arrays[i][:,1] for i in idx],dtype=float)
+            I_stack[idx] = wts.dot(I_src.T).T
+            I_stack[np.ix_(idx,~valid)] = np.nan
+            if dI_stack is not None:
+                dI_src = np.array([dI_arrays[i] for i in idx],dtype=float)
+                dI_stack[idx] = np.sqrt(wts.multiply(wts).dot((dI_src**2).T).T)
+                dI_stack[np.ix_(idx,~valid)] = np.nan
+        self.message_callback('resampled {} arrays from {} distinct grids'.format(len(q_I_arrays),len(grids)))
+        self.outputs['q'] = q_grid
+        self.outputs['I_stack'] = I_stack
+        self.outputs['dI_stack'] = dI_stack
+        return self.outputs
+
+def linear_weights(q_src,q_dest):
+    """Build a sparse matrix that linearly interpolates from q_src to q_dest.
+
+    Both grids must be in increasing order.
+
+    Returns
+    -------
+    wts : scipy.sparse.csr_matrix
+        n_dest-by-n_src matrix of interpolation weights
+    valid : array of bool
+        False for q_dest values outside the range of q_src
+    """
+    n_src = len(q_src)
+    n_dest = len(q_dest)
+    valid = (q_dest >= q_src[0]) & (q_dest <= q_src[-1])
+    j = np.clip(np.searchsorted(q_src,q_dest),1,max(n_src-1,1))
+    if n_src > 1:
+        f = (q_dest-q_src[j-1])/(q_src[j]-q_src[j-1])
+    else:
+        j[:] = 0
+        f = np.zeros(n_dest)
+    f[~valid] = 0.
+    rows = np.concatenate([np.arange(n_dest),np.arange(n_dest)])
+    cols = np.concatenate([j-1,j]) if n_src > 1 else np.zeros(2*n_dest,dtype=int)
+    vals = np.concatenate([1.-f,f])
+    wts = sparse.csr_matrix((vals,(rows,cols)),shape=(n_dest,n_src))
+    return wts, valid
+
+def bin_edges(q):
+    """Bin edges halfway between the points of q, with half-width end bins."""
+    q = np.asarray(q,dtype=float)
+    if len(q) < 2:
+        return np.array([q[0],q[0]])
+    mid = (q[1:]+q[:-1])/2.
+    return np.concatenate([[q[0]-(mid[0]-q[0])],mid,[q[-1]+(q[-1]-mid[-1])]])
+
+def rebin_weights(q_src,q_dest):
+    """Build a sparse matrix that rebins from q_src to q_dest, conserving flux.
+
+    Each element (i,j) is the fraction of target bin i
+    that is covered by source bin j.
+    Rows are normalized by the covered fraction of each target bin,
+    so that partially covered bins at the edges
+    get the mean intensity over the covered part.
+
+    Returns
+    -------
+    wts : scipy.sparse.csr_matrix
+        n_dest-by-n_src matrix of rebinning weights
+    valid : array of bool
+        False for target bins that do not overlap any source bins
+    """
+    e_src = bin_edges(q_src)
+    e_dest = bin_edges(q_dest)
+    n_src = len(q_src)
+    n_dest = len(q_dest)
+    # range of source bins overlapping each target bin
+    lo = np.clip(np.searchsorted(e_src,e_dest[:-1],side='right')-1,0,n_src-1)
+    hi = np.clip(np.searchsorted(e_src,e_dest[1:],side='left')-1,0,n_src-1)
+    counts = np.maximum(hi-lo+1,0)
+    rows = np.repeat(np.arange(n_dest),counts)
+    offsets = np.arange(rows.shape[0])-np.repeat(np.cumsum(counts)-counts,counts)
+    cols = lo[rows]+offsets
+    overlap = np.minimum(e_dest[1:][rows],e_src[cols+1]) \
+        - np.maximum(e_dest[:-1][rows],e_src[cols])
+    overlap = np.clip(overlap,0.,None)
+    covered = np.bincount(rows,overlap,minlength=n_dest)
+    valid = covered > 0
+    with np.errstate(divide='ignore',invalid='ignore'):
+        vals = overlap/covered[rows]
+    vals[~valid[rows]] = 0.
+    wts = sparse.csr_matrix((vals,(rows,cols)),shape=(n_dest,n_src))
+    return wts, valid
@@ -3,27 +3,115 @@ from collections import OrderedDict
 import numpy as np
 
 from ..Operation import Operation
+from ... import datcache
 
-inputs = OrderedDict(x_y_arrays=[])
-outputs = OrderedDict(x_ymean=None)
+inputs = OrderedDict(
+    x_y_arrays=[],
+    x_y_paths=[],
+    weights=None)
+outputs = OrderedDict(
+    x_ymean=None,
+    dy=None,
+    y_var=None,
+    n_arrays=0)
 
 class ArrayYMean(Operation):
     """
     Average the second column of one or more n-by-2 arrays
+
+    The arrays are consumed one at a time by a RunningMean,
+    so x_y_arrays can be a generator, 
+    and x_y_paths are loaded one at a time,
+    without holding all of the arrays in memory.
     """
 
     def __init__(self):
         super(ArrayYMean, self).__init__(inputs,outputs)
-        self.input_doc['x_y_arrays'] = 'list of n-by-2 arrays'
+        self.input_doc['x_y_arrays'] = 'list (or other iterable) of n-by-2 arrays'
+        self.input_doc['x_y_paths'] = 'list of paths to files containing n-by-2 arrays- '\
+            'if provided, x_y_arrays is ignored'
+        self.input_doc['weights'] = 'optional list of weights, one per array- '\
+            'each weight can be a scalar or an array of n weights'
         self.output_doc['x_ymean'] = 'n-by-2 array of x and mean(y)'
+        self.output_doc['dy'] = 'standard error of mean(y)'
+        self.output_doc['y_var'] = 'variance of y'
+        self.output_doc['n_arrays'] = 'number of arrays averaged'
 
     def run(self):
         x_y_arrays = self.inputs['x_y_arrays']
+        if self.inputs['x_y_paths']:
+            x_y_arrays = (datcache.load_dat(p) for p in self.inputs['x_y_paths'])
+        wts = self.inputs['weights']
+        acc = RunningMean()
+        x = None
+        for ixy,xy in enumerate(x_y_arrays):
+            if x is None:
+                x = np.array(xy[:,0])
+            wt = 1.
+            if wts is not None:
+                wt = wts[ixy]
+            acc.add(xy[:,1],wt)
         x_ymean = None
-        if len(x_y_arrays) > 0:
-            x_ymean = np.zeros(x_y_arrays[0].shape)
-            x_ymean[:,0] = x_y_arrays[0][:,0]
-            x_ymean[:,1] = np.mean([xy[:,1] for xy in x_y_arrays],axis=0)
+        if acc.n > 0:
+            x_ymean = np.zeros((x.shape[0],2))
+            x_ymean[:,0] = x
+            x_ymean[:,1] = acc.mean
         self.outputs['x_ymean'] = x_ymean 
+        self.outputs['dy'] = acc.std_error()
+        self.outputs['y_var'] = acc.variance()
+        self.outputs['n_arrays'] = acc.n
         return self.outputs
 
+class RunningMean(object):
+    """Accumulate the (weighted) mean and variance of a stream of arrays.
+
+    Uses the weighted form of Welford's online update,
+    so only the running mean, the running sum of squared deviations,
+    and the running sums of weights are stored.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = None
+        self.sum_sq = None
+        self.sum_wts = None
+        self.sum_wts_sq = None
+
+    def add(self,y,weight=1.):
+        """Add array y to the running mean, with a scalar or array weight."""
+        y = np.asarray(y,dtype=float)
+        wt = np.asarray(weight,dtype=float)
+        if self.n == 0:
+            self.mean = np.zeros(y.shape)
+            self.sum_sq = np.zeros(y.shape)
+            self.sum_wts = np.zeros(y.shape)
+            self.sum_wts_sq = np.zeros(y.shape)
+        self.n += 1
+        self.sum_wts += wt
+        self.sum_wts_sq += wt**2
+        delta = y-self.mean
+        with np.errstate(divide='ignore',invalid='ignore'):
+            self.mean += np.where(self.sum_wts > 0,wt/self.sum_wts,0.)*delta
+        self.sum_sq += wt*delta*(y-self.mean)
+
+    def n_effective(self):
+        """Effective number of samples, sum(w)**2/sum(w**2)."""
+        if self.n == 0:
+            return None
+        with np.errstate(divide='ignore',invalid='ignore'):
+            return self.sum_wts**2/self.sum_wts_sq
+
+    def variance(self):
+        """Unbiased estimate of the variance of the samples."""
+        if self.n < 2:
+            return None
+        n_eff = self.n_effective()
+        with np.errstate(divide='ignore',invalid='ignore'):
+            return self.sum_sq/self.sum_wts*n_eff/(n_eff-1.)
+
+    def std_error(self):
+        """Estimate of the standard error of the mean."""
+        if self.n < 2:
+            return None
+        with np.errstate(divide='ignore',invalid='ignore'):
+            return np.sqrt(self.variance()/self.n_effective())
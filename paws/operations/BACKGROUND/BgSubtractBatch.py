@@ -0,0 +1,75 @@
+import numpy as np
+from collections import OrderedDict
+
+from ..Operation import Operation
+
+inputs = OrderedDict(
+    q = None,
+    I_stack = None,
+    I_bg = None,
+    bg_index = None,
+    dI_stack = None,
+    dI_bg = None)
+outputs = OrderedDict(
+    I_bgsub_stack = None,
+    dI_stack = None,
+    bg_factor = None)
+
+class BgSubtractBatch(Operation):
+    """Background subtraction for a stack of 1-d spectra on a shared q grid.
+
+    Applies the same procedure as BgSubtract to every row of I_stack:
+    each background is scaled by the largest factor 
+    that keeps the subtracted intensity non-negative,
+    and the errors are propagated if both dI_stack and dI_bg are provided.
+    The scale factors, subtractions and errors 
+    are computed for all rows at once.
+
+    I_bg can be a single background, shared by all rows of I_stack,
+    or a stack of backgrounds. If bg_index is provided,
+    row i of I_stack is subtracted with background bg_index[i];
+    otherwise a stack of backgrounds must have one row per spectrum.
+    """
+
+    def __init__(self):
+        super(BgSubtractBatch, self).__init__(inputs, outputs)
+        self.input_doc['q'] = '1d array of q values, shared by all spectra'
+        self.input_doc['I_stack'] = 'n-by-m array of intensities, one spectrum per row'
+        self.input_doc['I_bg'] = '1d array of m background intensities, '\
+            'or k-by-m array of backgrounds'
+        self.input_doc['bg_index'] = 'optional array of n indices, '\
+            'selecting the background (row of I_bg) for each spectrum'
+        self.input_doc['dI_stack'] = 'n-by-m array, error estimate of I_stack (optional, default None)' 
+        self.input_doc['dI_bg'] = 'array, same shape as I_bg, error estimate of I_bg (optional, default None)'
+        self.output_doc['I_bgsub_stack'] = 'n-by-m array of background-subtracted intensities: I-(bg_factor*I_bg)'
+        self.output_doc['dI_stack'] = 'error estimate of background-subtracted intensities'
+        self.output_doc['bg_factor'] = 'array of n factors the backgrounds were multiplied by '\
+            'before subraction to ensure positive values for output intensity'
+
+    def run(self):
+        I = np.asarray(self.inputs['I_stack'],dtype=float)
+        I_bg = np.asarray(self.inputs['I_bg'],dtype=float)
+        dI = self.inputs['dI_stack']
+        dI_bg = self.inputs['dI_bg']
+        bg_idx = self.inputs['bg_index']
+        if bg_idx is not None:
+            I_bg = I_bg[np.asarray(bg_idx)]
+            if dI_bg is not None:
+                dI_bg = np.asarray(dI_bg,dtype=float)[np.asarray(bg_idx)]
+        I_bg = np.broadcast_to(I_bg,I.shape)
+        bad_data = (I < 0) | (I_bg <= 0) | np.isnan(I) | np.isnan(I_bg)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            ratios = np.where(bad_data,np.inf,I/I_bg)
+        bg_factor = np.min(ratios,axis=1)
+        bg_factor[np.isinf(bg_factor)] = np.nan
+        self.message_callback('subtracting background from {} spectra '\
+            '(bg multipliers: {} to {})'.format(I.shape[0],np.nanmin(bg_factor),np.nanmax(bg_factor)))
+        I_out = I-bg_factor[:,None]*I_bg
+        dI_out = None
+        if dI_bg is not None and dI is not None:
+            dI_bg = np.broadcast_to(np.asarray(dI_bg,dtype=float),I.shape)
+            dI_out = np.sqrt(np.asarray(dI,dtype=float)**2+(bg_factor[:,None]*dI_bg)**2)
+        self.outputs['I_bgsub_stack'] = I_out 
+        self.outputs['dI_stack'] = dI_out
+        self.outputs['bg_factor'] = bg_factor
+        return self.outputs
@@ -0,0 +1,162 @@
+import os
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+import fabio
+
+from ..Operation import Operation
+
+inputs = OrderedDict(
+    image=None,
+    dark=None,
+    flat=None,
+    mask=None,
+    fill_value=0.,
+    block_size=65536)
+outputs = OrderedDict(
+    image=None,
+    mask=None)
+
+# prepared correction frames, keyed by the contents or (path,mtime) of the inputs 
+_frames = OrderedDict()
+# id(array): (array, checksum key) for recently seen array inputs-
+# the array is kept, so that its id is not reused
+_array_keys = OrderedDict()
+
+class ImageCorrection(Operation):
+    """Applies dark, flat-field and mask corrections to an image or a stack of images.
+
+    Each pixel is corrected as (image-dark)/flat,
+    and masked pixels (where mask is True, or where flat is not positive)
+    are set to fill_value.
+    The corrections are computed in float32.
+    If image is a writeable, C-contiguous float32 array 
+    (e.g. a stack memory-mapped in r+ mode),
+    it is corrected in place (run_with() does not copy its keyword arguments,
+    so the caller's array is modified, whether or not zero_copy is set);
+    otherwise it is converted to a new float32 array.
+
+    The dark, flat and mask can be arrays or paths to image files.
+    They are prepared once (as float32 dark and inverse-flat frames,
+    with the mask folded into the inverse flat) and cached,
+    so correcting a series of images does not re-read them.
+    Array inputs are cached by a checksum of their contents,
+    which is computed the first time each array object is seen:
+    to change the corrections, pass a new array, rather than modifying one in place.
+    Each image is processed in blocks of block_size pixels,
+    so that the dark subtraction and flat multiplication 
+    run on cache-resident data, in one pass over the image memory.
+
+    The corrected image can be passed straight to a PyFAIIntegrator.
+    The mask output can be used for integration, e.g. as the mask of a SparseIntegrator.
+    """
+
+    def __init__(self):
+        super(ImageCorrection,self).__init__(inputs,outputs)
+        self.input_doc['image'] = '2d image array, or n_images-by-H-by-W array of images'
+        self.input_doc['dark'] = 'dark (background) image, or path to a dark image file (optional)'
+        self.input_doc['flat'] = 'flat-field image, or path to a flat-field image file (optional)'
+        self.input_doc['mask'] = 'boolean array, True for pixels to be masked, '\
+            'or path to a mask file (optional)'
+        self.input_doc['fill_value'] = 'value for masked pixels in the corrected image'
+        self.input_doc['block_size'] = 'number of pixels processed at a time'
+        self.output_doc['image'] = 'corrected float32 image or stack of images'
+        self.output_doc['mask'] = 'boolean array, True for masked pixels (or None if nothing is masked)'
+
+    def run(self):
+        img = self.inputs['image']
+        if isinstance(img,np.ndarray) and img.dtype == np.float32 \
+        and img.flags.writeable and img.flags.c_contiguous:
+            img_out = img
+        else:
+            # C order, so that the frames can be flattened without copying
+            img_out = np.array(img,dtype=np.float32,order='C')
+        frame_shape = img_out.shape[-2:]
+        dark, inv_flat, mask = correction_frames(frame_shape,
+            self.inputs['dark'],self.inputs['flat'],self.inputs['mask'])
+        n_px = frame_shape[0]*frame_shape[1]
+        img_flat = np.reshape(img_out,(-1,n_px))
+        bs = int(self.inputs['block_size'])
+        masked_px = None
+        if mask is not None:
+            masked_px = np.where(mask.ravel())[0]
+        for fr in img_flat:
+            for i0 in range(0,n_px,bs):
+                blk = fr[i0:i0+bs]
+                if dark is not None:
+                    np.subtract(blk,dark[i0:i0+bs],out=blk)
+                if inv_flat is not None:
+                    np.multiply(blk,inv_flat[i0:i0+bs],out=blk)
+            if masked_px is not None:
+                fr[masked_px] = self.inputs['fill_value']
+        self.outputs['image'] = img_out
+        self.outputs['mask'] = mask
+        return self.outputs
+
+def load_frame(frame):
+    """Load an image file (or return an array) as a numpy array."""
+    if isinstance(frame,str):
+        if os.path.splitext(frame)[1] == '.npy':
+            return np.load(frame)
+        return fabio.open(frame).data
+    return np.asarray(frame)
+
+def frame_key(frame):
+    if frame is None:
+        return None
+    if isinstance(frame,str):
+        return (frame,os.path.getmtime(frame))
+    if isinstance(frame,np.ndarray) and id(frame) in _array_keys:
+        return _array_keys[id(frame)][1]
+    arr = np.asarray(frame)
+    key = (arr.shape,arr.dtype.str,zlib.crc32(np.ascontiguousarray(arr).view(np.uint8)))
+    if isinstance(frame,np.ndarray):
+        if len(_array_keys) >= 12:
+            _array_keys.popitem(last=False)
+        _array_keys[id(frame)] = (frame,key)
+    return key
+
+def correction_frames(frame_shape,dark=None,flat=None,mask=None):
+    """Prepare flattened float32 dark and inverse-flat frames, and the mask.
+
+    Masked pixels (including pixels where flat is not positive) 
+    are zeroed in the dark and inverse-flat frames,
+    so that they are corrected to zero.
+    If no mask or flat is provided, inv_flat is None,
+    and if no mask is provided (and all of flat is positive), mask is None.
+    The results are cached by checksums of the inputs (or by their paths and mtimes).
+    """
+    key = (tuple(frame_shape),frame_key(dark),frame_key(flat),frame_key(mask))
+    if key in _frames:
+        return _frames[key]
+    n_px = frame_shape[0]*frame_shape[1]
+    dark_px = None
+    if dark is not None:
+        dark_px = np.array(load_frame(dark),dtype=np.float32).reshape(n_px)
+    mask_px = None
+    if mask is not None:
+        mask_px = np.array(load_frame(mask),dtype=bool).reshape(n_px)
+    inv_flat = None
+    if flat is not None:
+        flat_px = np.array(load_frame(flat),dtype=np.float32).reshape(n_px)
+        bad_flat = ~(flat_px > 0)
+        if np.any(bad_flat):
+            if mask_px is None:
+                mask_px = bad_flat
+            else:
+                mask_px = mask_px | bad_flat
+        flat_px[bad_flat] = 1.
+        inv_flat = np.divide(1.,flat_px,dtype=np.float32)
+    if mask_px is not None:
+        if inv_flat is None:
+            inv_flat = np.ones(n_px,dtype=np.float32)
+        inv_flat[mask_px] = 0.
+        if dark_px is not None:
+            dark_px[mask_px] = 0.
+        mask_px = mask_px.reshape(frame_shape)
+    # keep only the most recent few sets of frames
+    if len(_frames) >= 4:
+        _frames.popitem(last=False)
+    _frames[key] = (dark_px,inv_flat,mask_px)
+    return _frames[key]
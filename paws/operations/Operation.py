@@ -3,6 +3,8 @@ from collections import OrderedDict
 import copy
 from threading import Condition
 
+from .. import pawstools
+
 class Operation(object):
     """Class template for implementing paws operations"""
 
@@ -21,6 +23,10 @@ class Operation(object):
         self.stop_lock = Condition()
         self.stop_flag = False
 
+        # if zero_copy is set, run_with() avoids deep-copying its defaults 
+        # and its return value- see run_with() 
+        self.zero_copy = False
+
         # TODO: deprecate instance-level io docs
         self.input_doc = OrderedDict.fromkeys(self.inputs.keys())
         self.output_doc = OrderedDict.fromkeys(self.outputs.keys())
@@ -45,10 +51,19 @@ class Operation(object):
         then updates the inputs with the keyword arguments,
         then returns a copy of the return value of the Operation's run() function
         (often, the return value of run() will be the Operation outputs).
+
+        If self.zero_copy is True, only the containers (dicts and lists)
+        of the defaults and the return value are copied,
+        and any arrays in the return value are returned as read-only views.
         """
         for k in kwargs.keys():
             if not k in self.inputs:
                 raise ValueError('Input {} is not valid for Operation {}'.format(k,type(self).__name__))
+        if self.zero_copy:
+            self.inputs = pawstools.copy_containers(self.default_inputs)
+            self.outputs = pawstools.copy_containers(self.default_outputs)
+            self.inputs.update(kwargs)
+            return pawstools.readonly_view(self.run())
         self.inputs = copy.deepcopy(self.default_inputs)
         self.outputs = copy.deepcopy(self.default_outputs)
         self.inputs.update(kwargs)
@@ -12,35 +12,62 @@ inputs = OrderedDict(
 outputs = OrderedDict(smoothed_data=None)
 
 class MovingAverage(Operation):
-    """Applies moving average filter to 1d array."""
+    """Applies moving average filter to 1d array, or to each row of a 2d array.
+
+    Each output point is the weighted mean of the input points
+    within `window` points on either side of it.
+    The weights are the product of the window shape weights
+    (uniform for 'square', decreasing linearly to zero for 'triangle')
+    and the inverse variances (error**-2), if error is provided.
+    Near the edges, the window is truncated,
+    and the mean is normalized by the weights that remain.
+    Points where data is nan are left out of the averages.
+
+    The window sums are computed with cumulative sums,
+    so the cost does not depend on the window size:
+    a triangle window is applied as two passes of a square window.
+    """
 
     def __init__(self):
         super(MovingAverage, self).__init__(inputs, outputs)
-        self.input_doc['data'] = '1d array'
+        self.input_doc['data'] = '1d array, or 2d array with one pattern per row'
         self.input_doc['window'] = 'integer number of data points to average on either side'
-        self.input_doc['shape'] = 'window shape for weighting- triangular or square (default)'
-        self.input_doc['error'] = '1d array, same shape as data, optional (default None)'
-        self.output_doc['smoothed_data'] = 'smoothed 1d array'
+        self.input_doc['shape'] = 'window shape for weighting- triangle or square (default)'
+        self.input_doc['error'] = 'array, same shape as data, optional (default None)'
+        self.output_doc['smoothed_data'] = 'smoothed array, same shape as data'
 
     def run(self):
-        x = self.inputs['data']
-        w = self.inputs['window']
+        x = np.array(self.inputs['data'],dtype=float)
+        w = int(self.inputs['window'])
         err = self.inputs['error']
-        nx = len(x)
-        if self.inputs['shape'] == 'triangle': 
-            shape_weights = (w+1-np.arange(w+1, dtype=float))/float(w+1)
-        else:
-            shape_weights = np.ones(w+1, dtype=float)
-        shape_weights = np.concatenate( (shape_weights[::-1],shape_weights[1:]))
         if err is not None:
-            err_weights = err**-2
+            wts = np.asarray(err,dtype=float)**-2
         else:
-            err_weights = np.ones(x.shape, dtype=float)
-        x_out = np.array([np.sum( 
-                            np.array(x[max(0,i-w):min(i+w,nx)],dtype=float) 
-                             * np.array(err_weights[max(0,i-w):min(i+w,nx)]) 
-                             * np.array(shape_weights[max(0,w-i):min(2*(nx-i)+1,2*w+1)]) )/
-                            float(min(i+w,nx-1)-max(0,i-w)) 
-                            for i in range(nx) ])
+            wts = np.ones(x.shape,dtype=float)
+        bad = np.isnan(x)
+        wts = np.where(bad,0.,wts)
+        x[bad] = 0.
+        # pad with w zero-weight points on either end
+        pad = [(0,0)]*(x.ndim-1)+[(w,w)]
+        wx = np.pad(wts*x,pad,mode='constant')
+        wts = np.pad(wts,pad,mode='constant')
+        if self.inputs['shape'] == 'triangle': 
+            num = window_sum(window_sum(wx,w+1),w+1)
+            den = window_sum(window_sum(wts,w+1),w+1)
+        else:
+            num = window_sum(wx,2*w+1)
+            den = window_sum(wts,2*w+1)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            x_out = np.where(den > 0,num/den,np.nan)
         self.outputs['smoothed_data'] = x_out
+        return self.outputs
+
+def window_sum(y,width):
+    """Sum every length-`width` window along the last axis of y.
 
+    Element i of the result is y[...,i:i+width].sum(axis=-1).
+    """
+    cs = np.cumsum(y,axis=-1)
+    zero = np.zeros(y.shape[:-1]+(1,),dtype=cs.dtype)
+    cs = np.concatenate([zero,cs],axis=-1)
+    return cs[...,width:]-cs[...,:-width]
@@ -3,6 +3,7 @@ from collections import OrderedDict
 import numpy as np
 
 from ..Operation import Operation
+from ...pawstools import sliding_windows
 
 inputs = OrderedDict(
     x=None,
@@ -12,69 +13,154 @@ inputs = OrderedDict(
     base=None)
 outputs = OrderedDict(smoothed_data=None)
 
+# convolution coefficients for uniformly spaced x, keyed by (order,base)
+_uniform_coefs = {}
+
 class SavitzkyGolay(Operation):
-    """Applies a Savitzky-Golay polynomial smoothing filter to a 1d array."""
+    """Applies a Savitzky-Golay polynomial smoothing filter to a 1d array.
+
+    Each point of y is replaced by the value at x 
+    of a polynomial of the given order,
+    fit by least squares to the points in a window around x.
+    The number of points in the window is set by the order and the base:
+    o+1 or o+2 points (whichever is odd) for base -1,
+    2*o+1 points for base 0, or 2*(o+b)+1 points for base b > 0.
+    Near the edges, base -1 windows are shifted to stay inside the array,
+    while the other windows are truncated.
+    If y has fewer than order+1 points, it is returned unchanged.
+
+    If x is uniformly spaced and dy is not provided,
+    the fit reduces to a convolution with fixed coefficients,
+    which are computed once for each (order,base) and cached.
+    Otherwise, the least-squares problems for all windows
+    are stacked and solved together,
+    with points weighted by dy**-2 if dy is provided.
+
+    y (and dy) may also be 2d arrays, with one pattern per row,
+    all sampled at the same x.
+    """
 
     def __init__(self):
         super(SavitzkyGolay, self).__init__(inputs, outputs)
         self.input_doc['x'] = '1d array- independent variable'
-        self.input_doc['y'] = '1d array- dependent variable, same shape as x'
-        self.input_doc['dy'] = '1d array, error estimate in y, same shape as y (default None)'
+        self.input_doc['y'] = '1d array- dependent variable, same shape as x, '\
+            'or 2d array with one pattern per row'
+        self.input_doc['dy'] = 'error estimate in y, same shape as y (default None)'
         self.input_doc['order'] = 'integer order of polynomial approximation (zero to five)'
         self.input_doc['base'] = '-1, 0, or positive integer'
-        self.output_doc['smoothed_data'] = 'smoothed 1d array for y'
+        self.output_doc['smoothed_data'] = 'smoothed array for y, same shape as y'
 
     def run(self):
-        # TODO: this needs to be reviewed for correctness,
-        # and thoroughly commented to explain what it does
-        x = self.inputs['x']
-        y = self.inputs['y']
-        o = self.inputs['order']
-        b = self.inputs['base']
-        err = self.inputs['dy']
+        x = np.asarray(self.inputs['x'],dtype=float)
+        y = np.asarray(self.inputs['y'],dtype=float)
+        o = int(self.inputs['order'])
+        b = int(self.inputs['base'])
+        dy = self.inputs['dy']
+        npts = window_size(o,b)
+        shift_edges = (b == -1)
         nx = x.size
-        if err is None:
-            err = np.ones(y.shape,dtype=float)        
+        if nx < max(o+1,2):
+            # too few points to smooth: a polynomial of the given order
+            # would pass through all of them, leaving y unchanged
+            self.outputs['smoothed_data'] = y
+            return self.outputs
+        dx = np.diff(x)
+        uniform = nx >= npts and np.allclose(dx,dx[0],rtol=1.E-6,atol=0.)
+        if dy is None and uniform:
+            if not (o,b) in _uniform_coefs:
+                idx, valid = window_index(npts,npts,shift_edges)
+                wts = np.array(valid,dtype=float)
+                coefs = fit_coefficients(np.arange(npts,dtype=float),idx,wts,o)
+                _uniform_coefs[(o,b)] = (idx,coefs)
+            idx, coefs = _uniform_coefs[(o,b)]
+            y_out = apply_uniform_coefficients(y,idx,coefs)
+        else:
+            idx, valid = window_index(nx,npts,shift_edges)
+            wts = np.array(valid,dtype=float)
+            if dy is not None:
+                wts = wts * np.asarray(dy,dtype=float)[...,idx]**-2
+            coefs = fit_coefficients(x,idx,wts,o)
+            y_out = np.sum(coefs*y[...,idx],axis=-1)
+        self.outputs['smoothed_data'] = y_out
+        return self.outputs
+
+def window_size(order,base):
+    """Number of points in a Savitzky-Golay window."""
+    if base == -1:
         # "Minimal" point base case. 
-        if b == -1:
-            o_odd_flag = ((o/2)*2 != o)
-            npts = o+1+int(o_odd_flag)
+        return order+1+int(order % 2 == 1)
+    elif base == 0:
         # "Balanced" point base case.
-        elif b == 0:
-            npts = 2*o+1
+        return 2*order+1
+    else:
         # "Additional" point base case.
-        elif b > 0:
-            npts = 2*(o+b)+1
-        y_out = np.zeros(nx, dtype=float)
-        for i in range(nx):
-            # choose start and end indices
-            npts_half = int(npts)/2 + 1
-            start = max([i-npts_half+1,0])
-            end = min([i+npts_half-1,nx-1])
-            if b == -1:
-                if (i-npts_half+1 < 0):
-                    start = 0
-                    end = npts 
-                elif (i+npts_half-1 > nx-1):
-                    start = size-1-m
-                    end = size-1
-            # Formulate the equation to be solved for polynomial coefficients
-            xvals = x[start:end]
-            yvals = y[start:end]
-            errvals = err[start:end]
-            nxvals = xvals.size
-            idxs = np.arange(o+1)
-            # reshape vectors for matrix mult
-            y_vec = np.reshape(yvals,(nxvals,1,1))
-            x_vec = np.reshape(xvals,(nxvals,1,1))
-            err_vec = np.reshape(errvals,(nxvals,1,1))
-            idx_column = np.reshape(idxs,(nxvals,1)) 
-            idx_row = np.reshape(idxs,(1,nxvals)) 
-            idx_block = idx_row + idx_column
-            v = (y_vec * x_vec ** idx_column * err_vec).sum(axis=0)
-            m = (x_vec ** idx_block * err_vec).sum(axis=0)
-            # CALL LINALG.SOLVE...
-            coefs = (np.linalg.solve(m, v)).flatten()
-            y_out[i] = np.sum(x[i]**np.arange(o+1)*coefs)
-        self.outputs['smoothed_data'] = y_out
+        return 2*(order+base)+1
+
+def window_index(nx,npts,shift_edges):
+    """Indices of the npts-point window around each of nx points.
+
+    Returns
+    -------
+    idx : array of int
+        nx-by-npts array of window indices, clipped to [0,nx-1]
+    valid : array of bool
+        nx-by-npts array, False for window points that fall outside the array 
+        (these only occur if shift_edges is False)
+    """
+    h = npts//2
+    start = np.arange(nx)-h
+    if shift_edges:
+        start = np.clip(start,0,max(nx-npts,0))
+    idx = start[:,None]+np.arange(npts)
+    valid = (idx >= 0) & (idx < nx)
+    return np.clip(idx,0,nx-1), valid
+
+def fit_coefficients(x,idx,wts,order):
+    """Compute the least-squares polynomial smoothing coefficients for each window.
+
+    The smoothed value at x[i] is np.sum(coefs[...,i,:]*y[...,idx[i]]).
+    The normal equations for all windows are stacked and solved at once.
+
+    Parameters
+    ----------
+    x : array
+        1d array of nx x values
+    idx : array of int
+        nx-by-npts array of window indices
+    wts : array
+        nx-by-npts array of least-squares weights, 
+        or an array with additional leading dimensions (one per pattern)
+    order : int
+        order of the polynomial
+
+    Returns
+    -------
+    coefs : array
+        array of coefficients, same shape as wts
+    """
+    # center and scale each window on its own x value, for conditioning
+    xw = x[idx]-x[:,None]
+    xscl = np.max(np.abs(xw),axis=1)
+    xscl[xscl == 0] = 1.
+    xw = xw/xscl[:,None]
+    # vandermonde matrix for each window: nx-by-npts-by-(order+1)
+    A = xw[:,:,None]**np.arange(order+1)
+    AtW = np.swapaxes(A,-1,-2)*wts[...,None,:]
+    M = np.matmul(AtW,A)
+    # row 0 of the solution gives the fit value at the window center
+    return np.linalg.solve(M,AtW)[...,0,:]
+
+def apply_uniform_coefficients(y,idx,coefs):
+    """Apply the coefficients computed for an npts-point uniform grid to y.
 
+    The interior of y is convolved with the coefficients of the central window,
+    and the points within npts/2 of either edge get their own coefficients.
+    """
+    npts = idx.shape[0]
+    h = npts//2
+    nx = y.shape[-1]
+    y_out = np.empty(y.shape,dtype=float)
+    y_out[...,h:nx-h] = np.tensordot(coefs[h],sliding_windows(y,npts),axes=(0,0))
+    y_out[...,:h] = np.sum(coefs[:h]*y[...,idx[:h]],axis=-1)
+    y_out[...,nx-h:] = np.sum(coefs[h+1:]*y[...,idx[h+1:]+(nx-npts)],axis=-1)
+    return y_out
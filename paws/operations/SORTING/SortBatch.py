@@ -72,7 +72,10 @@ class SortBatch(Operation):
 
         s_out = self.outputs['sorted_outputs']
         for y_key in b_out.keys():
-            y_list = copy.deepcopy(b_out[y_key])
+            if self.zero_copy:
+                y_list = list(b_out[y_key])
+            else:
+                y_list = copy.deepcopy(b_out[y_key])
             if shiftflag or sortflag or uidx is not None or lidx is not None:
                 # only sort y_list if it contains a full batch of outputs
                 #if len(y_list) == n_batch_outputs:
@@ -1,8 +1,11 @@
 from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+import multiprocessing
 import os
 import datetime
 import time
 
+import numpy as np
 import tzlocal
 
 from ..Operation import Operation
@@ -34,36 +37,136 @@ class ReadSpecHeader(Operation):
         file_noext = os.path.splitext(filename)[0]
         self.outputs['filename'] = file_noext 
         self.outputs['dir_path'] = dir_path 
-        d = OrderedDict()
         self.message_callback('reading {}'.format(p))
-        for l in open(p,'r').readlines():
-           if not l.strip() == '' and not l.strip()[0] == '#':
-                kvs = l.split(',')
-                # special case for the string headers on line 1
-                if not kvs[0].find('User') == -1:
-                    u_str = kvs[0].split('User:')[1].strip()
-                    t_str = kvs[1].split('time:')[1].strip()
-                    d['User'] = u_str
-                    d['date_time'] = t_str
-                    tz = tzlocal.get_localzone()
-                    # use strptime to create a naive datetime
-                    dt = datetime.datetime.strptime(t_str.strip(),"%a %b %d %H:%M:%S %Y")
-                    # add timezone information to datetime
-                    dt_aware = datetime.datetime(dt.year,dt.month,dt.day,dt.hour,dt.minute,dt.second,dt.microsecond,tz)
-                    # interpret the time in UTC 
-                    t = time.mktime(dt_aware.timetuple())
-                    d['time'] = float(t)
-                # and filter out the redundant temperature line
-                elif not (len(kvs)==1 and kvs[0].strip()[-1]=='C'):
-                    for kv in kvs:
-                        kv_arr = kv.split('=')
-                        d[kv_arr[0].strip()] = float(kv_arr[1].strip())
-        # add 'temperature' to the output data,
-        # to make a consistent interface with the non-legacy header reader
-        if self.inputs['temperature_key'] in d:
-            d['temperature'] = d[self.inputs['temperature_key']]
-        else:
-            d['temperature'] = None
-        self.outputs['data'] = d
+        self.outputs['data'] = read_spec_file(p,self.inputs['temperature_key'])
         return self.outputs
 
+# month abbreviations of SPEC date strings (as %b in the C locale)
+months = dict((m,i+1) for i,m in enumerate(
+    ['Jan','Feb','Mar','Apr','May','Jun','Jul','Aug','Sep','Oct','Nov','Dec']))
+
+# the local timezone is resolved once per process
+_local_tz = None
+
+def local_tz():
+    global _local_tz
+    if _local_tz is None:
+        _local_tz = tzlocal.get_localzone()
+    return _local_tz
+
+def spec_time(t_str,tz=None):
+    """Convert a SPEC date string (e.g. 'Sat Dec 25 00:22:01 1667') to a unix time.
+
+    The date is interpreted in timezone tz (default: the local timezone).
+    This is equivalent to strptime(t_str,"%a %b %d %H:%M:%S %Y"), 
+    without the (slow) format parsing.
+    """
+    if tz is None:
+        tz = local_tz()
+    wkday, mon, day, hms, yr = t_str.split()
+    h, m, s = hms.split(':')
+    dt = datetime.datetime(int(yr),months[mon],int(day),int(h),int(m),int(s),0,tz)
+    return float(time.mktime(dt.timetuple()))
+
+def parse_spec_header(lines,temperature_key='TEMP',tz=None):
+    """Parse the lines of a SPEC .txt header into a dict.
+
+    See ReadSpecHeader. tz is the timezone of the date line 
+    (default: the local timezone).
+    """
+    d = OrderedDict()
+    for l in lines:
+        l = l.strip()
+        if not l or l[0] == '#':
+            continue
+        kvs = l.split(',')
+        # special case for the string headers on line 1
+        if 'User' in kvs[0]:
+            t_str = kvs[1].split('time:')[1].strip()
+            d['User'] = kvs[0].split('User:')[1].strip()
+            d['date_time'] = t_str
+            d['time'] = spec_time(t_str,tz)
+        # and filter out the redundant temperature line
+        elif not (len(kvs)==1 and l[-1]=='C'):
+            for kv in kvs:
+                k, v = kv.split('=')
+                d[k.strip()] = float(v)
+    # add 'temperature' to the output data,
+    # to make a consistent interface with the non-legacy header reader
+    d['temperature'] = d.get(temperature_key)
+    return d
+
+def read_spec_file(file_path,temperature_key='TEMP',tz=None):
+    """Read a SPEC .txt header file into a dict (see parse_spec_header())."""
+    with open(file_path,'r') as f:
+        return parse_spec_header(f.readlines(),temperature_key,tz)
+
+def _read_spec_task(task):
+    return read_spec_file(*task)
+
+def read_spec_headers(file_paths,temperature_key='TEMP',n_workers=1,use_processes=False,chunk_size=64):
+    """Read many SPEC .txt header files into a table of header fields.
+
+    The files are parsed by a pool of n_workers threads 
+    (or processes, if use_processes is True), 
+    and the local timezone is resolved once (once per process).
+
+    Parameters
+    ----------
+    file_paths : list of str
+        paths to the header files
+    temperature_key : str
+        header key that is copied to the 'temperature' column
+    n_workers : int
+        number of threads or processes (1: parse in the calling thread)
+    use_processes : bool
+        if True, use a process pool (for parsing large numbers of files 
+        on multiple cores), else a thread pool
+    chunk_size : int
+        number of files per pool task
+
+    Returns
+    -------
+    table : OrderedDict
+        'file_path' maps to an array of the file paths,
+        and each header key maps to an array with one value per file,
+        in the order of file_paths. 
+        Numerical fields are float arrays (nan where a file lacks the key),
+        other fields are object arrays (None where a file lacks the key).
+    """
+    file_paths = list(file_paths)
+    if n_workers > 1 and len(file_paths) > chunk_size:
+        if use_processes:
+            tasks = [(p,temperature_key) for p in file_paths]
+            pool = multiprocessing.Pool(n_workers)
+        else:
+            tz = local_tz()
+            tasks = [(p,temperature_key,tz) for p in file_paths]
+            pool = ThreadPool(n_workers)
+        try:
+            hdrs = pool.map(_read_spec_task,tasks,chunk_size)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        tz = local_tz()
+        hdrs = [read_spec_file(p,temperature_key,tz) for p in file_paths]
+    return header_table(hdrs,file_paths)
+
+def header_table(hdrs,file_paths=None):
+    """Convert a list of header dicts to a table of columns (see read_spec_headers())."""
+    table = OrderedDict()
+    if file_paths is not None:
+        table['file_path'] = np.array(file_paths,dtype=object)
+    keys = OrderedDict()
+    for hdr in hdrs:
+        for k in hdr.keys():
+            keys[k] = None
+    for k in keys:
+        vals = [hdr.get(k) for hdr in hdrs]
+        if all(v is None or isinstance(v,float) for v in vals):
+            table[k] = np.array([np.nan if v is None else v for v in vals],dtype=float)
+        else:
+            table[k] = np.empty(len(vals),dtype=object)
+            table[k][:] = vals
+    return table
@@ -3,6 +3,7 @@ from collections import OrderedDict
 import numpy as np
 
 from ..Operation import Operation
+from ...pawstools import sliding_windows
 
 inputs = OrderedDict(
     q_I=None,
@@ -29,10 +30,14 @@ class EasyZingers1d(Operation):
     Let pixel_i be a candidate zinger. The analysis is as follows:
     1. Take window_width pixels on either side of pixel_i.
         Call these pixels_left and pixels_right.
+        Pixels that were already flagged as zingers are left out.
 
-    2. (TODO: finish this)
+    2. Subtract from pixels_left and pixels_right 
+        the line (in q) through the end points of each window.
         
-    3. (TODO: finish this) 
+    3. Divide the jump from the nearest neighbor to pixel_i 
+        by the standard deviation of the detrended window,
+        for both pixels_left and pixels_right.
         
     4. If either of the results in step (3) is greater than sharpness_limit,
         flag pixel_i as a zinger.
@@ -68,52 +73,166 @@ class EasyZingers1d(Operation):
         w = self.inputs['window_width'] 
         q = q_I[:,0]
         I = q_I[:,1]
-        I_dz = np.array(I)
-        zmask = np.array(np.zeros(len(q)),dtype=bool)
-        idx_z = []
-        I_z = []
-        stop_idx = len(q)-w-1
-        test_range = iter(range(w,stop_idx))
-        idx = next(test_range)
-        while idx < stop_idx-1:
-            idx_l = np.array([i for i in np.arange(idx-w,idx+1,1) if not i in idx_z])
-            idx_r = np.array([i for i in np.arange(idx,idx+w+1,1) if not i in idx_z])
-            Ii_l = np.array(I[idx_l])
-            Ii_r = np.array(I[idx_r])
-            # subtract a linear background from either side
-            #Ii_l = Ii_l - np.polyval(np.polyfit(idx_l[:-1],Ii_l[:-1],1),idx_l)
-            #Ii_r = Ii_r - np.polyval(np.polyfit(idx_r[1:],Ii_r[1:],1),idx_r)
-            # Subtract an approximate linear background from either side
-            q_ratio_l = (q[idx_l[-1]] - q[idx_l[:-1]]) / (q[idx_l[-1]]-q[idx_l[0]])  
-            q_ratio_r = (q[idx_r[1:]] - q[idx_r[0]])   / (q[idx_r[-1]]-q[idx_r[0]])  
-            Ii_l[:-1] = Ii_l[:-1] - q_ratio_l * (Ii_l[0]-Ii_l[-2]) 
-            Ii_r[1:] = Ii_r[1:] - q_ratio_r * (Ii_r[-1]-Ii_r[1]) 
-            Istd_l = np.std(Ii_l[:-1]) 
-            Istd_r = np.std(Ii_r[1:]) 
-            
-            #I_ratio_l = Ii_l[-1]/Istd_l
-            #I_ratio_r = Ii_r[0]/Istd_r
-            #I_ratio_l = (Ii_l[-1]-Ii_l[-2])/Imean_diff_l
-            #I_ratio_r = (Ii_r[0]-Ii_r[1])/Imean_diff_r
-            if Istd_l and Istd_r:
-                I_ratio_l = (Ii_l[-1]-Ii_l[-2])/Istd_l
-                I_ratio_r = (Ii_r[0]-Ii_r[1])/Istd_r
-                if I_ratio_l > I_ratio_limit or I_ratio_r > I_ratio_limit:
-                    self.message_callback('found a zinger: q = {}, I = {}'.format(q[idx],I[idx]))
-                    idx_z.append(idx)
-                    zmask[idx] = True
-                    I_dz[idx] = np.nan
-            idx = next(test_range) 
-        q_z = [q[i] for i in idx_z]
-        I_z = [I[i] for i in idx_z]
-        newIvals = np.zeros(len(q_z)) 
-        for qi,zi in zip(idx_z,range(len(idx_z))):
-            Idzi = I_dz[qi-w:qi+w+1]
-            Idzi = Idzi[~np.isnan(Idzi)]
-            newIvals[zi] = np.mean(Idzi)
-        for i,iq in zip(range(len(idx_z)),idx_z):
-            I_dz[iq] = newIvals[i]
+        zmask = zinger_mask(q,I,I_ratio_limit,w)
+        idx_z = np.where(zmask)[0]
+        for iz in idx_z:
+            self.message_callback('found a zinger: q = {}, I = {}'.format(q[iz],I[iz]))
+        I_dz = replace_zingers(I,zmask,w)
         self.outputs['q_I_dz'] = np.array([q,I_dz]).T
         self.outputs['zmask'] = zmask
         return self.outputs
 
+def sharpness_ratios(q,I,w):
+    """Compute left and right sharpness ratios for every testable pixel.
+
+    Pixel i is tested against the w pixels to its left (I[i-w:i])
+    and the w pixels to its right (I[i+1:i+w+1]).
+    Each side is detrended by the line through its end points
+    (as a function of q), and the jump from the neighboring point to pixel i
+    is divided by the standard deviation of the detrended side.
+    All windows are evaluated at once on strided views of q and I.
+
+    Pixels w through n-w-3 are tested.
+    All outputs have the shape of I[...,w:n-w-2].
+
+    Returns
+    -------
+    ratio_l : array of float
+        sharpness ratio of each tested pixel, relative to its left window
+    ratio_r : array of float
+        sharpness ratio of each tested pixel, relative to its right window
+    valid_l : array of bool
+        False where the detrended left window has zero standard deviation
+    valid_r : array of bool
+        False where the detrended right window has zero standard deviation
+    """
+    I = np.asarray(I,dtype=float)
+    q = np.broadcast_to(np.asarray(q,dtype=float),I.shape)
+    m = max(I.shape[-1]-2*w-2,0)
+    q_win = sliding_windows(q,w+1)
+    I_win = sliding_windows(I,w+1)
+    q_l = q_win[...,:m]
+    I_l = I_win[...,:m]
+    q_r = q_win[...,w:w+m]
+    I_r = I_win[...,w:w+m]
+    with np.errstate(divide='ignore',invalid='ignore'):
+        # linear background, as a fraction of the q-span of each window
+        q_ratio_l = q_l[-1:]-q_l[:-1]
+        q_ratio_l /= q_ratio_l[:1]
+        q_ratio_r = q_r[1:]-q_r[:1]
+        q_ratio_r /= q_ratio_r[-1:]
+        # detrended windows: the temporaries are reused in place
+        I_l_dt = q_ratio_l
+        I_l_dt *= I_l[:1]-I_l[-2:-1]
+        np.subtract(I_l[:-1],I_l_dt,out=I_l_dt)
+        I_r_dt = q_ratio_r
+        I_r_dt *= I_r[-1:]-I_r[1:2]
+        np.subtract(I_r[1:],I_r_dt,out=I_r_dt)
+        ratio_l = I_l[-1]-I_l_dt[-1]
+        ratio_r = I_r[0]-I_r_dt[0]
+        Istd_l = _std(I_l_dt)
+        Istd_r = _std(I_r_dt)
+        ratio_l /= Istd_l
+        ratio_r /= Istd_r
+    return ratio_l, ratio_r, (Istd_l != 0), (Istd_r != 0)
+
+def _std(x):
+    # standard deviation along axis 0, overwriting x
+    x -= np.mean(x,axis=0)
+    x *= x
+    return np.sqrt(np.mean(x,axis=0))
+
+def _masked_ratio_l(q_l,I_l,keep):
+    # Left sharpness ratios for windows q_l, I_l (shape (w+1,k)),
+    # counting only the left points where keep (shape (w,k)) is True.
+    k = I_l.shape[1]
+    cols = np.arange(k)
+    w = keep.shape[0]
+    # first and last kept points of each window
+    i_first = np.argmax(keep,axis=0)
+    i_last = w-1-np.argmax(keep[::-1],axis=0)
+    n_keep = keep.sum(axis=0)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        q_ratio_l = (q_l[-1:]-q_l[:-1]) / (q_l[-1]-q_l[i_first,cols])
+        I_l_dt = I_l[:-1] - q_ratio_l * (I_l[i_first,cols]-I_l[i_last,cols])
+        I_mean = np.where(keep,I_l_dt,0.).sum(axis=0)/n_keep
+        Istd_l = np.sqrt(np.where(keep,(I_l_dt-I_mean)**2,0.).sum(axis=0)/n_keep)
+        ratio_l = (I_l[-1]-I_l_dt[i_last,cols])/Istd_l
+    valid = (n_keep > 0) & (Istd_l != 0)
+    return ratio_l, valid
+
+def zinger_mask(q,I,I_ratio_limit,w):
+    """Flag the zingers in I (along its last axis), sampled at q.
+
+    Flagged zingers are excluded from the left windows 
+    of the pixels to their right.
+    The sharpness ratios of all pixels are first computed at once
+    by sharpness_ratios(), without any exclusions.
+    Since zingers are rare, only the pixels that have a flagged zinger 
+    within w points to their left are then re-evaluated,
+    with the zingers excluded from their windows.
+    This is repeated until the flags stop changing:
+    each pixel only depends on the flags of pixels to its left,
+    so this converges to the same flags as testing 
+    the pixels one at a time from left to right.
+
+    Returns
+    -------
+    zmask : array of bool
+        same shape as I, True where a zinger was found
+    """
+    I = np.asarray(I,dtype=float)
+    q = np.broadcast_to(np.asarray(q,dtype=float),I.shape)
+    n = I.shape[-1]
+    zmask = np.zeros(I.shape,dtype=bool)
+    ratio_l, ratio_r, valid_l, valid_r = sharpness_ratios(q,I,w)
+    base_flags = valid_l & valid_r & ((ratio_l > I_ratio_limit) | (ratio_r > I_ratio_limit))
+    m = base_flags.shape[-1]
+    if not base_flags.any():
+        return zmask
+    q_l = sliding_windows(q,w+1)[...,:m]
+    I_l = sliding_windows(I,w+1)[...,:m]
+    flags = base_flags
+    while True:
+        zmask[...,w:w+m] = flags
+        # number of zingers among the w points left of each tested pixel
+        zcount = np.cumsum(zmask,axis=-1)
+        zcount = zcount[...,w-1:w-1+m]-np.concatenate(
+            [np.zeros(I.shape[:-1]+(1,),dtype=zcount.dtype),zcount[...,:m-1]],axis=-1)
+        affected = np.nonzero(zcount > 0)
+        new_flags = np.array(base_flags)
+        if len(affected[0]) > 0:
+            keep = ~sliding_windows(zmask,w)[(slice(None),)+affected]
+            aff_ratio_l, aff_valid = _masked_ratio_l(
+                q_l[(slice(None),)+affected],I_l[(slice(None),)+affected],keep)
+            aff_valid = aff_valid & valid_r[affected]
+            new_flags[affected] = aff_valid & (
+                (aff_ratio_l > I_ratio_limit) | (ratio_r[affected] > I_ratio_limit))
+        if np.array_equal(new_flags,flags):
+            break
+        flags = new_flags
+    return zmask
+
+def replace_zingers(I,zmask,w):
+    """Replace zingers by the mean of the non-zinger points in their windows.
+
+    The window for the zinger at pixel i is I[...,i-w:i+w+1].
+    Windows are truncated at the edges of the array.
+
+    Returns
+    -------
+    I_dz : array of float
+        copy of I, with zingers replaced
+    """
+    I_dz = np.array(I,dtype=float)
+    if not zmask.any():
+        return I_dz
+    I_dz[zmask] = np.nan
+    # pad with nans, so that every zinger has a full window
+    pad = np.full(I_dz.shape[:-1]+(w,),np.nan)
+    I_pad = np.concatenate([pad,I_dz,pad],axis=-1)
+    I_win = sliding_windows(I_pad,2*w+1)[(slice(None),)+np.nonzero(zmask)]
+    good = ~np.isnan(I_win)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        I_dz[zmask] = np.where(good,I_win,0.).sum(axis=0) / good.sum(axis=0)
+    return I_dz
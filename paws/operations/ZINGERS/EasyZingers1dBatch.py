@@ -0,0 +1,62 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from ..Operation import Operation
+from .EasyZingers1d import zinger_mask, replace_zingers
+
+inputs = OrderedDict(
+    q=None,
+    I_stack=None,
+    sharpness_limit=40,
+    window_width=10,
+    chunk_size=100
+    )
+outputs = OrderedDict(
+    I_dz_stack=None,
+    zmask_stack=None
+    )
+
+class EasyZingers1dBatch(Operation):
+    """Operation for removing zingers from a stack of 1d spectra.
+
+    All spectra must be sampled on the same q grid.
+    Zingers are flagged and replaced as in EasyZingers1d,
+    with each row of the stack treated as an independent spectrum,
+    but all rows are processed together in vectorized passes.
+    The rows are processed in chunks of chunk_size,
+    to bound the size of the temporary arrays.
+    """
+
+    def __init__(self):
+        super(EasyZingers1dBatch, self).__init__(inputs, outputs)
+        self.input_doc['q'] = '1d array of q values, shared by all spectra'
+        self.input_doc['I_stack'] = 'n_patterns-by-n_q array of intensities'
+        self.input_doc['sharpness_limit'] = 'sharpness limit '\
+            'for flagging zingers- see EasyZingers1d'
+        self.input_doc['window_width'] = 'number of points '\
+            'on either side of a given pixel '\
+            'used to evaluate sharpness of the pixel'
+        self.input_doc['chunk_size'] = 'maximum number of spectra to process in one pass'
+        self.output_doc['I_dz_stack'] = 'same as input I_stack but with zingers removed'
+        self.output_doc['zmask_stack'] = 'array of booleans, same shape as I_stack, '\
+            'true where there is a zinger, else false'
+
+    def run(self):
+        q = np.asarray(self.inputs['q'],dtype=float)
+        I_stack = np.asarray(self.inputs['I_stack'],dtype=float)
+        I_ratio_limit = self.inputs['sharpness_limit']
+        w = self.inputs['window_width']
+        chunk = max(int(self.inputs['chunk_size']),1)
+        I_dz = np.empty(I_stack.shape,dtype=float)
+        zmask = np.zeros(I_stack.shape,dtype=bool)
+        for i0 in range(0,I_stack.shape[0],chunk):
+            I_chunk = I_stack[i0:i0+chunk]
+            zmask[i0:i0+chunk] = zinger_mask(q,I_chunk,I_ratio_limit,w)
+            I_dz[i0:i0+chunk] = replace_zingers(I_chunk,zmask[i0:i0+chunk],w)
+        n_z = np.sum(zmask,axis=1)
+        self.message_callback('found {} zingers in {} of {} spectra'.format(
+            int(np.sum(n_z)),int(np.sum(n_z > 0)),I_stack.shape[0]))
+        self.outputs['I_dz_stack'] = I_dz
+        self.outputs['zmask_stack'] = zmask
+        return self.outputs
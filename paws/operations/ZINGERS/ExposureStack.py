@@ -0,0 +1,149 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from ..Operation import Operation
+from ...imagetools import ImageHandle
+
+inputs = OrderedDict(
+    images=None,
+    method='sigma_clip',
+    sigma_limit=3.,
+    n_iterations=3,
+    noise_model='poisson',
+    gain=1.,
+    block_rows=64
+    )
+outputs = OrderedDict(
+    image=None,
+    count=None
+    )
+
+class ExposureStack(Operation):
+    """Operation for combining repeated exposures into one image, rejecting zingers.
+
+    The exposures are combined pixel by pixel,
+    either by the median ('median' method),
+    or by a sigma-clipped mean ('sigma_clip' method):
+    starting from the median, values further than sigma_limit standard deviations 
+    from the mean of the retained values are rejected,
+    for up to n_iterations passes (or until no more values are rejected).
+
+    With only a few exposures, the sample standard deviation 
+    is too noisy (and too inflated by the zingers themselves) to clip by,
+    so by default ('poisson' noise_model) the standard deviation 
+    is estimated from counting statistics, as sqrt(gain*I).
+    The 'sample' noise_model uses the spread of the exposures,
+    and is appropriate for larger numbers of exposures.
+    The count output records how many exposures contributed to each pixel.
+
+    The images are processed in blocks of block_rows rows,
+    so that the floating point temporaries stay small.
+    Image file paths are opened as ImageHandles, and read as the blocks need them:
+    uncompressed TIFF and .npy files are memory-mapped, so each block reads only its rows,
+    and other files are decoded on first access, and kept within 
+    the image memory budget (see imagetools.set_memory_budget()) until the stack is combined.
+    An n_exposures-by-H-by-W memory-mapped array also bounds the memory used by the inputs.
+    """
+
+    def __init__(self):
+        super(ExposureStack, self).__init__(inputs, outputs)
+        self.input_doc['images'] = 'n_exposures-by-H-by-W array, '\
+            'or list of 2d image arrays or image file paths'
+        self.input_doc['method'] = 'either "median" or "sigma_clip"'
+        self.input_doc['sigma_limit'] = 'number of standard deviations '\
+            'beyond which a value is rejected (sigma_clip method only)'
+        self.input_doc['n_iterations'] = 'maximum number of rejection passes (sigma_clip method only)'
+        self.input_doc['noise_model'] = 'either "poisson" or "sample" (sigma_clip method only)'
+        self.input_doc['gain'] = 'detector counts per photon ("poisson" noise_model only)'
+        self.input_doc['block_rows'] = 'number of image rows to process at once'
+        self.output_doc['image'] = 'combined image'
+        self.output_doc['count'] = 'array of integers, same shape as image, '\
+            'number of exposures used for each pixel'
+
+    def run(self):
+        imgs = self.inputs['images']
+        opened = []
+        if not isinstance(imgs,np.ndarray):
+            imgs = [open_image(img) for img in imgs]
+            # handles opened here are released when the stack is combined
+            opened = [img for img,inp in zip(imgs,self.inputs['images']) if isinstance(inp,str)]
+        try:
+            return self.combine(imgs)
+        finally:
+            for img in opened:
+                img.release()
+
+    def combine(self,imgs):
+        n_exp = len(imgs)
+        n_rows, n_cols = imgs[0].shape
+        img_out = np.zeros((n_rows,n_cols))
+        count = np.zeros((n_rows,n_cols),dtype=int)
+        nr = max(int(self.inputs['block_rows']),1)
+        for r0 in range(0,n_rows,nr):
+            r1 = min(r0+nr,n_rows)
+            blk = np.empty((n_exp,r1-r0,n_cols),dtype=np.float64)
+            for iexp in range(n_exp):
+                blk[iexp] = image_rows(imgs[iexp],r0,r1)
+            if self.inputs['method'] == 'median':
+                img_out[r0:r1] = np.median(blk,axis=0)
+                count[r0:r1] = n_exp
+            elif self.inputs['method'] == 'sigma_clip':
+                img_out[r0:r1], count[r0:r1] = sigma_clip(blk,
+                    self.inputs['sigma_limit'],self.inputs['n_iterations'],
+                    self.inputs['noise_model'],self.inputs['gain'])
+            else:
+                raise ValueError('unknown combination method: {}'.format(self.inputs['method']))
+        n_rejected = n_exp*n_rows*n_cols-np.sum(count)
+        self.message_callback('combined {} exposures ({} values rejected)'.format(n_exp,n_rejected))
+        self.outputs['image'] = img_out
+        self.outputs['count'] = count
+        return self.outputs
+
+def open_image(img):
+    if isinstance(img,str):
+        return ImageHandle(img,mmap=True)
+    if isinstance(img,ImageHandle):
+        return img
+    return np.asarray(img)
+
+def image_rows(img,r0,r1):
+    if isinstance(img,ImageHandle):
+        img = img.data
+    return img[r0:r1]
+
+def sigma_clip(x,sigma_limit=3.,n_iterations=3,noise_model='poisson',gain=1.):
+    """Compute the sigma-clipped mean of x along the first axis.
+
+    The first pass is centered on the median,
+    and later passes on the mean of the retained values.
+    For the 'poisson' noise model, the standard deviation is sqrt(gain*center).
+    For the 'sample' noise model, it is the sample standard deviation
+    of the retained values about the center.
+    If all values of an element would be rejected, they are all retained.
+
+    Returns the clipped mean, and the number of values retained for each element.
+    """
+    center = np.median(x,axis=0)
+    keep = np.ones(x.shape,dtype=bool)
+    n_keep = np.full(x.shape[1:],x.shape[0])
+    dev = np.empty(x.shape)
+    for it in range(n_iterations):
+        np.abs(np.subtract(x,center,out=dev),out=dev)
+        if noise_model == 'poisson':
+            sigma = np.sqrt(gain*np.maximum(center,1.))
+        elif noise_model == 'sample':
+            sigma = np.sqrt(np.sum(np.where(keep,dev*dev,0.),axis=0)/np.maximum(n_keep-1,1))
+        else:
+            raise ValueError('unknown noise model: {}'.format(noise_model))
+        new_keep = dev <= sigma_limit*sigma
+        new_keep[:,~np.any(new_keep,axis=0)] = True
+        if np.array_equal(new_keep,keep):
+            break
+        keep = new_keep
+        n_keep = np.sum(keep,axis=0)
+        center = np.sum(np.where(keep,x,0.),axis=0)/n_keep
+    # the mean of the retained values
+    # (the center is still the median if nothing was rejected)
+    center = np.sum(np.where(keep,x,0.),axis=0)/n_keep
+    return center, n_keep
@@ -0,0 +1,202 @@
+"""Append-only storage for a series of 1d patterns on a shared q grid.
+
+A PatternStore is a directory holding:
+
+- q.npy: the shared q grid (n_q values)
+- I.bin, dI.bin: float64 intensities and errors, one row of n_q values per pattern
+- mask.bin: uint8 mask (nonzero for masked points), one row per pattern
+- time.bin: float64 time of each pattern
+- headers.jsonl: one line of JSON-encoded header fields per pattern,
+  tagged with the index of the pattern
+
+The .bin files are raw arrays that are memory-mapped for reading,
+and patterns are appended by writing rows to the ends of the files,
+so opening a store does not read the pattern data,
+and the headers are parsed only when they are first requested.
+The number of patterns is the number of complete rows in all files,
+so a partially written append is ignored by readers,
+and it is overwritten by the next append.
+"""
+import os
+import json
+
+import numpy as np
+
+from . import pawstools
+
+class PatternStore(object):
+
+    def __init__(self,store_dir,q=None):
+        """Open (or create) a PatternStore.
+
+        Parameters
+        ----------
+        store_dir : str
+            path to the store directory
+        q : array
+            q grid of the patterns-
+            required if the store does not exist yet,
+            otherwise it must match the q grid of the store
+        """
+        super(PatternStore,self).__init__()
+        self.store_dir = store_dir
+        q_path = os.path.join(store_dir,'q.npy')
+        if not os.path.exists(q_path):
+            if q is None:
+                raise ValueError('store {} does not exist, and no q grid was provided'.format(store_dir))
+            if not os.path.exists(store_dir):
+                os.makedirs(store_dir)
+            q = np.asarray(q,dtype=np.float64)
+            for fn in ['I.bin','dI.bin','mask.bin','time.bin','headers.jsonl']:
+                open(os.path.join(store_dir,fn),'ab').close()
+            np.save(q_path,q)
+        self.q = np.load(q_path)
+        if q is not None and not np.array_equal(np.asarray(q,dtype=np.float64),self.q):
+            raise ValueError('q grid does not match the q grid of store {}'.format(store_dir))
+        self.n_q = self.q.shape[0]
+        self._n_frames = None
+        self._arrays = {}
+        self._headers = None
+
+    def __len__(self):
+        if self._n_frames is None:
+            self.refresh()
+        return self._n_frames
+
+    def path(self,fn):
+        return os.path.join(self.store_dir,fn)
+
+    def refresh(self):
+        """Re-check the number of patterns (e.g. after another process appends to the store)."""
+        row_bytes = self.n_q*8
+        n = min([
+            os.path.getsize(self.path('I.bin'))//row_bytes,
+            os.path.getsize(self.path('dI.bin'))//row_bytes,
+            os.path.getsize(self.path('mask.bin'))//self.n_q,
+            os.path.getsize(self.path('time.bin'))//8])
+        if not n == self._n_frames:
+            self._arrays = {}
+        self._n_frames = n
+
+    def _array(self,name,dtype,row_shape):
+        n = len(self)
+        if not name in self._arrays:
+            if n == 0:
+                arr = np.zeros((0,)+row_shape,dtype=dtype)
+            else:
+                arr = np.memmap(self.path(name+'.bin'),dtype=dtype,mode='r',shape=(n,)+row_shape)
+            self._arrays[name] = arr
+        return self._arrays[name]
+
+    @property
+    def I(self):
+        """Memory-mapped n_patterns-by-n_q array of intensities."""
+        return self._array('I',np.float64,(self.n_q,))
+
+    @property
+    def dI(self):
+        """Memory-mapped n_patterns-by-n_q array of intensity errors (nan where not provided)."""
+        return self._array('dI',np.float64,(self.n_q,))
+
+    @property
+    def mask(self):
+        """Memory-mapped n_patterns-by-n_q boolean array, True for masked points."""
+        return self._array('mask',np.uint8,(self.n_q,)).view(bool)
+
+    @property
+    def time(self):
+        """Memory-mapped array of pattern times (nan where not provided)."""
+        return self._array('time',np.float64,())
+
+    def headers(self):
+        """Get the list of header dicts (parsed on first use)."""
+        n = len(self)
+        if self._headers is None or len(self._headers) < n:
+            hdrs = [None]*n
+            with open(self.path('headers.jsonl'),'r') as f:
+                for ln in f:
+                    if not ln.strip(): continue
+                    idx, hdr = json.loads(ln)
+                    # later lines replace the leftovers of interrupted appends
+                    if idx < n: hdrs[idx] = hdr
+            self._headers = hdrs
+        return self._headers[:n]
+
+    def header(self,idx):
+        return self.headers()[idx]
+
+    def get(self,idx):
+        """Get the pattern at index idx, as a dict."""
+        return dict(
+            q = self.q,
+            I = self.I[idx],
+            dI = self.dI[idx],
+            mask = self.mask[idx],
+            time = self.time[idx],
+            header = self.header(idx)
+            )
+
+    def time_index(self,t):
+        """Get the index of the pattern with time nearest to t."""
+        return int(np.nanargmin(np.abs(self.time-t)))
+
+    def select_time(self,t_min=None,t_max=None):
+        """Get the indices of the patterns with t_min <= time < t_max, in time order."""
+        t = np.asarray(self.time)
+        sel = np.ones(t.shape,dtype=bool)
+        if t_min is not None: sel &= t >= t_min
+        if t_max is not None: sel &= t < t_max
+        idx = np.where(sel)[0]
+        return idx[np.argsort(t[idx],kind='mergesort')]
+
+    def append(self,I,dI=None,mask=None,time=None,header=None):
+        """Append one pattern, or a stack of patterns, to the store.
+
+        Parameters
+        ----------
+        I : array
+            n_q intensities, or n_patterns-by-n_q array of intensities
+        dI : array
+            intensity errors, same shape as I (optional)
+        mask : array
+            boolean mask, same shape as I, True for masked points (optional)
+        time : float or array
+            time of the pattern(s) (optional)
+        header : dict or list of dict
+            header fields of the pattern(s) (optional)
+
+        Returns
+        -------
+        idx : int
+            index of the first appended pattern
+        """
+        I = np.array(I,dtype=np.float64,ndmin=2)
+        n_new = I.shape[0]
+        if not I.shape[1] == self.n_q:
+            raise ValueError('patterns have {} points, store q grid has {}'.format(I.shape[1],self.n_q))
+        if dI is None:
+            dI = np.full(I.shape,np.nan)
+        dI = np.array(dI,dtype=np.float64,ndmin=2)
+        if mask is None:
+            mask = np.zeros(I.shape,dtype=np.uint8)
+        mask = np.array(mask,dtype=np.uint8,ndmin=2)
+        if time is None:
+            time = np.nan
+        time = np.broadcast_to(np.asarray(time,dtype=np.float64),(n_new,))
+        if header is None or isinstance(header,dict):
+            header = [header]*n_new
+        self.refresh()
+        idx = len(self)
+        with open(self.path('headers.jsonl'),'a') as f:
+            for i,hdr in enumerate(header):
+                f.write(json.dumps([idx+i,pawstools.primitives(hdr or {})],default=str)+'\n')
+        # I is written last: readers count only the rows present in all files
+        for fn,arr in [('dI.bin',dI),('mask.bin',mask),('time.bin',time),('I.bin',I)]:
+            with open(self.path(fn),'r+b') as f:
+                # drop any rows left by an interrupted append
+                f.seek(idx*arr[0].nbytes)
+                f.truncate()
+                f.write(np.ascontiguousarray(arr).tobytes())
+        self.refresh()
+        return idx
+
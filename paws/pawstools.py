@@ -5,7 +5,7 @@ import re
 import string 
 from collections import OrderedDict
 
-import yaml
+import numpy as np
 
 from . import operations
 from . import workflows
@@ -48,10 +48,16 @@ def primitives(v):
         for kk,vv in v.items():
             rd[kk] = primitives(vv)
         return rd
-    elif isinstance(v,list):
+    elif isinstance(v,(list,tuple)):
         return [primitives(vv) for vv in v]
+    elif isinstance(v,np.ndarray):
+        return primitives(v.tolist())
+    elif isinstance(v,np.generic):
+        return v.item()
     elif isinstance(v,str):
         return str(v)
+    elif isinstance(v,(bool,np.bool_)):
+        return bool(v)
     elif isinstance(v,int):
         return int(v)
     elif isinstance(v,float):
@@ -59,6 +65,57 @@ def primitives(v):
     else:
         return v
 
+def copy_containers(v):
+    """Copy the dicts and lists in v, sharing everything else.
+
+    This is used in place of copy.deepcopy()
+    when only the containers of v are going to be mutated,
+    e.g. when an Operation appends to a list in its outputs.
+    """
+    if isinstance(v,dict):
+        rd = type(v)()
+        for kk,vv in v.items():
+            rd[kk] = copy_containers(vv)
+        return rd
+    elif isinstance(v,list):
+        return [copy_containers(vv) for vv in v]
+    else:
+        return v
+
+def readonly_view(v):
+    """Copy the containers in v, replacing arrays with read-only views.
+
+    The returned structure shares all of its array data with v,
+    but the arrays cannot be modified through the returned views.
+    """
+    if isinstance(v,np.ndarray):
+        vw = v.view()
+        vw.flags.writeable = False
+        return vw
+    elif isinstance(v,dict):
+        rd = type(v)()
+        for kk,vv in v.items():
+            rd[kk] = readonly_view(vv)
+        return rd
+    elif isinstance(v,list):
+        return [readonly_view(vv) for vv in v]
+    else:
+        return v
+
+def sliding_windows(x,width):
+    """Return a read-only view of all length-`width` windows along the last axis of x.
+
+    The window index is placed on the first axis of the result:
+    element [j,...,i] of the result is x[...,i+j].
+    No data are copied.
+    """
+    n_win = max(x.shape[-1]-width+1,0)
+    st = x.strides[-1]
+    return np.lib.stride_tricks.as_strided(x,
+        shape=(width,)+x.shape[:-1]+(n_win,),
+        strides=(st,)+x.strides[:-1]+(st,),
+        writeable=False)
+
 class WorkflowAborted(Exception):
     pass
 
@@ -88,26 +145,24 @@ def timestr():
 def save_file(filename,d):
     """
     Create or replace file indicated by filename,
-    as a yaml serialization of dict d.
+    as a serialization of dict d (see paws.serialization).
     """
-    f = open(filename, 'w')
-    yaml.dump(d, f)
-    f.close()
+    from . import serialization
+    serialization.save_file(filename,d)
     
 def update_file(filename,d):
     """
     Save the items in dict d into filename,
     without removing members not included in d.
+    This rewrites the whole file:
+    for frequent updates, use a paws.journal.JournalStore.
     """
+    from . import serialization
     if os.path.exists(filename):
-        f_old = open(filename,'r')
-        d_old = yaml.load(f_old)
-        f_old.close()
+        d_old = serialization.load_file(filename)
         d_old.update(d)
         d = d_old
-    f = open(filename, 'w')
-    yaml.dump(d, f)
-    f.close()
+    serialization.save_file(filename,d)
 
 class DictTree(object):
     """A data structure for tree-like storage.
@@ -0,0 +1,191 @@
+import os
+import fnmatch
+import time
+from threading import Thread, Condition, current_thread
+
+from .PawsPlugin import PawsPlugin
+from ..workflows.IMAGE_INTEGRATION.IntegrateBatch import integrate_image
+
+class OnlineIntegrator(PawsPlugin):
+    """Plugin for integrating images as they appear in a directory.
+
+    A watcher thread polls image_dir every poll_interval seconds.
+    A new file (matching pattern) is considered complete
+    when its size and modification time have not changed
+    for settle_time seconds.
+    Complete files are integrated once,
+    the results are saved as .dat files in output_dir (if provided),
+    and q_I is passed to data_callback(image_path,q_I) (if provided).
+    Errors in reading the directory, integrating an image,
+    or in data_callback are reported by message_callback,
+    and the watcher keeps running until stop() is called.
+    No OS-specific file notification is used,
+    so the latency from file close to reduced pattern
+    is about poll_interval+settle_time, plus the integration time.
+    """
+
+    def __init__(self,integrator,image_dir,output_dir=None,data_callback=None,
+        n_points=1000,polz_factor=0.,error_model='poisson',pattern='*.tif',
+        poll_interval=0.1,settle_time=0.2,include_existing=False,max_read_attempts=5,
+        verbose=False,log_file=None):
+        """Create an OnlineIntegrator.
+
+        Parameters
+        ----------
+        integrator : paws.plugins.PyFAIIntegrator.PyFAIIntegrator
+            started integrator plugin (e.g. a SparseIntegrator)
+        image_dir : str
+            directory to watch for new images
+        output_dir : str
+            directory for saving .dat files (if None, nothing is saved)
+        data_callback : callable
+            called as data_callback(image_path,q_I) after each integration
+        n_points : int
+            number of points in the integrated patterns
+        polz_factor : float
+            polarization factor
+        error_model : str
+            if not None, the patterns carry a third (dI) column
+            of Poisson error estimates
+        pattern : str
+            filename pattern (fnmatch syntax) of the images
+        poll_interval : float
+            time in seconds between directory scans
+        settle_time : float
+            time in seconds for which a file's size and mtime
+            must be unchanged before it is integrated
+        include_existing : bool
+            if True, images that are already in image_dir at start()
+            are also integrated
+        max_read_attempts : int
+            number of failed reads after which an image is skipped
+        verbose : bool
+        log_file : str
+        """
+        super(OnlineIntegrator,self).__init__(verbose=verbose,log_file=log_file)
+        self.integrator = integrator
+        self.image_dir = image_dir
+        self.output_dir = output_dir
+        self.data_callback = data_callback
+        self.n_points = n_points
+        self.polz_factor = polz_factor
+        self.error_model = error_model
+        self.pattern = pattern
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.include_existing = include_existing
+        self.max_read_attempts = max_read_attempts
+        # pending: dict of image path: [size, mtime, time of last change, failed reads]
+        self.pending = {}
+        self.done = set()
+        # state_lock must be acquired before modifying self.state
+        self.state_lock = Condition()
+        self.state = dict(
+            n_integrated = 0,
+            n_failed = 0,
+            last_image = None,
+            last_latency = None,
+            max_latency = None
+            )
+        self.watcher_thread = None
+        self.last_error = None
+
+    def _run(self):
+        self.watcher_thread = Thread(target=self.run_watcher)
+        # start watching, block until the first scan is finished
+        with self.running_lock:
+            self.watcher_thread.start()
+            self.running_lock.wait()
+
+    def stop(self):
+        super(OnlineIntegrator,self).stop()
+        self.run_notify()
+        if self.watcher_thread is not None and not self.watcher_thread is current_thread():
+            self.watcher_thread.join()
+
+    def run_watcher(self):
+        try:
+            if not self.include_existing:
+                self.done.update(self.list_images())
+        except Exception as ex:
+            # the directory may not exist yet: keep watching
+            self.report_error('failed to list {}: {}'.format(self.image_dir,ex))
+        finally:
+            self.run_notify()
+        keep_going = True
+        while keep_going:
+            try:
+                self.scan()
+                self.last_error = None
+            except Exception as ex:
+                self.report_error('failed to scan {}: {}'.format(self.image_dir,ex))
+            with self.running_lock:
+                if self.running:
+                    self.running_lock.wait(self.poll_interval)
+                keep_going = bool(self.running)
+        if self.verbose: self.message_callback('FINISHED')
+
+    def report_error(self,msg):
+        # a persistent error (e.g. a missing directory) is reported once
+        if not msg == self.last_error:
+            self.message_callback(msg)
+            self.add_to_history(msg)
+        self.last_error = msg
+
+    def list_images(self):
+        return [os.path.join(self.image_dir,fn) for fn in os.listdir(self.image_dir)
+            if fnmatch.fnmatch(fn,self.pattern)]
+
+    def scan(self):
+        """Check the image directory, and integrate any complete new images."""
+        t_now = time.time()
+        for img_path in self.list_images():
+            if img_path in self.done:
+                continue
+            try:
+                st = os.stat(img_path)
+            except OSError:
+                # the file was moved or removed
+                continue
+            stat = self.pending.get(img_path)
+            if stat is None or not (stat[0] == st.st_size and stat[1] == st.st_mtime):
+                n_fails = 0
+                if stat is not None: n_fails = stat[3]
+                self.pending[img_path] = [st.st_size,st.st_mtime,t_now,n_fails]
+            elif st.st_size > 0 and t_now-stat[2] >= self.settle_time:
+                self.integrate(img_path,st.st_mtime)
+
+    def integrate(self,img_path,mtime):
+        try:
+            q_I, dat_path = integrate_image(self.integrator,None,img_path,
+                self.n_points,self.polz_factor,self.output_dir,self.error_model is not None)
+        except Exception as ex:
+            stat = self.pending[img_path]
+            stat[3] += 1
+            if stat[3] < self.max_read_attempts:
+                # the file may still be incomplete: try again at the next scan
+                return
+            self.message_callback('failed to integrate {}: {}'.format(img_path,ex))
+            self.add_to_history('failed: {}'.format(img_path))
+            self.pending.pop(img_path)
+            self.done.add(img_path)
+            with self.state_lock:
+                self.state['n_failed'] += 1
+            return
+        self.pending.pop(img_path)
+        self.done.add(img_path)
+        latency = time.time()-mtime
+        with self.state_lock:
+            self.state['n_integrated'] += 1
+            self.state['last_image'] = img_path
+            self.state['last_latency'] = latency
+            if self.state['max_latency'] is None or latency > self.state['max_latency']:
+                self.state['max_latency'] = latency
+        if self.verbose: self.message_callback('integrated {} ({:.3f} s after write)'.format(img_path,latency))
+        self.add_to_history('integrated: {}'.format(img_path))
+        if self.data_callback is not None:
+            try:
+                self.data_callback(img_path,q_I)
+            except Exception as ex:
+                self.message_callback('data_callback failed for {}: {}'.format(img_path,ex))
+
@@ -1,6 +1,8 @@
 import os
+import time
 from threading import Condition
 
+import numpy as np
 import pyFAI.azimuthalIntegrator as pfaz
 
 from .PawsPlugin import PawsPlugin
@@ -10,21 +12,56 @@ class PyFAIIntegrator(PawsPlugin):
 
     Input calibration file should be in one of the formats
     outlined in the package documentation. 
+
+    The plugin keeps a pool of n_integrators integrators,
+    all calibrated from the same file.
+    Each call to integrate_to_1d() or integrate_to_2d() 
+    checks out an idle integrator, waiting for one if they are all busy,
+    so that up to n_integrators threads can integrate concurrently.
+    Pool utilization and wait times are reported by pool_status().
+
+    NOTE: pyFAI builds and caches its integration engines 
+    on the first integration with a given configuration,
+    and this setup is not safe to run concurrently.
+    The first integration of each integrator with a new configuration
+    is therefore serialized by setup_lock.
     """
 
-    def __init__(self,calib_file,q_min=0.,q_max=1.,verbose=False,log_file=None):
+    def __init__(self,calib_file,q_min=0.,q_max=1.,n_integrators=1,verbose=False,log_file=None):
         super(PyFAIIntegrator,self).__init__(verbose=verbose,log_file=log_file)
         self.calib_file = calib_file
         self.q_min = q_min
         self.q_max = q_max
+        self.n_integrators = n_integrators
+        # integrator_lock must be acquired 
+        # before modifying the pool or its statistics
         self.integrator_lock = Condition()
         self.integrator = None
+        self.integrators = []
+        self.idle_integrators = []
+        self.n_integrations = 0
+        self.total_wait_time = 0.
+        self.total_busy_time = 0.
+        self.pool_t0 = None
+        # setup_lock serializes the first integration of each configuration
+        self.setup_lock = Condition()
+        self.ready_configs = set()
 
     def start(self):
         super(PyFAIIntegrator,self).start()
+        with self.setup_lock:
+            self.ready_configs = set()
         with self.integrator_lock:
-            self.integrator = pfaz.AzimuthalIntegrator()
+            self.integrators = [pfaz.AzimuthalIntegrator() for i in range(self.n_integrators)]
+            self.integrator = self.integrators[0]
         self.set_calib()
+        with self.integrator_lock:
+            self.idle_integrators = list(self.integrators)
+            self.n_integrations = 0
+            self.total_wait_time = 0.
+            self.total_busy_time = 0.
+            self.pool_t0 = time.time()
+            self.integrator_lock.notify_all()
 
     def set_calib(self):
         self.message_callback('calibrating on {}'.format(self.calib_file))
@@ -34,24 +71,151 @@ class PyFAIIntegrator(PawsPlugin):
             #g.read(calib)
             #p.setPyFAI(g.getPyFAI())
             with self.integrator_lock:
-                self.integrator.read(self.calib_file)
+                for integ in self.integrators:
+                    integ.read(self.calib_file)
         elif xt in ['.nika','.NIKA']:
             with self.integrator_lock:
-                self.set_nika(self.calib_file)
+                for integ in self.integrators:
+                    self.set_nika(self.calib_file,integ)
 
-    def integrate_to_1d(self,img_data,npt=1000,polz_factor=0.,unit='q_A^-1'):
+    def worker_settings(self):
+        """Get the class and keyword arguments for building an equivalent integrator.
+
+        Used to build integrators in worker processes (see IntegrateBatch).
+        The settings are picklable, and they do not include the pool size or logging.
+        """
+        return self.__class__, dict(calib_file=self.calib_file,q_min=self.q_min,q_max=self.q_max)
+
+    def checkout_integrator(self):
+        """Wait for an idle integrator, remove it from the pool, and return it."""
+        t_req = time.time()
         with self.integrator_lock:
-            q,I = self.integrator.integrate1d(img_data,npt,
-                polarization_factor=polz_factor,unit=unit,radial_range=(self.q_min,self.q_max))
+            while not self.idle_integrators:
+                self.integrator_lock.wait()
+            integ = self.idle_integrators.pop()
+            self.total_wait_time += time.time()-t_req
+        return integ, time.time()
+
+    def return_integrator(self,integ,t_checkout):
+        """Return an integrator to the pool, and notify any waiting threads."""
+        with self.integrator_lock:
+            self.idle_integrators.append(integ)
+            self.n_integrations += 1
+            self.total_busy_time += time.time()-t_checkout
+            self.integrator_lock.notify()
+
+    def pool_status(self):
+        """Report the size, utilization, and wait times of the integrator pool.
+
+        utilization is the fraction of the available integrator-time
+        (since the pool was started) during which integrators were busy.
+        """
+        with self.integrator_lock:
+            n_integ = len(self.integrators)
+            stat = dict(
+                n_integrators = n_integ,
+                n_busy = n_integ-len(self.idle_integrators),
+                n_integrations = self.n_integrations,
+                total_wait_time = self.total_wait_time,
+                mean_wait_time = None,
+                utilization = None
+                )
+            if self.n_integrations > 0:
+                stat['mean_wait_time'] = self.total_wait_time/self.n_integrations
+            if self.pool_t0 is not None and n_integ > 0:
+                t_pool = (time.time()-self.pool_t0)*n_integ
+                if t_pool > 0: stat['utilization'] = self.total_busy_time/t_pool
+        return stat
+
+    def run_integration(self,integ,config,integ_func):
+        """Call integ_func(), serializing it if config is new for integ."""
+        config = (id(integ),)+config
+        with self.setup_lock:
+            ready = config in self.ready_configs
+        if ready:
+            return integ_func()
+        with self.setup_lock:
+            result = integ_func()
+            self.ready_configs.add(config)
+        return result
+
+    def integrate_to_1d(self,img_data,npt=1000,polz_factor=0.,unit='q_A^-1'):
+        integ, t_checkout = self.checkout_integrator()
+        try:
+            config = ('1d',img_data.shape,npt,polz_factor,unit,self.q_min,self.q_max)
+            q,I = self.run_integration(integ,config,
+                lambda: integ.integrate1d(img_data,npt,polarization_factor=polz_factor,
+                    unit=unit,radial_range=(self.q_min,self.q_max)))
+        finally:
+            self.return_integrator(integ,t_checkout)
         return q,I
 
+    def integrate_to_1d_with_error(self,img_data,npt=1000,polz_factor=0.,variance=None,unit='q_A^-1'):
+        """Integrate img_data, and propagate the pixel variances to the integrated intensity.
+
+        If variance (an array with the shape of img_data) is not provided,
+        Poisson statistics are assumed, with pixel variance max(img_data,1).
+
+        Returns q, I, and the error estimate dI.
+        """
+        integ, t_checkout = self.checkout_integrator()
+        try:
+            config = ('1d',img_data.shape,npt,polz_factor,unit,self.q_min,self.q_max)
+            error_model = None
+            if variance is None:
+                error_model = 'poisson'
+            res = self.run_integration(integ,config,
+                lambda: integ.integrate1d(img_data,npt,polarization_factor=polz_factor,
+                    unit=unit,radial_range=(self.q_min,self.q_max),
+                    variance=variance,error_model=error_model))
+        finally:
+            self.return_integrator(integ,t_checkout)
+        return res.radial,res.intensity,res.sigma
+
+    def integrate_stack(self,img_stack,npt=1000,polz_factor=0.,unit='q_A^-1'):
+        """Integrate each image of an n_images-by-H-by-W stack.
+
+        Returns the q values and an n_images-by-npt array of intensities.
+        """
+        I_stack = np.zeros((img_stack.shape[0],npt))
+        q = None
+        for iimg in range(img_stack.shape[0]):
+            q,I_stack[iimg] = self.integrate_to_1d(img_stack[iimg],npt,polz_factor,unit)
+        return q,I_stack
+
+    def integrate_stack_with_error(self,img_stack,npt=1000,polz_factor=0.,var_stack=None,unit='q_A^-1'):
+        """Integrate each image of an n_images-by-H-by-W stack, with error propagation.
+
+        var_stack, if provided, holds the pixel variances of img_stack 
+        (see integrate_to_1d_with_error()).
+
+        Returns the q values, and n_images-by-npt arrays of intensities and errors.
+        """
+        I_stack = np.zeros((img_stack.shape[0],npt))
+        dI_stack = np.zeros((img_stack.shape[0],npt))
+        q = None
+        for iimg in range(img_stack.shape[0]):
+            var = None
+            if var_stack is not None:
+                var = var_stack[iimg]
+            q,I_stack[iimg],dI_stack[iimg] = self.integrate_to_1d_with_error(
+                img_stack[iimg],npt,polz_factor,var,unit)
+        return q,I_stack,dI_stack
+
     def integrate_to_2d(self,img_data,npt_rad=1000,npt_azim=1000,polz_factor=0.,unit='q_A^-1'):
-        with self.integrator_lock:
-            I_at_q_chi,q,chi = self.integrator.integrate2d(img_data,
-                npt_rad,npt_azim,polarization_factor=polz_factor,unit=unit)
+        integ, t_checkout = self.checkout_integrator()
+        try:
+            config = ('2d',img_data.shape,npt_rad,npt_azim,polz_factor,unit)
+            I_at_q_chi,q,chi = self.run_integration(integ,config,
+                lambda: integ.integrate2d(img_data,npt_rad,npt_azim,
+                    polarization_factor=polz_factor,unit=unit))
+        finally:
+            self.return_integrator(integ,t_checkout)
         return q,chi,I_at_q_chi
 
-    def set_nika(self,nika_file):
+    def set_nika(self,nika_file,integrator=None):
+        if integrator is None:
+            integrator = self.integrator
         # TODO: make nika format yaml-able
         for line in open(nika_file,'r'):
             kv = line.strip().split('=')
@@ -85,5 +249,5 @@ class PyFAIIntegrator(PawsPlugin):
         #tmpint.setFit2D(d_mm,bcx_px,bcy_px,tilt_deg,rot_fit2d,pxsz_x_um,pxsz_y_um)
         #pd = tmpint.getPyFAI()
         #self.integrator.setPyFAI(**pd)
-        self.integrator.set_wavelength(wl_m)
-        self.integrator.setFit2D(d_mm,bcx_px,bcy_px,tilt_deg,rot_fit2d,pxsz_x_um,pxsz_y_um)
+        integrator.set_wavelength(wl_m)
+        integrator.setFit2D(d_mm,bcx_px,bcy_px,tilt_deg,rot_fit2d,pxsz_x_um,pxsz_y_um)
@@ -0,0 +1,275 @@
+import os
+import hashlib
+import shutil
+import tempfile
+from threading import Condition
+
+import numpy as np
+from scipy import sparse
+
+from .. import pawstools
+from .PyFAIIntegrator import PyFAIIntegrator
+
+# bump this if the format or content of the cached matrices changes
+ENGINE_VERSION = 2
+
+class SparseIntegrator(PyFAIIntegrator):
+    """Plugin for integrating images by a cached sparse pixel-to-bin matrix.
+
+    The geometry is calibrated by pyFAI, as in PyFAIIntegrator.
+    For each image shape, number of points, and polarization factor,
+    the mapping from pixels to radial (q) bins is computed once,
+    as a CSR matrix with one row per q bin.
+    The pixel-to-bin coefficients are taken from pyFAI's own CSR engine,
+    with the pixel splitting given by split:
+    the default, 'bbox', is the splitting of pyFAI's default 
+    ('bbox','csr','cython') method, which PyFAIIntegrator uses,
+    so the results are the same as PyFAIIntegrator's (to float32 precision).
+    split='no' assigns each pixel to the bin containing its center 
+    (pyFAI's ('no','csr') method), which is faster to build,
+    but leaves bins empty (zero) where they are narrower than the pixels.
+    Each row is normalized by the coefficient-weighted sum 
+    of the solid angle and polarization corrections of its pixels,
+    so that integrating an image is one sparse matrix-vector product.
+
+    Errors are propagated by a second product,
+    of the pixel variances with the element-wise square of the same matrix.
+
+    The matrices are saved under cache_dir 
+    (default: paws_scratch_dir/integration_cache),
+    keyed by a hash of the calibrated geometry, the image shape, 
+    the number of points, the q range, the mask, the splitting, and the polarization factor.
+    The geometry and mask are hashed once, by set_calib() (when the plugin is started),
+    so set the mask before starting the plugin.
+    Cached matrices are loaded as memory-mapped arrays.
+    """
+
+    def __init__(self,calib_file,q_min=0.,q_max=1.,mask=None,split='bbox',cache_dir=None,
+        verbose=False,log_file=None):
+        """Create a SparseIntegrator.
+
+        Parameters
+        ----------
+        calib_file : str
+            calibration file (see PyFAIIntegrator)
+        q_min, q_max : float
+            q range of the integrated patterns, in 1/Angstrom
+        mask : array
+            boolean mask of the image pixels (True for masked pixels)
+        split : str
+            pixel splitting scheme: 'bbox' (as in PyFAIIntegrator), 'full', or 'no'
+        cache_dir : str
+            directory for saving the integration matrices
+        verbose : bool
+        log_file : str
+        """
+        super(SparseIntegrator,self).__init__(calib_file,q_min,q_max,
+            n_integrators=1,verbose=verbose,log_file=log_file)
+        self.mask = mask
+        self.split = split
+        if cache_dir is None:
+            cache_dir = os.path.join(pawstools.paws_scratch_dir,'integration_cache')
+        self.cache_dir = cache_dir
+        # engines_lock must be acquired before modifying self.engines
+        self.engines_lock = Condition()
+        self.engines = {}
+        self.variance_matrices = {}
+        # digest of the loaded geometry and the mask, set by set_calib()
+        self.calib_digest = None
+
+    def set_calib(self):
+        super(SparseIntegrator,self).set_calib()
+        with self.integrator_lock:
+            geom = geometry_config(self.integrators[0])
+        h = hashlib.sha1(repr(sorted(geom.items())).encode())
+        if self.mask is not None:
+            h.update(np.ascontiguousarray(self.mask,dtype=bool).tobytes())
+        self.calib_digest = h.hexdigest()
+
+    def worker_settings(self):
+        integ_cls, kwargs = super(SparseIntegrator,self).worker_settings()
+        kwargs.update(mask=self.mask,split=self.split,cache_dir=self.cache_dir)
+        return integ_cls, kwargs
+
+    def engine_key(self,shape,npt,polz_factor):
+        """Hash the calibration and integration settings into a cache key."""
+        h = hashlib.sha1(self.calib_digest.encode())
+        h.update(repr((ENGINE_VERSION,tuple(shape),int(npt),
+            float(self.q_min),float(self.q_max),polz_factor,self.split)).encode())
+        return h.hexdigest()
+
+    def get_engine(self,shape,npt=1000,polz_factor=0.):
+        """Get the (q,matrix) engine for the given settings.
+
+        Engines are looked up in memory, then in cache_dir, 
+        and built (and saved to cache_dir) only if they are not found.
+        """
+        key = self.engine_key(shape,npt,polz_factor)
+        with self.engines_lock:
+            if key in self.engines:
+                return self.engines[key]
+            engine_dir = os.path.join(self.cache_dir,key)
+            if os.path.exists(engine_dir):
+                engine = load_engine(engine_dir)
+            else:
+                self.message_callback('building integration matrix: shape {}, {} points'.format(shape,npt))
+                engine = self.build_engine(shape,npt,polz_factor)
+                save_engine(engine_dir,*engine)
+            self.engines[key] = engine
+        return engine
+
+    def get_variance_matrix(self,shape,npt=1000,polz_factor=0.):
+        """Get the element-wise square of the engine matrix, for propagating pixel variances."""
+        key = self.engine_key(shape,npt,polz_factor)
+        with self.engines_lock:
+            if key in self.variance_matrices:
+                return self.variance_matrices[key]
+        q, mat = self.get_engine(shape,npt,polz_factor)
+        # the squared matrix shares the sparsity structure of mat
+        mat2 = sparse.csr_matrix((np.square(mat.data),mat.indices,mat.indptr),
+            shape=mat.shape,copy=False)
+        with self.engines_lock:
+            self.variance_matrices[key] = mat2
+        return mat2
+
+    def build_engine(self,shape,npt,polz_factor):
+        integ, t_checkout = self.checkout_integrator()
+        try:
+            # let pyFAI build its CSR engine for these settings
+            res = integ.integrate1d(np.zeros(shape,dtype=np.float32),npt,
+                polarization_factor=polz_factor,unit='q_A^-1',
+                radial_range=(self.q_min,self.q_max),mask=self.mask,
+                method=(self.split,'csr','cython'))
+            csr_engine = integ.engines[res.method].engine
+            coefs = sparse.csr_matrix(
+                (np.asarray(csr_engine.data,dtype=np.float64),
+                np.asarray(csr_engine.indices),np.asarray(csr_engine.indptr)),
+                shape=(npt,int(np.prod(shape))))
+            norm_px = integ.solidAngleArray(shape).ravel()
+            if polz_factor is not None:
+                norm_px = norm_px*integ.polarization(shape,factor=polz_factor).ravel()
+        finally:
+            self.return_integrator(integ,t_checkout)
+        return np.array(res.radial), normalize_rows(coefs,norm_px)
+
+    def integrate_to_1d(self,img_data,npt=1000,polz_factor=0.,unit='q_A^-1'):
+        if not unit == 'q_A^-1':
+            return super(SparseIntegrator,self).integrate_to_1d(img_data,npt,polz_factor,unit)
+        q, mat = self.get_engine(img_data.shape,npt,polz_factor)
+        I = mat.dot(np.ravel(img_data).astype(np.float64))
+        return q,I
+
+    def integrate_stack(self,img_stack,npt=1000,polz_factor=0.,unit='q_A^-1'):
+        """Integrate each image of an n_images-by-H-by-W stack.
+
+        The stack can be a memory-mapped array.
+        It is flattened to n_images-by-n_pixels,
+        and all images are integrated against the same cached matrix,
+        so the engine is looked up only once for the whole stack.
+
+        Returns the q values and an n_images-by-npt array of intensities.
+        """
+        if not unit == 'q_A^-1':
+            return super(SparseIntegrator,self).integrate_stack(img_stack,npt,polz_factor,unit)
+        n_img = img_stack.shape[0]
+        q, mat = self.get_engine(img_stack.shape[1:],npt,polz_factor)
+        img_flat = np.reshape(img_stack,(n_img,-1))
+        I_stack = np.empty((n_img,npt))
+        # NOTE: one matrix-vector product per image is faster than 
+        # a single matrix-matrix product against the (transposed) stack,
+        # because the csr kernels stream each image contiguously
+        for iimg in range(n_img):
+            I_stack[iimg] = mat.dot(np.asarray(img_flat[iimg],dtype=np.float64))
+        return q,I_stack
+
+    def integrate_to_1d_with_error(self,img_data,npt=1000,polz_factor=0.,variance=None,unit='q_A^-1'):
+        if not unit == 'q_A^-1':
+            return super(SparseIntegrator,self).integrate_to_1d_with_error(
+                img_data,npt,polz_factor,variance,unit)
+        q, mat = self.get_engine(img_data.shape,npt,polz_factor)
+        mat2 = self.get_variance_matrix(img_data.shape,npt,polz_factor)
+        img = np.ravel(img_data).astype(np.float64)
+        I = mat.dot(img)
+        dI = np.sqrt(mat2.dot(pixel_variance(img,variance)))
+        return q,I,dI
+
+    def integrate_stack_with_error(self,img_stack,npt=1000,polz_factor=0.,var_stack=None,unit='q_A^-1'):
+        if not unit == 'q_A^-1':
+            return super(SparseIntegrator,self).integrate_stack_with_error(
+                img_stack,npt,polz_factor,var_stack,unit)
+        n_img = img_stack.shape[0]
+        q, mat = self.get_engine(img_stack.shape[1:],npt,polz_factor)
+        mat2 = self.get_variance_matrix(img_stack.shape[1:],npt,polz_factor)
+        img_flat = np.reshape(img_stack,(n_img,-1))
+        var_flat = None
+        if var_stack is not None:
+            var_flat = np.reshape(var_stack,(n_img,-1))
+        I_stack = np.empty((n_img,npt))
+        dI_stack = np.empty((n_img,npt))
+        for iimg in range(n_img):
+            img = np.asarray(img_flat[iimg],dtype=np.float64)
+            var = None
+            if var_flat is not None:
+                var = var_flat[iimg]
+            I_stack[iimg] = mat.dot(img)
+            dI_stack[iimg] = np.sqrt(mat2.dot(pixel_variance(img,var)))
+        return q,I_stack,dI_stack
+
+def geometry_config(integ):
+    """Get the geometry of an AzimuthalIntegrator (including the wavelength) as a dict."""
+    if hasattr(integ,'get_config'):
+        geom = integ.get_config()
+    else:
+        geom = integ.getPyFAI()
+    geom['wavelength'] = integ.wavelength
+    return geom
+
+def pixel_variance(img,variance=None):
+    """Flatten the pixel variances, or estimate them by Poisson statistics.
+
+    The Poisson estimate is max(img,1), as in pyFAI's 'poisson' error model.
+    """
+    if variance is None:
+        return np.maximum(img,1.)
+    return np.ravel(variance).astype(np.float64)
+
+def normalize_rows(coefs,norm_px):
+    """Scale the pixel-to-bin coefficients so that each row gives a normalized mean.
+
+    Row i of the result holds coefs[i,j]/sum_j(coefs[i,j]*norm_px[j]),
+    so that its product with an image gives the normalized mean intensity,
+    as in pyFAI. Rows without pixels are left empty.
+    """
+    norm_sum = coefs.dot(norm_px)
+    scale = np.zeros(norm_sum.shape)
+    scale[norm_sum > 0] = 1./norm_sum[norm_sum > 0]
+    mat = sparse.diags(scale).dot(coefs).tocsr()
+    mat.sort_indices()
+    return mat
+
+def save_engine(engine_dir,q,mat):
+    """Save an engine to engine_dir, atomically (via a renamed temporary directory)."""
+    parent_dir = os.path.dirname(engine_dir)
+    if not os.path.exists(parent_dir):
+        os.makedirs(parent_dir)
+    tmp_dir = tempfile.mkdtemp(dir=parent_dir)
+    np.save(os.path.join(tmp_dir,'q.npy'),q)
+    np.save(os.path.join(tmp_dir,'data.npy'),mat.data)
+    np.save(os.path.join(tmp_dir,'indices.npy'),mat.indices)
+    np.save(os.path.join(tmp_dir,'indptr.npy'),mat.indptr)
+    np.save(os.path.join(tmp_dir,'shape.npy'),np.array(mat.shape))
+    try:
+        os.rename(tmp_dir,engine_dir)
+    except OSError:
+        # another process saved the same engine first
+        shutil.rmtree(tmp_dir)
+
+def load_engine(engine_dir):
+    """Load a saved engine, memory-mapping the matrix arrays."""
+    q = np.load(os.path.join(engine_dir,'q.npy'))
+    shape = tuple(np.load(os.path.join(engine_dir,'shape.npy')))
+    data = np.load(os.path.join(engine_dir,'data.npy'),mmap_mode='r')
+    indices = np.load(os.path.join(engine_dir,'indices.npy'),mmap_mode='r')
+    indptr = np.load(os.path.join(engine_dir,'indptr.npy'),mmap_mode='r')
+    mat = sparse.csr_matrix((data,indices,indptr),shape=shape,copy=False)
+    return q, mat
@@ -0,0 +1,111 @@
+"""Serializers for header and other dict files.
+
+Files are written by save_file() in the default format (see set_default_format()),
+after converting their contents to primitive types (see pawstools.primitives()).
+The 'yaml' format uses the libyaml-based CSafeLoader/CSafeDumper
+when PyYAML is built with libyaml, and the pure-python safe loader/dumper otherwise.
+The 'json' format is faster to read and write, especially without libyaml.
+
+load_file() reads either format, regardless of the file extension:
+files that start with '{' are parsed as JSON first, and everything else as YAML.
+YAML files that carry python-specific tags (e.g. tuples written by yaml.dump())
+are read by yaml.FullLoader, as they were by yaml.load().
+"""
+from collections import OrderedDict
+import json
+import time
+
+import yaml
+
+from . import pawstools
+
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
+FullLoader = getattr(yaml,'FullLoader',yaml.Loader)
+
+def yaml_loads(s):
+    try:
+        return yaml.load(s,Loader=SafeLoader)
+    except yaml.constructor.ConstructorError:
+        # python-specific tags
+        return yaml.load(s,Loader=FullLoader)
+
+def yaml_dumps(d):
+    return yaml.dump(d,Dumper=SafeDumper)
+
+def json_loads(s):
+    return json.loads(s)
+
+def json_dumps(d):
+    return json.dumps(d,indent=2,sort_keys=True)
+
+# format name: (loads, dumps)
+serializers = OrderedDict(
+    yaml = (yaml_loads,yaml_dumps),
+    json = (json_loads,json_dumps)
+    )
+
+default_format = 'yaml'
+
+def set_default_format(fmt):
+    """Set the format used by save_file() ('yaml' or 'json')."""
+    global default_format
+    if not fmt in serializers:
+        raise ValueError('unknown serialization format: {}'.format(fmt))
+    default_format = fmt
+
+def loads(s):
+    """Parse a YAML or JSON string."""
+    if s.lstrip().startswith('{'):
+        try:
+            return json_loads(s)
+        except ValueError:
+            # YAML flow mapping
+            pass
+    return yaml_loads(s)
+
+def dumps(d,fmt=None):
+    """Serialize the primitives of d in format fmt (default: the default format)."""
+    return serializers[fmt or default_format][1](pawstools.primitives(d))
+
+def load_file(filename):
+    """Read a YAML or JSON file."""
+    with open(filename,'r') as f:
+        return loads(f.read())
+
+def save_file(filename,d,fmt=None):
+    """Create or replace filename with a serialization of d (see dumps())."""
+    s = dumps(d,fmt)
+    with open(filename,'w') as f:
+        f.write(s)
+
+def benchmark(n_headers=1000,hdr=None):
+    """Time the serializers on n_headers copies of a header.
+
+    Returns a dict of serializer name: (seconds per dump, seconds per load),
+    including the pure-python YAML loader and dumper for comparison.
+    The default header resembles those written at beamline 1-5.
+    """
+    if hdr is None:
+        hdr = dict(t_utc=1530128289.817777,time='2018-06-27 12:39:49.817827-07:00',
+            source_wavelength=0.799898,exposure_time=10.,reaction_id='R1_20180627',
+            sample_id='R1_20180627_1530128289',T_set=120.5,T_act=119.87,
+            flowrates=[1.,0.5,0.,0.25],recipe=dict(solvent='toluene',precursor='PbI2'))
+    hdr = pawstools.primitives(hdr)
+    bench_serializers = OrderedDict(
+        yaml_python = (lambda s: yaml.load(s,Loader=yaml.SafeLoader),
+            lambda d: yaml.dump(d,Dumper=yaml.SafeDumper)))
+    bench_serializers.update(serializers)
+    results = OrderedDict()
+    for fmt,(lds,dps) in bench_serializers.items():
+        t0 = time.time()
+        strs = [dps(hdr) for i in range(n_headers)]
+        t1 = time.time()
+        for s in strs:
+            lds(s)
+        t2 = time.time()
+        results[fmt] = ((t1-t0)/n_headers,(t2-t1)/n_headers)
+    return results
@@ -3,11 +3,10 @@ import time
 import copy
 import os
 
-import yaml
 import fabio
 
 from ...Workflow import Workflow
-from ....pawstools import primitives
+from .... import serialization
 
 inputs = OrderedDict(
     flow_reactor=None, 
@@ -64,7 +63,7 @@ class RunRecipeTakeImages(Workflow):
             self.outputs['headers'].append(hdr)
             if self.inputs['header_output_dir']:
                 hdr_path = os.path.join(self.inputs['header_output_dir'],fn_root+'.yml')
-                yaml.dump(primitives(hdr),open(hdr_path,'w'))
+                serialization.save_file(hdr_path,hdr)
                 self.outputs['header_paths'].append(hdr_path)
 
         # fetch images
@@ -1,12 +1,14 @@
 from collections import OrderedDict
+import multiprocessing
 import time
 import copy
 import os
 
 import numpy as np
-import fabio
 
 from ..Workflow import Workflow
+from ...patternstore import PatternStore
+from ...imagetools import ImageHandle, read_image
 from ...pawstools import primitives
 
 inputs = OrderedDict(
@@ -15,7 +17,15 @@ inputs = OrderedDict(
     image_paths=[],
     n_points=1000,
     polz_factor=1.,
-    output_dir=None
+    output_dir=None,
+    n_processes=1,
+    calib_file=None,
+    q_min=0.,
+    q_max=1.,
+    error_model='poisson',
+    variances=[],
+    store_path=None,
+    times=[]
     )
 
 outputs = OrderedDict(
@@ -24,25 +34,182 @@ outputs = OrderedDict(
     )
 
 class IntegrateBatch(Workflow):
+    """Integrate a batch of images, and optionally save the results as .dat files.
+
+    If n_processes is greater than one, 
+    the images are spread over a pool of worker processes.
+    Each worker builds its own integrator once,
+    with the class and settings of the integrator input (see PyFAIIntegrator.worker_settings()),
+    or, if no integrator is provided, as a PyFAIIntegrator
+    from calib_file and the q range (q_min, q_max),
+    and then opens, integrates and saves its share of the images. 
+    The results are collected in the order of the inputs,
+    and they are the same as the results of the serial path.
+    Integrators without worker_settings() can only be used with n_processes=1.
+
+    If images is an n_images-by-H-by-W array (e.g. a memory-mapped stack),
+    it is integrated in one call to the integrator's integrate_stack().
+
+    Unless error_model is None, the pixel variances 
+    (from the variances input, or from Poisson statistics if variances are not provided)
+    are propagated in the same pass, and the results have a third (dI) column.
+
+    If store_path is provided, the results are appended to the PatternStore at store_path,
+    along with their times (if provided) and image file paths.
+    """
 
     def __init__(self):
         super(IntegrateBatch,self).__init__(inputs,outputs)
 
     def run(self):
-        if self.inputs['images']:
+        img_paths = self.inputs['image_paths']
+        with_err = self.inputs['error_model'] is not None
+        if self.inputs['integrator'] is None and not \
+        (self.inputs['n_processes'] > 1 and self.inputs['calib_file']):
+            self.message_callback('no integrator: provide an integrator, '
+                'or a calib_file (with n_processes > 1)')
+            return self.outputs
+        if isinstance(self.inputs['images'],np.ndarray) and self.inputs['n_processes'] <= 1:
+            return self.run_stack()
+        if len(self.inputs['images']) > 0:
             imgs = self.inputs['images']
         else:
-            imgs = [fabio.open(imgp).data for imgp in self.inputs['image_paths']]
-        for img,imgp in zip(imgs,self.inputs['image_paths']):
-            q,I = self.inputs['integrator'].integrate_to_1d(img,
-                npt=self.inputs['n_points'],
-                polz_factor=self.inputs['polz_factor'])
-            q_I = np.array([q,I]).T
+            imgs = [None for imgp in img_paths]
+        if not img_paths:
+            img_paths = [None for img in imgs]
+        vars_ = self.inputs['variances']
+        if not with_err or len(vars_) == 0:
+            vars_ = [None for img in imgs]
+        npt = self.inputs['n_points']
+        polz = self.inputs['polz_factor']
+        out_dir = self.inputs['output_dir']
+        if self.inputs['n_processes'] > 1:
+            integ = self.inputs['integrator']
+            if integ is None:
+                from ...plugins.PyFAIIntegrator import PyFAIIntegrator
+                integ_cls = PyFAIIntegrator
+                integ_kwargs = dict(calib_file=self.inputs['calib_file'],
+                    q_min=self.inputs['q_min'],q_max=self.inputs['q_max'])
+            elif hasattr(integ,'worker_settings'):
+                integ_cls, integ_kwargs = integ.worker_settings()
+            else:
+                self.message_callback('{} cannot be rebuilt in worker processes: '
+                    'use n_processes=1'.format(type(integ).__name__))
+                return self.outputs
+            self.message_callback('integrating {} images with {} processes'.format(
+                len(imgs),self.inputs['n_processes']))
+            pool = multiprocessing.Pool(self.inputs['n_processes'],
+                initializer=init_worker,initargs=(integ_cls,integ_kwargs))
+            try:
+                tasks = [(img,imgp,npt,polz,out_dir,with_err,var) 
+                    for img,imgp,var in zip(imgs,img_paths,vars_)]
+                results = pool.map(integrate_task,tasks,
+                    chunksize=max(1,len(tasks)//(4*self.inputs['n_processes'])))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [integrate_image(self.inputs['integrator'],img,imgp,npt,polz,out_dir,with_err,var) 
+                for img,imgp,var in zip(imgs,img_paths,vars_)]
+        for q_I,dat_path in results:
             self.outputs['data'].append(q_I)
-            if self.inputs['output_dir']:
-                dat_fn = os.path.splitext(os.path.split(imgp)[1])[0]+'.dat'
-                dat_path = os.path.join(self.inputs['output_dir'],dat_fn)
-                np.savetxt(dat_path,q_I,delimiter=' ',header='q (1/Angstrom), I (arb)')
+            if dat_path:
                 self.outputs['data_paths'].append(dat_path)
+        self.save_to_store(img_paths)
         return self.outputs
 
+    def run_stack(self):
+        # images is an n_images-by-H-by-W array: integrate it in one call
+        integ = self.inputs['integrator']
+        npt = self.inputs['n_points']
+        polz = self.inputs['polz_factor']
+        if self.inputs['error_model'] is None:
+            q,I_stack = integ.integrate_stack(self.inputs['images'],npt,polz)
+            cols = [[q,I] for I in I_stack]
+        else:
+            var_stack = self.inputs['variances']
+            if len(var_stack) == 0:
+                var_stack = None
+            q,I_stack,dI_stack = integ.integrate_stack_with_error(
+                self.inputs['images'],npt,polz,var_stack)
+            cols = [[q,I,dI] for I,dI in zip(I_stack,dI_stack)]
+        img_paths = self.inputs['image_paths']
+        if not img_paths:
+            img_paths = [None for I in I_stack]
+        for c,imgp in zip(cols,img_paths):
+            q_I = np.array(c).T
+            self.outputs['data'].append(q_I)
+            dat_path = save_dat(q_I,imgp,self.inputs['output_dir'])
+            if dat_path:
+                self.outputs['data_paths'].append(dat_path)
+        self.save_to_store(img_paths)
+        return self.outputs
+
+    def save_to_store(self,img_paths):
+        if not self.inputs['store_path'] or not self.outputs['data']:
+            return
+        data = self.outputs['data']
+        store = PatternStore(self.inputs['store_path'],data[0][:,0])
+        dI = None
+        if data[0].shape[1] > 2:
+            dI = np.array([q_I[:,2] for q_I in data])
+        times = None
+        if len(self.inputs['times']) > 0:
+            times = self.inputs['times']
+        store.append(np.array([q_I[:,1] for q_I in data]),dI,time=times,
+            header=[{'image_file':imgp} for imgp in img_paths])
+        self.message_callback('saved {} patterns to {}'.format(len(data),self.inputs['store_path']))
+
+def integrate_image(integrator,img,img_path,n_points,polz_factor,output_dir=None,
+    with_error=False,variance=None):
+    """Integrate one image, and save the result if output_dir is provided.
+
+    If img is None, the image is read from img_path
+    (memory-mapped, if it is an uncompressed TIFF).
+    img can also be an ImageHandle (e.g. from the image_data output of Read).
+    Returns the n_points-by-2 array of q and I 
+    (n_points-by-3, with dI, if with_error), 
+    and the path to the saved .dat file (or None).
+    """
+    if img is None:
+        img = read_image(img_path,mmap=True)[0]
+    elif isinstance(img,ImageHandle):
+        img = img.data
+    if with_error:
+        q,I,dI = integrator.integrate_to_1d_with_error(img,npt=n_points,
+            polz_factor=polz_factor,variance=variance)
+        q_I = np.array([q,I,dI]).T
+    else:
+        q,I = integrator.integrate_to_1d(img,npt=n_points,polz_factor=polz_factor)
+        q_I = np.array([q,I]).T
+    dat_path = save_dat(q_I,img_path,output_dir)
+    return q_I, dat_path
+
+def save_dat(q_I,img_path,output_dir=None):
+    """Save q_I to output_dir, named after img_path.
+
+    Returns the path to the saved .dat file,
+    or None if output_dir or img_path is not provided.
+    """
+    dat_path = None
+    if output_dir and img_path:
+        dat_fn = os.path.splitext(os.path.split(img_path)[1])[0]+'.dat'
+        dat_path = os.path.join(output_dir,dat_fn)
+        hdr = 'q (1/Angstrom), I (arb)'
+        if q_I.shape[1] > 2:
+            hdr += ', dI (arb)'
+        np.savetxt(dat_path,q_I,delimiter=' ',header=hdr)
+    return dat_path
+
+# each worker process keeps its own integrator
+_worker_integrator = None
+
+def init_worker(integrator_class,integrator_kwargs):
+    """Build the integrator for a worker process."""
+    global _worker_integrator
+    _worker_integrator = integrator_class(**integrator_kwargs)
+    _worker_integrator.message_callback = lambda msg: None
+    _worker_integrator.start()
+
+def integrate_task(task):
+    return integrate_image(_worker_integrator,*task)
@@ -6,43 +6,114 @@ import os
 import numpy as np 
 
 from ..Workflow import Workflow
+from ...patternstore import PatternStore
+from ... import datcache
 from ...pawstools import primitives
 from ...operations.ZINGERS.EasyZingers1d import EasyZingers1d
+from ...operations.ZINGERS.EasyZingers1dBatch import EasyZingers1dBatch
 
 inputs = OrderedDict(
     q_I_arrays=[],
     q_I_paths=[],
+    q=None,
+    I_stack=None,
     sharpness_limit=40.,
     window_width=10,
-    output_dir=None
+    output_dir=None,
+    store_path=None,
+    times=[]
     )
 
 outputs = OrderedDict(
     data=[],
-    data_paths=[]
+    data_paths=[],
+    I_dz_stack=None,
+    zmask_stack=None
     )
 
 class DezingerBatch(Workflow):
+    """Remove zingers from a batch of 1d spectra.
+
+    Spectra can be provided as a list of n-by-2 arrays (q_I_arrays),
+    as a list of files (q_I_paths),
+    or as an n_patterns-by-n_q stack of intensities (I_stack)
+    sampled on a shared q grid (q, which is required with I_stack).
+    If all spectra share the same q grid, 
+    they are dezingered together in one stacked pass,
+    and the stacked outputs (I_dz_stack, zmask_stack) are filled in.
+    Otherwise, the spectra are dezingered one at a time.
+
+    If store_path is provided, the dezingered spectra 
+    are appended to the PatternStore at store_path,
+    with the zinger masks and the times (if provided).
+    This requires the spectra to share the same q grid.
+    """
 
     def __init__(self):
         super(DezingerBatch,self).__init__(inputs,outputs)
 
     def run(self):
-        dz = EasyZingers1d()
-        if self.inputs['q_I_arrays']:
-            q_I_arrs = self.inputs['q_I_arrays']
+        q_I_paths = self.inputs['q_I_paths']
+        if self.inputs['I_stack'] is not None:
+            I_stack = np.asarray(self.inputs['I_stack'],dtype=float)
+            if self.inputs['q'] is None or not np.shape(self.inputs['q']) == I_stack.shape[-1:]:
+                self.message_callback('I_stack requires a q grid '
+                    'with one value per column of I_stack')
+                return self.outputs
+            q = np.asarray(self.inputs['q'],dtype=float)
         else:
-            q_I_arrs = [np.loadtxt(datp) for datp in self.inputs['q_I_paths']]
-        for q_I,q_I_path in zip(q_I_arrs,self.inputs['q_I_paths']):
-            dz_out = dz.run_with(q_I=q_I,
+            if self.inputs['q_I_arrays']:
+                q_I_arrs = self.inputs['q_I_arrays']
+            else:
+                q_I_arrs = [datcache.load_dat(datp) for datp in q_I_paths]
+            q = None
+            I_stack = None
+            if q_I_arrs and all([np.array_equal(q_I[:,0],q_I_arrs[0][:,0]) for q_I in q_I_arrs]):
+                q = q_I_arrs[0][:,0]
+                I_stack = np.array([q_I[:,1] for q_I in q_I_arrs])
+        if not q_I_paths:
+            q_I_paths = [None]*(len(I_stack) if I_stack is not None else len(q_I_arrs))
+
+        if I_stack is not None:
+            dz = EasyZingers1dBatch()
+            dz.zero_copy = self.zero_copy
+            dz.message_callback = self.message_callback
+            dz_out = dz.run_with(q=q,I_stack=I_stack,
                 sharpness_limit=self.inputs['sharpness_limit'],
                 window_width=self.inputs['window_width'])
-            q_I_dz = dz_out['q_I_dz'] 
+            # the n_patterns-by-n_q-by-2 q_I stack holds all of the dezingered data:
+            # the outputs are views of it
+            q_I_dz_stack = np.empty(I_stack.shape+(2,))
+            q_I_dz_stack[:,:,0] = q
+            q_I_dz_stack[:,:,1] = dz_out['I_dz_stack']
+            self.outputs['I_dz_stack'] = q_I_dz_stack[:,:,1]
+            self.outputs['zmask_stack'] = dz_out['zmask_stack']
+            q_I_dz_arrs = list(q_I_dz_stack)
+        else:
+            dz = EasyZingers1d()
+            dz.zero_copy = self.zero_copy
+            q_I_dz_arrs = []
+            for q_I in q_I_arrs:
+                dz_out = dz.run_with(q_I=q_I,
+                    sharpness_limit=self.inputs['sharpness_limit'],
+                    window_width=self.inputs['window_width'])
+                q_I_dz_arrs.append(dz_out['q_I_dz'])
+
+        for q_I_dz,q_I_path in zip(q_I_dz_arrs,q_I_paths):
             self.outputs['data'].append(q_I_dz)
-            if self.inputs['output_dir']:
+            if self.inputs['output_dir'] and q_I_path:
                 dz_fn = os.path.splitext(os.path.split(q_I_path)[1])[0]+'_dz.dat'
                 dz_path = os.path.join(self.inputs['output_dir'],dz_fn)
                 np.savetxt(dz_path,q_I_dz,delimiter=' ',header='q (1/Angstrom), I (arb)')
                 self.outputs['data_paths'].append(dz_path)
-        return self.outputs
 
+        if self.inputs['store_path']:
+            if I_stack is None:
+                raise ValueError('spectra must share a q grid to be saved to a PatternStore')
+            times = None
+            if len(self.inputs['times']) > 0:
+                times = self.inputs['times']
+            store = PatternStore(self.inputs['store_path'],q)
+            store.append(self.outputs['I_dz_stack'],mask=self.outputs['zmask_stack'],
+                time=times,header=[{'q_I_file':p} for p in q_I_paths])
+        return self.outputs
@@ -6,6 +6,8 @@ from .Read import Read
 
 class ReadBatch(ReadBatch_new.ReadBatch):
 
+    header_format = 'spec'
+
     def __init__(self):
         super(ReadBatch,self).__init__()
         # replace reader with legacy reader
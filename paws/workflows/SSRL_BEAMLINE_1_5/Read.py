@@ -3,14 +3,13 @@ import copy
 import os
 
 from xrsdkit.tools import ymltools as xrsdyml
-import fabio
-import yaml
-import numpy as np
 
 from ..Workflow import Workflow 
+from ... import datcache, serialization
+from ...imagetools import ImageHandle
 
 # NOTE: this workflow is for reading samples
-# that were saved with YAML headers
+# that were saved with YAML (or JSON) headers
 
 inputs = OrderedDict(
     header_file = None,
@@ -29,12 +28,18 @@ outputs = OrderedDict(
     )
 
 class Read(Workflow):
+    """Read the header, image, q_I and xrsd system files of one sample.
+
+    The image is output as an ImageHandle,
+    which reads the image file only when its pixels are accessed.
+    Uncompressed TIFF images are memory-mapped rather than decoded.
+    """
 
     def __init__(self):
         super(Read,self).__init__(inputs,outputs)
 
     def read_header(self,filepath):
-        return yaml.load(open(filepath,'r'))
+        return serialization.load_file(filepath)
 
     def run(self):
         self.outputs = copy.deepcopy(outputs)
@@ -47,16 +52,16 @@ class Read(Workflow):
             self.message_callback('header file not found: {}'.format(self.inputs['header_file']))
 
         if (self.inputs['image_file']) and (os.path.exists(self.inputs['image_file'])):
-            self.outputs['image_data'] = fabio.open(self.inputs['image_file'])
+            self.outputs['image_data'] = ImageHandle(self.inputs['image_file'],mmap=True)
         elif self.inputs['image_file']:
             self.message_callback('image file not found: {}'.format(self.inputs['image_file']))
 
         if (self.inputs['q_I_file']) and (os.path.exists(self.inputs['q_I_file'])):
-            q_I = np.loadtxt(self.inputs['q_I_file'],dtype='float') 
+            q_I = datcache.load_dat(self.inputs['q_I_file'])
             dI = None
             if (q_I is not None) and (q_I.shape[1] > 2):
-                q_I = q_I[:,:2]
                 dI = q_I[:,2]
+                q_I = q_I[:,:2]
             self.outputs['q_I'] = q_I
             self.outputs['dI'] = dI
         elif self.inputs['q_I_file']:
@@ -1,10 +1,13 @@
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from multiprocessing.pool import ThreadPool
+import threading
 import os
 import copy
 
 from ..Workflow import Workflow 
 from . import Read
 from ...operations.FILESYSTEM.BuildFileList import BuildFileList
+from ...headerindex import HeaderIndex
 
 inputs = OrderedDict(
     header_dir = '',
@@ -19,7 +22,13 @@ inputs = OrderedDict(
     q_I_ext = '.dat',
     system_dir = '',
     system_suffix = '',
-    system_ext = '.yml'
+    system_ext = '.yml',
+    header_index = None,
+    t_min = None,
+    t_max = None,
+    header_fields = {},
+    n_threads = 1,
+    max_in_flight = None
     )
 
 outputs = copy.deepcopy(Read.outputs)
@@ -33,6 +42,24 @@ outputs.update(
     )
 
 class ReadBatch(Workflow):
+    """Read a batch of samples, found by their header files.
+
+    If header_index (the path to a HeaderIndex database) is provided,
+    the index is updated for header_dir (reading only new or modified headers),
+    and the samples are selected from the index, in order of time,
+    by time window (t_min, t_max) and header field values (header_fields,
+    see HeaderIndex.select()), without reading the unselected headers.
+
+    If n_threads is greater than one, the samples are read 
+    by a pool of threads, each with its own reader,
+    so that the (often latency-bound) file reads overlap.
+    At most max_in_flight samples (default: 2*n_threads) 
+    are read ahead of the sample being collected,
+    and the outputs are collected in the order of the headers.
+    """
+
+    # format of the header files, for HeaderIndex
+    header_format = 'yaml'
 
     def __init__(self):
         super(ReadBatch,self).__init__(inputs,outputs)
@@ -42,11 +69,21 @@ class ReadBatch(Workflow):
     def run(self):
         # initialize outputs in case of Workflow re-use!
         self.outputs = copy.deepcopy(outputs)
-        self.list_header_files.run_with(
-            dir_path = self.inputs['header_dir'],
-            regex = self.inputs['header_regex']
-            )
-        header_file_list = self.list_header_files.outputs['file_list']
+        if self.inputs['header_index']:
+            hdr_index = HeaderIndex(self.inputs['header_index'])
+            hdr_index.message_callback = self.message_callback
+            n_read = hdr_index.update(self.inputs['header_dir'],
+                self.inputs['header_regex'],self.header_format)
+            self.message_callback('indexed {} new or modified headers'.format(n_read))
+            header_file_list = hdr_index.select(self.inputs['header_dir'],
+                self.inputs['t_min'],self.inputs['t_max'],self.inputs['header_fields'])
+            hdr_index.close()
+        else:
+            self.list_header_files.run_with(
+                dir_path = self.inputs['header_dir'],
+                regex = self.inputs['header_regex']
+                )
+            header_file_list = self.list_header_files.outputs['file_list']
         self.outputs['header_files'] = header_file_list
         filename_list = [os.path.splitext(os.path.split(hf)[1])[0] for hf in header_file_list]
         hdr_fn_sfx = self.inputs['header_suffix']
@@ -79,17 +116,49 @@ class ReadBatch(Workflow):
         self.outputs['system_files'] = system_file_list
 
         n_hdrs = len(filename_list)
+        self.reader.zero_copy = self.zero_copy
         self.message_callback('STARTING BATCH ({})'.format(n_hdrs))
-        for ihdr, hdr_fn, img_fn, q_I_fn, sys_fn in zip(range(n_hdrs),
-        header_file_list,image_file_list,q_I_file_list,system_file_list):
+        file_sets = list(zip(header_file_list,image_file_list,q_I_file_list,system_file_list))
+        if self.inputs['n_threads'] > 1:
+            all_outs = self.prefetch(file_sets)
+        else:
+            all_outs = (self.read_sample(self.reader,*fs) for fs in file_sets)
+        for ihdr,outs in enumerate(all_outs):
             self.message_callback('RUNNING {} / {}'.format(ihdr+1,n_hdrs))
-            outs = self.reader.run_with(
-                header_file = hdr_fn,
-                image_file = img_fn,
-                q_I_file = q_I_fn,
-                system_file = sys_fn
-                )        
             for out_key, out_data in outs.items():
                 self.outputs[out_key].append(out_data)
         return self.outputs
 
+    def read_sample(self,reader,hdr_fn,img_fn,q_I_fn,sys_fn):
+        return reader.run_with(
+            header_file = hdr_fn,
+            image_file = img_fn,
+            q_I_file = q_I_fn,
+            system_file = sys_fn
+            )        
+
+    def prefetch(self,file_sets):
+        """Read file_sets in a thread pool, yielding the outputs in order."""
+        n_threads = self.inputs['n_threads']
+        max_in_flight = self.inputs['max_in_flight'] or 2*n_threads
+        # each thread gets its own reader (Workflows are not thread-safe)
+        local = threading.local()
+        def read_task(fs):
+            if not hasattr(local,'reader'):
+                local.reader = type(self.reader)()
+                local.reader.zero_copy = self.zero_copy
+                local.reader.message_callback = self.message_callback
+            return self.read_sample(local.reader,*fs)
+        # at most max_in_flight tasks are submitted ahead of the one being collected
+        pending = deque()
+        pool = ThreadPool(n_threads)
+        try:
+            for fs in file_sets:
+                if len(pending) >= max_in_flight:
+                    yield pending.popleft().get()
+                pending.append(pool.apply_async(read_task,(fs,)))
+            while pending:
+                yield pending.popleft().get()
+        finally:
+            pool.terminate()
+            pool.join()
@@ -1,20 +1,45 @@
 import copy
+import os
 from collections import OrderedDict
 
+import numpy as np
+
 from . import ReadBatch
 from ..Workflow import Workflow 
 from ...operations.SORTING.SortBatch import SortBatch
+from ...patternstore import PatternStore
 
 inputs = copy.deepcopy(ReadBatch.inputs)
 inputs.update(
     lower_index = None,
     upper_index = None,
-    index_step = 1
+    index_step = 1,
+    store_path = None
     )
 
 outputs = copy.deepcopy(ReadBatch.outputs)
+outputs.update(
+    q = None,
+    I_stack = None,
+    dI_stack = None,
+    mask_stack = None
+    )
 
 class ReadTimeSeries(Workflow):
+    """Read a series of samples, sorted by time.
+
+    If store_path is provided, the series is read from the PatternStore at store_path
+    (see paws.patternstore), optionally within a time window (t_min, t_max).
+    The patterns are output only as stacks (q, I_stack, dI_stack, mask_stack),
+    along with the per-pattern time, header_data and file names:
+    the per-pattern q_I and dI outputs are not filled in.
+    If the selection is a regular slice of the store, the stacks are views 
+    of the memory-mapped store arrays, so nothing is read until they are used- 
+    but run_with() deep-copies its outputs (reading the whole selection)
+    unless zero_copy is set, so set zero_copy to keep them memory-mapped.
+
+    Otherwise, the samples are read from their individual files by ReadBatch.
+    """
 
     def __init__(self):
         super(ReadTimeSeries,self).__init__(inputs,outputs)
@@ -22,6 +47,10 @@ class ReadTimeSeries(Workflow):
         self.sorter = SortBatch()
 
     def run(self):
+        if self.inputs['store_path']:
+            return self.read_store()
+        self.batch_reader.zero_copy = self.zero_copy
+        self.sorter.zero_copy = self.zero_copy
         read_inputs = OrderedDict([(k,self.inputs[k]) for k in ReadBatch.inputs.keys()])
         batch_outputs = self.batch_reader.run_with(**read_inputs) 
         self.sorter.run_with(
@@ -36,3 +65,32 @@ class ReadTimeSeries(Workflow):
         self.outputs.update(self.sorter.outputs['sorted_outputs'])
         return self.outputs
 
+    def read_store(self):
+        store = PatternStore(self.inputs['store_path'])
+        t = np.asarray(store.time)
+        ix = store.select_time(self.inputs['t_min'],self.inputs['t_max'])
+        ix = ix[self.inputs['lower_index']:self.inputs['upper_index']:self.inputs['index_step']]
+        self.message_callback('reading {} patterns from {}'.format(len(ix),self.inputs['store_path']))
+        if len(ix) > 0 and np.all(np.diff(ix) == self.inputs['index_step']):
+            # the selection is a regular slice: keep the memory-mapped rows
+            sl = slice(ix[0],ix[-1]+1,self.inputs['index_step'])
+            I, dI, mask = store.I[sl], store.dI[sl], store.mask[sl]
+        else:
+            I, dI, mask = store.I[ix], store.dI[ix], store.mask[ix]
+        hdrs = store.headers()
+        for k in ReadBatch.outputs.keys():
+            self.outputs[k] = [None for i in ix]
+        self.outputs['time'] = [float(t[i]) for i in ix]
+        self.outputs['header_data'] = [hdrs[i] for i in ix]
+        for i,hdr in enumerate(self.outputs['header_data']):
+            data_file = hdr.get('image_file') or hdr.get('q_I_file')
+            if data_file:
+                self.outputs['filenames'][i] = os.path.splitext(os.path.split(data_file)[1])[0]
+            self.outputs['image_files'][i] = hdr.get('image_file')
+            self.outputs['q_I_files'][i] = hdr.get('q_I_file')
+        self.outputs['q'] = store.q
+        self.outputs['I_stack'] = I
+        self.outputs['dI_stack'] = dI
+        self.outputs['mask_stack'] = mask
+        return self.outputs
+
@@ -1,6 +1,9 @@
 from __future__ import print_function
+import os
 import copy
 
+from .. import pawstools
+
 class Workflow(object):
     """Workflows use PAWS Operations and Plugins to do useful things."""
 
@@ -10,6 +13,9 @@ class Workflow(object):
         self.log_file = None
         self.message_callback = self.tagged_print
         self.stop_flag = False
+        # if zero_copy is set, run_with() avoids deep-copying its defaults 
+        # and its return value- see run_with() 
+        self.zero_copy = False
 
         self.default_inputs = copy.deepcopy(inputs)
         self.default_outputs = copy.deepcopy(outputs)
@@ -46,10 +52,19 @@ class Workflow(object):
         then updates the inputs with the keyword arguments,
         then returns a copy of the return value of the Workflow's run() function
         (often, the return value of run() will be the Workflow outputs).
+
+        If self.zero_copy is True, only the containers (dicts and lists)
+        of the defaults and the return value are copied,
+        and any arrays in the return value are returned as read-only views.
         """
         for k in kwargs.keys():
             if not k in self.inputs:
                 raise ValueError('Input {} is not valid for Workflow {}'.format(k,type(self).__name__))
+        if self.zero_copy:
+            self.inputs = pawstools.copy_containers(self.default_inputs)
+            self.outputs = pawstools.copy_containers(self.default_outputs)
+            self.inputs.update(kwargs)
+            return pawstools.readonly_view(self.run())
         self.inputs = copy.deepcopy(self.default_inputs)
         self.outputs = copy.deepcopy(self.default_outputs)
         self.inputs.update(kwargs)
@@ -0,0 +1,10 @@
+import pytest
+
+from paws import datcache
+
+@pytest.fixture(autouse=True,scope='session')
+def dat_cache_dir(tmpdir_factory):
+    # keep the .dat cache out of the user's home directory
+    datcache.configure(cache_dir=str(tmpdir_factory.mktemp('dat_cache')))
+    yield
+    datcache.configure(cache_dir=datcache.default_cache_dir)
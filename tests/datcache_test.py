@@ -0,0 +1,63 @@
+import os
+import time
+
+import numpy as np
+
+from paws import datcache
+
+def test_dat_cache(tmpdir):
+    tmp_dir = str(tmpdir)
+    cache_dir = os.path.join(tmp_dir,'cache')
+    prev_cache_dir = datcache.cache_dir
+    datcache.configure(cache_dir=cache_dir)
+    dat_paths = []
+    for i in range(5):
+        dat_path = os.path.join(tmp_dir,'test{}.dat'.format(i))
+        np.savetxt(dat_path,np.random.rand(100,3),header='q (1/Angstrom), I (arb), dI (arb)')
+        dat_paths.append(dat_path)
+    q_I_arrs = [datcache.load_dat(p) for p in dat_paths]
+    assert len(os.listdir(cache_dir)) == 5
+    for p,q_I in zip(dat_paths,q_I_arrs):
+        assert np.array_equal(datcache.load_dat(p),np.loadtxt(p))
+        assert np.array_equal(datcache.load_dat(p,mmap_mode='r'),q_I)
+    # a modified file is parsed again
+    time.sleep(0.01)
+    np.savetxt(dat_paths[0],np.ones((10,3)))
+    assert np.array_equal(datcache.load_dat(dat_paths[0]),np.ones((10,3)))
+    # entries are evicted to keep the cache under its size limit
+    entry_size = os.path.getsize(datcache.cache_path(dat_paths[1]))
+    datcache.configure(max_size=3*entry_size)
+    np.savetxt(dat_paths[1],np.zeros((100,3)))
+    datcache.load_dat(dat_paths[1])
+    assert sum(sz for fp,sz,t in datcache.cache_entries()) <= 3*entry_size
+    assert os.path.exists(datcache.cache_path(dat_paths[1]))
+    # an unusable cache directory does not prevent reading
+    datcache.configure(cache_dir=os.path.join(dat_paths[2],'cache'))
+    assert np.array_equal(datcache.load_dat(dat_paths[2]),np.loadtxt(dat_paths[2]))
+    datcache.configure(cache_dir=prev_cache_dir,max_size=datcache.default_max_size)
+
+def test_dat_cache_replaced_file(tmpdir,monkeypatch):
+    tmp_dir = str(tmpdir)
+    prev_cache_dir = datcache.cache_dir
+    datcache.configure(cache_dir=os.path.join(tmp_dir,'cache'))
+    dat_path = os.path.join(tmp_dir,'test.dat')
+    np.savetxt(dat_path,np.zeros((10,3)))
+    datcache.load_dat(dat_path)
+    # a file replaced by one of the same size and mtime is parsed again
+    st = os.stat(dat_path)
+    new_path = os.path.join(tmp_dir,'new.dat')
+    np.savetxt(new_path,np.ones((10,3)))
+    assert os.path.getsize(new_path) == st.st_size
+    os.utime(new_path,(st.st_atime,st.st_mtime))
+    os.rename(new_path,dat_path)
+    assert np.array_equal(datcache.load_dat(dat_path),np.ones((10,3)))
+    # cached arrays are returned even if the entries cannot be touched
+    def read_only_utime(*args,**kwargs):
+        raise OSError('read-only file system')
+    def no_loadtxt(*args,**kwargs):
+        raise AssertionError('the file was parsed again')
+    monkeypatch.setattr(os,'utime',read_only_utime)
+    monkeypatch.setattr(np,'loadtxt',no_loadtxt)
+    assert np.array_equal(datcache.load_dat(dat_path),np.ones((10,3)))
+    monkeypatch.undo()
+    datcache.configure(cache_dir=prev_cache_dir)
@@ -0,0 +1,63 @@
+import os
+import glob
+
+import yaml
+
+from paws.headerindex import HeaderIndex
+from paws.workflows.SSRL_BEAMLINE_1_5.ReadTimeSeries import ReadTimeSeries
+
+data_dir = os.path.join(os.path.dirname(__file__),'test_data')
+
+def test_header_index(tmpdir):
+    tmp_dir = str(tmpdir)
+    hdr_dir = os.path.join(tmp_dir,'headers')
+    os.mkdir(hdr_dir)
+    for i in range(6):
+        hdr = dict(time=1000.+10*i,temperature=20.+i,reaction_id='r{}'.format(i%2))
+        with open(os.path.join(hdr_dir,'test{}.yml'.format(i)),'w') as f:
+            yaml.dump(hdr,f)
+    idx = HeaderIndex(os.path.join(tmp_dir,'index.sqlite'))
+    assert idx.update(hdr_dir) == 6
+    assert idx.update(hdr_dir) == 0
+    sel = idx.select(hdr_dir,t_min=1015.,fields={'reaction_id':'r1','temperature':(20.,25.)})
+    assert [os.path.basename(p) for p in sel] == ['test3.yml']
+    # modified and removed files are re-indexed
+    with open(os.path.join(hdr_dir,'test0.yml'),'w') as f:
+        yaml.dump(dict(time=2000.,temperature=0.,reaction_id='r2'),f)
+    os.remove(os.path.join(hdr_dir,'test5.yml'))
+    assert idx.update(hdr_dir) == 1
+    assert [os.path.basename(p) for p in idx.select(hdr_dir)] \
+        == ['test1.yml','test2.yml','test3.yml','test4.yml','test0.yml']
+    # legacy SPEC headers
+    spec_dir = os.path.join(data_dir,'headers','legacy')
+    assert idx.update(spec_dir,'*.txt','spec') == 2
+    assert idx.header(os.path.join(spec_dir,'test2.txt'))['User'] == 'Grinch'
+    assert len(idx.select(spec_dir,fields={'temperature':(1000.,2000.)})) == 1
+    idx.close()
+
+    rd = ReadTimeSeries()
+    rd.message_callback = lambda msg: None
+    outs = rd.run_with(header_dir=hdr_dir,header_index=os.path.join(tmp_dir,'index.sqlite'),
+        t_min=1000.,t_max=1035.)
+    assert outs['time'] == [1010.,1020.,1030.]
+
+def test_header_index_bad_files(tmpdir,monkeypatch):
+    hdr_dir = str(tmpdir.mkdir('headers'))
+    for i in range(3):
+        with open(os.path.join(hdr_dir,'test{}.yml'.format(i)),'w') as f:
+            yaml.dump(dict(time=1000.+i,sample=u'sample{}'.format(i)),f)
+    with open(os.path.join(hdr_dir,'bad.yml'),'w') as f:
+        f.write('time: [1000.\n')
+    # a file that is removed after it is listed
+    real_glob = glob.glob
+    monkeypatch.setattr(glob,'glob',lambda pattern: real_glob(pattern)+[os.path.join(hdr_dir,'gone.yml')])
+    msgs = []
+    idx = HeaderIndex(str(tmpdir.join('index.sqlite')))
+    idx.message_callback = msgs.append
+    # the other files are still indexed
+    assert idx.update(hdr_dir) == 3
+    assert len(msgs) == 2
+    assert any('bad.yml' in msg for msg in msgs)
+    assert any('gone.yml' in msg for msg in msgs)
+    assert [os.path.basename(p) for p in idx.select(hdr_dir,fields={'sample':u'sample1'})] == ['test1.yml']
+    idx.close()
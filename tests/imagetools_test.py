@@ -0,0 +1,78 @@
+import copy
+import os
+import pickle
+
+import numpy as np
+import fabio
+import pytest
+
+from paws import imagetools
+from paws.imagetools import ImageHandle
+from paws.workflows.SSRL_BEAMLINE_1_5.Read import Read
+
+img_path = os.path.join(os.path.dirname(__file__),'test_data','images','test1.tif')
+
+def test_image_handle():
+    h = ImageHandle(img_path)
+    assert not h.loaded
+    # copies carry only the path
+    assert not copy.deepcopy(h).loaded
+    assert np.array_equal(h.data,fabio.open(img_path).data)
+    assert h.loaded
+    assert not copy.deepcopy(h).loaded
+    assert not pickle.loads(pickle.dumps(h)).loaded
+    assert np.array_equal(np.asarray(h),h.data)
+    h.release()
+    assert not h.loaded
+    # the loaded handles are kept within the memory budget
+    handles = [ImageHandle(img_path) for i in range(5)]
+    nbytes = handles[0].data.nbytes
+    imagetools.set_memory_budget(2*nbytes)
+    for hh in handles:
+        hh.load()
+    assert [hh.loaded for hh in handles] == [False,False,False,True,True]
+    assert imagetools.loaded_bytes() <= 2*nbytes
+    imagetools.set_memory_budget(None)
+
+def test_read_image_handle():
+    rd = Read()
+    rd.message_callback = lambda msg: None
+    outs = rd.run_with(image_file=img_path)
+    assert isinstance(outs['image_data'],ImageHandle)
+    assert not outs['image_data'].loaded
+    assert outs['image_data'].data.shape == fabio.open(img_path).data.shape
+
+def test_tiff_memmap():
+    # the test image is an uncompressed 8-bit TIFF
+    data, hdr = imagetools.read_image(img_path,mmap=True)
+    assert isinstance(data,np.memmap)
+    assert hdr is None
+    assert np.array_equal(data,fabio.open(img_path).data)
+    h = ImageHandle(img_path,mmap=True)
+    assert np.array_equal(h.data,data)
+    assert h.header == dict(fabio.open(img_path).header)
+
+def test_tiff_memmap_dtypes(tmpdir):
+    from fabio.tifimage import TifImage
+    arrs = [
+        (np.random.rand(30,20)*60000).astype(np.uint16),
+        (np.random.rand(30,20)*1e6).astype(np.int32),
+        np.random.rand(30,20).astype(np.float32)]
+    for i,arr in enumerate(arrs):
+        fp = str(tmpdir.join('img{}.tif'.format(i)))
+        TifImage(data=arr).write(fp)
+        data = imagetools.tiff_memmap(fp)
+        assert data.dtype == arr.dtype
+        assert np.array_equal(data,arr)
+        assert np.array_equal(data,fabio.open(fp).data)
+
+def test_tiff_fallback(tmpdir):
+    Image = pytest.importorskip('PIL.Image')
+    arr = (np.random.rand(30,20)*60000).astype(np.uint16)
+    # compressed images are decoded by fabio
+    fp = str(tmpdir.join('img_lzw.tif'))
+    Image.fromarray(arr).save(fp,compression='tiff_lzw')
+    assert imagetools.tiff_memmap(fp) is None
+    data, hdr = imagetools.read_image(fp,mmap=True)
+    assert not isinstance(data,np.memmap)
+    assert np.array_equal(data,arr)
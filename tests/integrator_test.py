@@ -0,0 +1,94 @@
+import os
+import shutil
+
+import numpy as np
+import fabio
+
+from paws.plugins.PyFAIIntegrator import PyFAIIntegrator
+from paws.plugins.SparseIntegrator import SparseIntegrator
+
+test_dir = os.path.dirname(__file__)
+calib_path = os.path.join(test_dir,'test_data','calib','test.nika')
+img_paths = [os.path.join(test_dir,'test_data','images',fn) for fn in ['test1.tif','test2.tif']]
+
+def start_integrator(integ):
+    integ.message_callback = lambda msg: None
+    integ.start()
+    return integ
+
+def test_sparse_integrator(tmpdir):
+    pyfai_integ = start_integrator(PyFAIIntegrator(calib_path))
+    sparse_integ = start_integrator(SparseIntegrator(calib_path,cache_dir=str(tmpdir)))
+    for img_path in img_paths:
+        img = fabio.open(img_path).data
+        for npt in [20,200]:
+            q,I = pyfai_integ.integrate_to_1d(img,npt)
+            q_sp,I_sp = sparse_integ.integrate_to_1d(img,npt)
+            assert np.allclose(q_sp,q)
+            assert np.allclose(I_sp,I,rtol=1.e-5,atol=1.e-5*np.max(I))
+            q,I,dI = pyfai_integ.integrate_to_1d_with_error(img,npt)
+            q_sp,I_sp,dI_sp = sparse_integ.integrate_to_1d_with_error(img,npt)
+            assert np.allclose(dI_sp,dI,rtol=1.e-5,atol=1.e-5*np.max(dI))
+
+def test_integrator_pool():
+    from multiprocessing.pool import ThreadPool
+    imgs = [fabio.open(p).data for p in img_paths]*6
+    serial_integ = start_integrator(PyFAIIntegrator(calib_path))
+    results = [serial_integ.integrate_to_1d(img,100) for img in imgs]
+    pool_integ = start_integrator(PyFAIIntegrator(calib_path,n_integrators=3))
+    pool = ThreadPool(4)
+    try:
+        pool_results = pool.map(lambda img: pool_integ.integrate_to_1d(img,100),imgs)
+    finally:
+        pool.close()
+        pool.join()
+    for (q,I),(q_p,I_p) in zip(results,pool_results):
+        assert np.array_equal(q_p,q)
+        assert np.allclose(I_p,I)
+    stat = pool_integ.pool_status()
+    assert stat['n_integrators'] == 3
+    assert stat['n_busy'] == 0
+    assert stat['n_integrations'] == len(imgs)
+
+def test_sparse_engine_cache(tmpdir):
+    img = fabio.open(img_paths[0]).data
+    sparse_integ = start_integrator(SparseIntegrator(calib_path,cache_dir=str(tmpdir)))
+    q,I = sparse_integ.integrate_to_1d(img,100)
+    q_fresh,mat_fresh = sparse_integ.build_engine(img.shape,100,0.)
+    # a new integrator loads the saved engine
+    reloaded_integ = start_integrator(SparseIntegrator(calib_path,cache_dir=str(tmpdir)))
+    q_saved,mat_saved = reloaded_integ.get_engine(img.shape,100,0.)
+    assert os.listdir(str(tmpdir)) == [reloaded_integ.engine_key(img.shape,100,0.)]
+    assert np.array_equal(q_saved,q_fresh)
+    assert (mat_saved != mat_fresh).nnz == 0
+    q_re,I_re = reloaded_integ.integrate_to_1d(img,100)
+    assert np.array_equal(I_re,I)
+    # different settings do not reuse the engine
+    assert not reloaded_integ.engine_key(img.shape,200,0.) == reloaded_integ.engine_key(img.shape,100,0.)
+    mask = np.zeros(img.shape,dtype=bool)
+    mask[:10,:] = True
+    masked_integ = start_integrator(SparseIntegrator(calib_path,mask=mask,cache_dir=str(tmpdir)))
+    assert not masked_integ.engine_key(img.shape,100,0.) == reloaded_integ.engine_key(img.shape,100,0.)
+
+def test_sparse_engine_key_uses_loaded_geometry(tmpdir):
+    calib_copy = os.path.join(str(tmpdir),'calib.nika')
+    shutil.copy(calib_path,calib_copy)
+    integ = start_integrator(SparseIntegrator(calib_copy,cache_dir=str(tmpdir)))
+    key = integ.engine_key((100,100),100,0.)
+    # the key describes the geometry loaded at start(), not the current file
+    with open(calib_copy,'a') as f:
+        f.write('\n')
+    assert integ.engine_key((100,100),100,0.) == key
+    assert start_integrator(SparseIntegrator(calib_path,cache_dir=str(tmpdir))).engine_key(
+        (100,100),100,0.) == key
+
+def test_integrate_stack(tmpdir):
+    img_stack = np.array([fabio.open(p).data for p in img_paths]*2)
+    for integ in [PyFAIIntegrator(calib_path),SparseIntegrator(calib_path,cache_dir=str(tmpdir))]:
+        start_integrator(integ)
+        q_st,I_stack = integ.integrate_stack(img_stack,100)
+        assert I_stack.shape == (4,100)
+        for img,I_st in zip(img_stack,I_stack):
+            q,I = integ.integrate_to_1d(img,100)
+            assert np.array_equal(q_st,q)
+            assert np.allclose(I_st,I)
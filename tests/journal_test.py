@@ -0,0 +1,78 @@
+import os
+import datetime
+
+import numpy as np
+import pytest
+
+from paws import journal, pawstools, serialization
+
+def test_journal_store(tmpdir):
+    fp = str(tmpdir.join('state.yml'))
+    # an existing state file is used as the snapshot
+    pawstools.save_file(fp,dict(a=1,b='x'))
+    st = journal.JournalStore(fp,compact_size=200,sync=False)
+    assert st.to_dict() == dict(a=1,b='x')
+    d_ref = dict(a=1,b='x')
+    for i in range(50):
+        upd = {'T':np.float64(i),'step_{}'.format(i%7):[i,i+1]}
+        st.update(upd)
+        d_ref.update(pawstools.primitives(upd))
+    assert st.to_dict() == d_ref
+    assert st['T'] == 49.
+    st.compact()
+    assert not os.path.exists(fp+'.journal.old')
+    assert os.path.getsize(fp+'.journal') == 0
+    assert serialization.load_file(fp) == d_ref
+    st.update(dict(a=2))
+    d_ref['a'] = 2
+    st.close()
+    # an interrupted append is ignored
+    with open(fp+'.journal','ab') as f:
+        f.write(b'{"a": 3')
+    assert journal.load_state(fp) == d_ref
+    st = journal.JournalStore(fp)
+    assert st.to_dict() == d_ref
+    st.update(dict(c=None))
+    d_ref['c'] = None
+    st.close()
+    assert journal.load_state(fp) == d_ref
+    # an interrupted compaction is finished at the next open
+    os.rename(fp+'.journal',fp+'.journal.old')
+    st = journal.JournalStore(fp)
+    st.wait()
+    assert not os.path.exists(fp+'.journal.old')
+    assert serialization.load_file(fp) == d_ref
+    st.close()
+
+def test_journal_store_round_trip(tmpdir):
+    fp = str(tmpdir.join('state.yml'))
+    st = journal.JournalStore(fp,sync=False)
+    st.update({'m':{1:'a'},'t':datetime.date(2020,1,2)})
+    # the state in memory is the state that is read back
+    assert st.to_dict() == {'m':{'1':'a'},'t':'2020-01-02'}
+    st.close()
+    assert journal.load_state(fp) == {'m':{'1':'a'},'t':'2020-01-02'}
+
+def test_journal_store_failed_compaction(tmpdir,monkeypatch):
+    fp = str(tmpdir.join('state.yml'))
+    st = journal.JournalStore(fp,compact_size=100,sync=False)
+    def failing_save_file(filename,d,fmt=None):
+        raise IOError('disk full')
+    monkeypatch.setattr(serialization,'save_file',failing_save_file)
+    d_ref = {}
+    for i in range(20):
+        st.update({'T':i,'step_{}'.format(i%5):i})
+        d_ref.update({'T':i,'step_{}'.format(i%5):i})
+    with pytest.raises(IOError):
+        st.compact()
+    assert os.path.exists(fp+'.journal.old')
+    assert not os.path.exists(fp+'.tmp')
+    # the state is intact
+    assert journal.load_state(fp) == d_ref
+    assert st.to_dict() == d_ref
+    monkeypatch.undo()
+    st.compact()
+    assert not os.path.exists(fp+'.journal.old')
+    assert os.path.getsize(fp+'.journal') == 0
+    assert serialization.load_file(fp) == d_ref
+    st.close()
@@ -0,0 +1,47 @@
+import os
+import shutil
+import time
+import threading
+
+from paws.plugins.PyFAIIntegrator import PyFAIIntegrator
+from paws.plugins.OnlineIntegrator import OnlineIntegrator
+
+test_dir = os.path.dirname(__file__)
+calib_path = os.path.join(test_dir,'test_data','calib','test.nika')
+img_paths = [os.path.join(test_dir,'test_data','images',fn) for fn in ['test1.tif','test2.tif']]
+
+def wait_for(cond,timeout=10.):
+    t0 = time.time()
+    while not cond() and time.time()-t0 < timeout:
+        time.sleep(0.05)
+    return cond()
+
+def test_online_integrator(tmpdir):
+    integ = PyFAIIntegrator(calib_path)
+    integ.message_callback = lambda msg: None
+    integ.start()
+    # the image directory does not exist yet
+    img_dir = str(tmpdir.join('images'))
+    msgs = []
+    results = []
+    def data_callback(img_path,q_I):
+        results.append((img_path,q_I))
+        raise RuntimeError('callback error')
+    oi = OnlineIntegrator(integ,img_dir,data_callback=data_callback,
+        n_points=100,poll_interval=0.02,settle_time=0.05)
+    oi.message_callback = msgs.append
+    starter = threading.Thread(target=oi.start)
+    starter.start()
+    starter.join(10.)
+    assert not starter.is_alive()
+    assert any('failed to list' in msg for msg in msgs)
+    os.mkdir(img_dir)
+    for p in img_paths:
+        shutil.copy(p,img_dir)
+    # errors in data_callback do not stop the watcher
+    assert wait_for(lambda: oi.state['n_integrated'] == 2)
+    assert sorted(os.path.basename(p) for p,q_I in results) == ['test1.tif','test2.tif']
+    assert all(q_I.shape == (100,3) for p,q_I in results)
+    assert any('callback error' in msg for msg in msgs)
+    oi.stop()
+    assert not oi.watcher_thread.is_alive()
@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+
+from paws.operations.ARRAYS.ArrayYMean import ArrayYMean
+from paws.operations.ARRAYS.ArrayRebin import ArrayRebin, bin_edges
+
+def test_array_y_mean():
+    rng = np.random.RandomState(0)
+    x = np.linspace(0.,1.,10)
+    x_y_arrays = [np.array([x,rng.rand(10)]).T for i in range(20)]
+    y = np.array([xy[:,1] for xy in x_y_arrays])
+    op = ArrayYMean()
+    # arrays are consumed one at a time from a generator
+    outs = op.run_with(x_y_arrays=(xy for xy in x_y_arrays))
+    assert outs['n_arrays'] == 20
+    assert np.allclose(outs['x_ymean'][:,0],x)
+    assert np.allclose(outs['x_ymean'][:,1],np.mean(y,axis=0))
+    assert np.allclose(outs['y_var'],np.var(y,axis=0,ddof=1))
+    assert np.allclose(outs['dy'],np.std(y,axis=0,ddof=1)/np.sqrt(20))
+    wts = rng.rand(20)
+    outs = op.run_with(x_y_arrays=x_y_arrays,weights=list(wts))
+    assert np.allclose(outs['x_ymean'][:,1],np.average(y,axis=0,weights=wts))
+
+def test_array_y_mean_from_files():
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)),'test_data','data')
+    data_paths = [os.path.join(data_dir,'test{}.dat'.format(i)) for i in [1,2]]
+    x_y_arrays = [np.loadtxt(p) for p in data_paths]
+    outs = ArrayYMean().run_with(x_y_paths=data_paths)
+    assert np.allclose(outs['x_ymean'][:,1],(x_y_arrays[0][:,1]+x_y_arrays[1][:,1])/2)
+
+def test_array_rebin():
+    rng = np.random.RandomState(0)
+    q1 = np.linspace(0.01,1.,500)
+    q2 = np.linspace(0.02,1.1,700)
+    q_grid = np.linspace(0.,1.2,300)
+    q_I_arrays = [np.array([q1,rng.rand(500),0.1*rng.rand(500)]).T for i in range(3)] \
+        + [np.array([q2,rng.rand(700),0.1*rng.rand(700)]).T for i in range(2)]
+    op = ArrayRebin()
+    outs = op.run_with(q_I_arrays=q_I_arrays,q_grid=q_grid)
+    assert outs['I_stack'].shape == (5,300)
+    assert outs['dI_stack'].shape == (5,300)
+    for q_I, I in zip(q_I_arrays,outs['I_stack']):
+        I_ref = np.interp(q_grid,q_I[:,0],q_I[:,1],left=np.nan,right=np.nan)
+        assert np.allclose(I,I_ref,equal_nan=True)
+
+def test_array_rebin_flux():
+    # rebinning onto a coarser grid with aligned bin edges conserves the integral
+    q_fine = np.linspace(0.,1.,1001)
+    q_coarse = np.linspace(0.0055,0.9855,99)
+    I = 2.+np.sin(5.*q_fine)
+    outs = ArrayRebin().run_with(q_I_arrays=[np.array([q_fine,I]).T],
+        q_grid=q_coarse,method='flux')
+    I_coarse = outs['I_stack'][0]
+    e_coarse = bin_edges(q_coarse)
+    covered = (q_fine > e_coarse[0]) & (q_fine < e_coarse[-1])
+    assert np.isclose(np.sum(I_coarse*np.diff(e_coarse)),
+        np.sum((I*np.diff(bin_edges(q_fine)))[covered]))
@@ -0,0 +1,29 @@
+import numpy as np
+
+from paws.operations.BACKGROUND.BgSubtract import BgSubtract
+from paws.operations.BACKGROUND.BgSubtractBatch import BgSubtractBatch
+
+def test_bg_subtract_batch():
+    rng = np.random.RandomState(0)
+    q = np.linspace(0.01,1.,100)
+    I_bg = 1.+rng.rand(100)
+    dI_bg = 0.1*rng.rand(100)
+    I_stack = 2.+rng.rand(20,100)
+    dI_stack = 0.1*rng.rand(20,100)
+    batch_op = BgSubtractBatch()
+    batch_op.message_callback = lambda msg: None
+    outs = batch_op.run_with(q=q,I_stack=I_stack,I_bg=I_bg,dI_stack=dI_stack,dI_bg=dI_bg)
+    op = BgSubtract()
+    op.message_callback = lambda msg: None
+    for i in range(I_stack.shape[0]):
+        outs_i = op.run_with(q_I=np.array([q,I_stack[i]]).T,q_I_bg=np.array([q,I_bg]).T,
+            dI=dI_stack[i],dI_bg=dI_bg)
+        assert np.isclose(outs['bg_factor'][i],outs_i['bg_factor'])
+        assert np.allclose(outs['I_bgsub_stack'][i],outs_i['q_I_bgsub'][:,1])
+        assert np.allclose(outs['dI_stack'][i],outs_i['dI'])
+    # two backgrounds, selected per spectrum
+    bg_idx = rng.randint(0,2,20)
+    outs = batch_op.run_with(q=q,I_stack=I_stack,I_bg=np.array([I_bg,1.5*I_bg]),bg_index=bg_idx)
+    for i in range(I_stack.shape[0]):
+        assert np.all(outs['I_bgsub_stack'][i] >= -1.E-12)
+        assert np.isclose(np.min(outs['I_bgsub_stack'][i]),0.)
@@ -0,0 +1,53 @@
+import numpy as np
+
+from paws.operations.IMAGE.ImageCorrection import ImageCorrection
+
+def test_image_correction():
+    rng = np.random.RandomState(0)
+    img_stack = (100*rng.rand(5,40,30)).astype(np.int32)
+    dark = rng.rand(40,30)
+    flat = 0.5+rng.rand(40,30)
+    flat[0,0] = 0.
+    mask = np.zeros((40,30),dtype=bool)
+    mask[3,:] = True
+    op = ImageCorrection()
+    # small blocks, to exercise the block boundaries
+    outs = op.run_with(image=img_stack,dark=dark,flat=flat,mask=mask,block_size=77)
+    with np.errstate(divide='ignore'):
+        img_ref = (img_stack-dark)/flat
+    img_ref[:,mask] = 0.
+    img_ref[:,0,0] = 0.
+    assert outs['image'].dtype == np.float32
+    assert np.allclose(outs['image'],img_ref,rtol=1.E-5,atol=1.E-4)
+    assert np.sum(outs['mask']) == 31
+    # single float32 image, corrected in place
+    img = img_stack[0].astype(np.float32)
+    op.zero_copy = True
+    outs = op.run_with(image=img,dark=dark,fill_value=np.nan)
+    assert np.shares_memory(outs['image'],img)
+    assert np.allclose(img,img_stack[0]-dark,rtol=1.E-5)
+    assert outs['mask'] is None
+    # a new mask with the same shape is prepared again
+    mask = mask.copy()
+    mask[5,:] = True
+    outs = op.run_with(image=img_stack,mask=mask)
+    assert np.sum(outs['mask']) == 60
+    assert np.all(outs['image'][:,5,:] == 0.)
+
+def test_image_correction_layouts():
+    rng = np.random.RandomState(1)
+    img = (100*rng.rand(40,30)).astype(np.float32)
+    dark = rng.rand(40,30)
+    img_ref = img-dark
+    op = ImageCorrection()
+    op.zero_copy = True
+    # fortran-ordered and sliced (non-contiguous) float32 images are not corrected in place
+    for img_in,dark_in,ref in [
+        (np.asfortranarray(img),dark,img_ref),
+        (np.asfortranarray(img.astype(np.int32)),dark,img.astype(np.int32)-dark),
+        (img[:,:20],dark[:,:20],img_ref[:,:20]),
+        (img[::2,:],dark[::2,:],img_ref[::2,:])]:
+        img_orig = img_in.copy()
+        outs = op.run_with(image=img_in,dark=dark_in)
+        assert np.allclose(outs['image'],ref,rtol=1.E-5)
+        assert np.array_equal(img_in,img_orig)
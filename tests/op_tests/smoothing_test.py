@@ -0,0 +1,67 @@
+import numpy as np
+from scipy.signal import savgol_filter
+
+from paws.operations.SMOOTHING.MovingAverage import MovingAverage
+from paws.operations.SMOOTHING.SavitzkyGolay import SavitzkyGolay, window_size
+
+def reference_moving_average(x,w,shape,err):
+    # point-by-point weighted mean over the truncated window
+    n = len(x)
+    x_out = np.zeros(n)
+    for i in range(n):
+        idx = np.arange(max(0,i-w),min(n,i+w+1))
+        wts = np.ones(len(idx))
+        if shape == 'triangle':
+            wts = (w+1-np.abs(idx-i))/float(w+1)
+        if err is not None:
+            wts = wts*err[idx]**-2
+        x_out[i] = np.sum(wts*x[idx])/np.sum(wts)
+    return x_out
+
+def test_moving_average():
+    rng = np.random.RandomState(0)
+    x = 100.*rng.rand(3,50)
+    err = rng.rand(3,50)+0.5
+    op = MovingAverage()
+    for shape in ['square','triangle']:
+        for w in [1,4]:
+            for e in [None,err]:
+                x_sm = op.run_with(data=x,window=w,shape=shape,error=e)['smoothed_data']
+                for irow in range(x.shape[0]):
+                    e_row = None if e is None else e[irow]
+                    x_ref = reference_moving_average(x[irow],w,shape,e_row)
+                    assert np.allclose(x_sm[irow],x_ref)
+                    x_sm_row = op.run_with(data=x[irow],window=w,shape=shape,error=e_row)['smoothed_data']
+                    assert np.allclose(x_sm_row,x_ref)
+
+def test_savitzky_golay():
+    rng = np.random.RandomState(0)
+    x = np.linspace(0.,1.,200)
+    y = np.sin(6.*x)+0.1*rng.rand(3,200)
+    op = SavitzkyGolay()
+    for o, b in [(2,-1),(3,-1),(2,0),(3,2)]:
+        npts = window_size(o,b)
+        h = npts//2
+        y_ref = savgol_filter(y,npts,o,mode='interp')
+        # uniform x: cached convolution coefficients
+        y_sm = op.run_with(x=x,y=y,order=o,base=b)['smoothed_data']
+        # weighted: stacked least-squares solves 
+        y_sm_wtd = op.run_with(x=x,y=y,dy=np.ones(y.shape),order=o,base=b)['smoothed_data']
+        assert np.allclose(y_sm,y_sm_wtd)
+        if b == -1:
+            assert np.allclose(y_sm,y_ref)
+        else:
+            assert np.allclose(y_sm[:,h:-h],y_ref[:,h:-h])
+        y_sm_row = op.run_with(x=x,y=y[0],order=o,base=b)['smoothed_data']
+        assert np.allclose(y_sm_row,y_sm[0])
+    # a single point is returned unchanged
+    for o, b in [(0,-1),(2,0)]:
+        y_sm_pt = op.run_with(x=[0.5],y=[2.],order=o,base=b)['smoothed_data']
+        assert np.array_equal(y_sm_pt,[2.])
+    # so are fewer points than the polynomial has coefficients
+    for nx, o, b in [(2,2,0),(2,2,-1),(3,3,-1),(3,5,1)]:
+        x_few = np.linspace(0.,1.,nx)
+        y_few = y[:,:nx]
+        for dy in [None,np.ones(y_few.shape)]:
+            y_sm_few = op.run_with(x=x_few,y=y_few,dy=dy,order=o,base=b)['smoothed_data']
+            assert np.array_equal(y_sm_few,y_few)
@@ -0,0 +1,49 @@
+import os
+import datetime
+import time
+
+import numpy as np
+import tzlocal
+
+from paws.operations.SSRL_BEAMLINE_1_5 import ReadSpecHeader as rsh
+
+hdr_dir = os.path.join(os.path.dirname(__file__),'..','test_data','headers','legacy')
+hdr_paths = [os.path.join(hdr_dir,fn) for fn in ['test1.txt','test2.txt']]
+
+def strptime_time(t_str):
+    # the date parsing of the original ReadSpecHeader
+    dt = datetime.datetime.strptime(t_str.strip(),"%a %b %d %H:%M:%S %Y")
+    dt_aware = datetime.datetime(dt.year,dt.month,dt.day,dt.hour,dt.minute,dt.second,dt.microsecond,
+        tzlocal.get_localzone())
+    return float(time.mktime(dt_aware.timetuple()))
+
+def test_spec_time():
+    for t_str in ['Sat Dec 25 00:22:01 1667','Sun Dec  5 07:03:09 2021','Wed Jun 27 12:39:49 2018']:
+        assert rsh.spec_time(t_str) == strptime_time(t_str)
+
+def test_read_spec_headers(tmpdir):
+    op = rsh.ReadSpecHeader()
+    op.message_callback = lambda msg: None
+    hdrs = [op.run_with(file_path=p)['data'] for p in hdr_paths]
+    assert hdrs[0]['User'] == 'Santa'
+    assert hdrs[0]['temperature'] == 1.6
+    # the fast date parsing agrees with strptime
+    assert hdrs[0]['time'] == strptime_time('Sat Dec 25 00:22:01 1667')
+    hdr = rsh.parse_spec_header(['User: Santa, time: Sun Dec  5 07:03:09 2021'])
+    assert hdr['time'] == strptime_time('Sun Dec  5 07:03:09 2021')
+    # a header without the temperature key or the date line
+    extra_path = str(tmpdir.join('extra.txt'))
+    with open(extra_path,'w') as f:
+        f.write('# Counters\nCTEMP=2\n')
+    paths = hdr_paths*50+[extra_path]
+    for n_workers in [1,4]:
+        table = rsh.read_spec_headers(paths,n_workers=n_workers,chunk_size=8)
+        assert list(table['file_path']) == paths
+        for k in hdrs[0].keys():
+            assert len(table[k]) == len(paths)
+            assert table[k][0] == hdrs[0][k]
+            assert table[k][1] == hdrs[1][k]
+        assert table['time'].dtype == float
+        assert np.isnan(table['time'][-1])
+        assert table['User'][-1] is None
+        assert table['CTEMP'][-1] == 2.
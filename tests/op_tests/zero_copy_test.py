@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from paws.operations.ARRAYS.NoiseArray import NoiseArray
+from paws.operations.SORTING.SortBatch import SortBatch
+
+def peak_run_with(op,**kwargs):
+    # tracemalloc is not available in python 2
+    tracemalloc = pytest.importorskip('tracemalloc')
+    tracemalloc.start()
+    result = op.run_with(**kwargs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, peak
+
+def test_zero_copy_identical():
+    np.random.seed(0)
+    op = NoiseArray()
+    result = op.run_with(size=50)
+    np.random.seed(0)
+    op.zero_copy = True
+    result_zc = op.run_with(size=50)
+    assert np.array_equal(result['array'],result_zc['array'])
+    assert not result_zc['array'].flags.writeable
+    assert np.shares_memory(result_zc['array'],op.outputs['array'])
+
+def test_zero_copy_peak_memory():
+    op = NoiseArray()
+    result, peak = peak_run_with(op,size=1000)
+    op.zero_copy = True
+    result_zc, peak_zc = peak_run_with(op,size=1000)
+    assert peak_zc < peak
+    # the deep copy costs at least one extra 8 MB array
+    assert peak - peak_zc > 0.9*result['array'].nbytes
+
+def test_zero_copy_defaults_untouched():
+    op = SortBatch()
+    op.zero_copy = True
+    arrs = [np.full(3,float(i)) for i in range(4)]
+    outs = op.run_with(batch_outputs={'data':arrs},x_values=[3.,1.,2.,0.])
+    assert [a[0] for a in outs['sorted_outputs']['data']] == [0.,1.,2.,3.]
+    assert op.default_outputs['sorted_outputs'] == {}
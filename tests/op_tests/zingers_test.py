@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+
+from paws.operations.ZINGERS.EasyZingers1d import EasyZingers1d
+from paws.operations.ZINGERS.EasyZingers1dBatch import EasyZingers1dBatch
+from paws.operations.ZINGERS.ExposureStack import ExposureStack
+from paws import imagetools
+
+def reference_zmask(q,I,I_ratio_limit,w):
+    # point-by-point evaluation, as in the original EasyZingers1d
+    zmask = np.zeros(len(q),dtype=bool)
+    idx_z = []
+    for idx in range(w,len(q)-w-2):
+        idx_l = np.array([i for i in range(idx-w,idx+1) if not i in idx_z])
+        idx_r = np.arange(idx,idx+w+1)
+        Ii_l = np.array(I[idx_l])
+        Ii_r = np.array(I[idx_r])
+        q_ratio_l = (q[idx_l[-1]] - q[idx_l[:-1]]) / (q[idx_l[-1]]-q[idx_l[0]])  
+        q_ratio_r = (q[idx_r[1:]] - q[idx_r[0]]) / (q[idx_r[-1]]-q[idx_r[0]])  
+        Ii_l[:-1] = Ii_l[:-1] - q_ratio_l * (Ii_l[0]-Ii_l[-2]) 
+        Ii_r[1:] = Ii_r[1:] - q_ratio_r * (Ii_r[-1]-Ii_r[1]) 
+        Istd_l = np.std(Ii_l[:-1]) 
+        Istd_r = np.std(Ii_r[1:]) 
+        if Istd_l and Istd_r:
+            if (Ii_l[-1]-Ii_l[-2])/Istd_l > I_ratio_limit \
+            or (Ii_r[0]-Ii_r[1])/Istd_r > I_ratio_limit:
+                idx_z.append(idx)
+                zmask[idx] = True
+    return zmask
+
+def make_q_I(seed,n_points=600):
+    rng = np.random.RandomState(seed)
+    q = np.linspace(0.01,1.,n_points)
+    I = 1000.*np.exp(-3.*q)+5.*rng.rand(n_points)
+    iz = rng.randint(0,n_points,15)
+    I[iz] += 500.*rng.rand(15)
+    # a few clusters of adjacent zingers
+    for iz in rng.randint(20,n_points-20,3):
+        I[iz:iz+3] += 400.
+    return np.array([q,I]).T
+
+def test_easy_zingers_1d():
+    op = EasyZingers1d()
+    op.message_callback = lambda msg: None
+    for seed in range(5):
+        q_I = make_q_I(seed)
+        for lim, w in [(5.,3),(10.,10),(40.,10)]:
+            outs = op.run_with(q_I=q_I,sharpness_limit=lim,window_width=w)
+            zmask = reference_zmask(q_I[:,0],q_I[:,1],lim,w)
+            assert np.array_equal(outs['zmask'],zmask)
+            I_dz = np.array(q_I[:,1])
+            I_dz[zmask] = np.nan
+            for iz in np.where(zmask)[0]:
+                I_dz[iz] = np.nanmean(np.where(zmask,np.nan,q_I[:,1])[iz-w:iz+w+1])
+            assert np.allclose(outs['q_I_dz'][:,1],I_dz)
+
+def test_easy_zingers_1d_batch():
+    op = EasyZingers1d()
+    op.message_callback = lambda msg: None
+    batch_op = EasyZingers1dBatch()
+    batch_op.message_callback = lambda msg: None
+    q_I_arrays = [make_q_I(seed) for seed in range(7)]
+    q = q_I_arrays[0][:,0]
+    I_stack = np.array([q_I[:,1] for q_I in q_I_arrays])
+    outs = batch_op.run_with(q=q,I_stack=I_stack,sharpness_limit=10.,window_width=10,chunk_size=3)
+    assert outs['zmask_stack'].shape == I_stack.shape
+    for q_I, I_dz, zmask in zip(q_I_arrays,outs['I_dz_stack'],outs['zmask_stack']):
+        outs_1d = op.run_with(q_I=q_I,sharpness_limit=10.,window_width=10)
+        assert np.array_equal(zmask,outs_1d['zmask'])
+        assert np.allclose(I_dz,outs_1d['q_I_dz'][:,1])
+
+def test_exposure_stack():
+    rng = np.random.RandomState(0)
+    I_true = 100.+50.*rng.rand(60,40)
+    img_stack = rng.poisson(np.broadcast_to(I_true,(5,60,40))).astype(np.int32)
+    zmask = np.zeros(img_stack.shape,dtype=bool)
+    zmask[rng.randint(0,5,20),rng.randint(0,60,20),rng.randint(0,40,20)] = True
+    img_stack[zmask] += 5000
+    op = ExposureStack()
+    op.message_callback = lambda msg: None
+    outs = op.run_with(images=img_stack,block_rows=7)
+    # every zinger is rejected, and few other values
+    assert np.all(outs['count'][np.any(zmask,axis=0)] < 5)
+    assert np.sum(5-outs['count']) < np.sum(zmask)+0.02*img_stack.size
+    assert np.all(np.abs(outs['image']-I_true) < 50.)
+    outs = op.run_with(images=list(img_stack),method='median')
+    assert np.allclose(outs['image'],np.median(img_stack,axis=0))
+    assert np.all(outs['count'] == 5)
+
+def test_exposure_stack_files(tmpdir):
+    rng = np.random.RandomState(1)
+    img_stack = rng.poisson(100.,(4,30,20)).astype(np.int32)
+    img_stack[2,5,5] += 5000
+    img_paths = []
+    for iexp,img in enumerate(img_stack):
+        img_paths.append(os.path.join(str(tmpdir),'exp{}.npy'.format(iexp)))
+        np.save(img_paths[-1],img)
+    op = ExposureStack()
+    op.message_callback = lambda msg: None
+    outs = op.run_with(images=img_stack,block_rows=7)
+    # the files are memory-mapped and read block by block, with the same result
+    outs_files = op.run_with(images=img_paths,block_rows=7)
+    assert np.array_equal(outs_files['image'],outs['image'])
+    assert np.array_equal(outs_files['count'],outs['count'])
+    assert imagetools.loaded_bytes() == 0
+    handles = [imagetools.ImageHandle(p) for p in img_paths]
+    outs_handles = op.run_with(images=handles,block_rows=7)
+    assert np.array_equal(outs_handles['image'],outs['image'])
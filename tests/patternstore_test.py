@@ -0,0 +1,46 @@
+import numpy as np
+
+from paws.patternstore import PatternStore
+from paws.workflows.SSRL_BEAMLINE_1_5.ReadTimeSeries import ReadTimeSeries
+from paws.workflows.PATTERN_PROCESSING_1D.DezingerBatch import DezingerBatch
+
+def test_pattern_store(tmpdir):
+    store_dir = str(tmpdir.join('store'))
+    q = np.linspace(0.01,1.,200)
+    I = np.random.rand(10,200)
+    store = PatternStore(store_dir,q)
+    assert len(store) == 0
+    for i in range(5):
+        store.append(I[i],dI=0.1*I[i],time=10.-i,header={'index':i})
+    store.append(I[5:],time=np.arange(5.,10.),header=[{'index':i} for i in range(5,10)])
+    store = PatternStore(store_dir)
+    assert len(store) == 10
+    assert np.array_equal(store.I,I)
+    assert np.allclose(store.dI[:5],0.1*I[:5])
+    assert np.all(np.isnan(store.dI[5:]))
+    assert store.header(7) == {'index':7}
+    assert store.time_index(9.1) == 1
+    assert list(store.select_time(5.,7.)) == [5,4,6]
+    pat = store.get(3)
+    assert np.array_equal(pat['I'],I[3]) and pat['time'] == 7.
+
+def test_dezinger_to_store(tmpdir):
+    store_dir = str(tmpdir.join('store'))
+    q = np.linspace(0.01,1.,200)
+    q_I_arrays = [np.array([q,np.random.rand(200)]).T for i in range(4)]
+    dz = DezingerBatch()
+    dz.message_callback = lambda msg: None
+    dz_outs = dz.run_with(q_I_arrays=q_I_arrays,store_path=store_dir,times=[3.,1.,2.,0.])
+    rd = ReadTimeSeries()
+    rd.message_callback = lambda msg: None
+    outs = rd.run_with(store_path=store_dir,lower_index=1)
+    assert outs['time'] == [1.,2.,3.]
+    assert np.array_equal(outs['q'],dz_outs['data'][1][:,0])
+    assert np.array_equal(outs['I_stack'][0],dz_outs['data'][1][:,1])
+    assert np.array_equal(outs['I_stack'],dz_outs['I_dz_stack'][[1,2,0]])
+    assert np.array_equal(outs['mask_stack'],dz_outs['zmask_stack'][[1,2,0]])
+    # with zero_copy, a regular slice of the store stays memory-mapped
+    rd.zero_copy = True
+    outs = rd.run_with(store_path=store_dir,lower_index=1,upper_index=3)
+    assert isinstance(outs['I_stack'].base,np.memmap)
+    assert np.array_equal(outs['I_stack'],PatternStore(store_dir).I[[1,2]])
@@ -0,0 +1,39 @@
+import os
+from collections import OrderedDict
+
+import numpy as np
+import yaml
+
+from paws import pawstools, serialization
+
+hdr_path = os.path.join(os.path.dirname(__file__),'test_data','headers','test1.yml')
+
+def test_serialization(tmpdir):
+    # existing YAML headers are read as before
+    with open(hdr_path,'r') as f:
+        hdr_ref = yaml.safe_load(f)
+    hdr = serialization.load_file(hdr_path)
+    assert hdr == hdr_ref
+    # numpy values and OrderedDicts are saved as primitives, in either format
+    hdr.update(n_exp=np.int64(3),T=np.float32(1.5),flows=np.array([1.,2.]),
+        recipe=OrderedDict(solvent='toluene'),ok=True,bad_flow=np.bool_(False))
+    hdr_prims = dict(hdr_ref,n_exp=3,T=1.5,flows=[1.,2.],recipe=dict(solvent='toluene'),
+        ok=True,bad_flow=False)
+    for fmt in ['yaml','json']:
+        fp = str(tmpdir.join('hdr_{}.yml'.format(fmt)))
+        serialization.save_file(fp,hdr,fmt)
+        hdr_loaded = serialization.load_file(fp)
+        assert hdr_loaded == hdr_prims
+        assert hdr_loaded['ok'] is True and hdr_loaded['bad_flow'] is False
+    with open(str(tmpdir.join('hdr_json.yml')),'r') as f:
+        assert f.read().startswith('{')
+    # YAML with python tags, as written by yaml.dump()
+    fp = str(tmpdir.join('hdr_tags.yml'))
+    with open(fp,'w') as f:
+        yaml.dump(dict(a=1,b=(1,2)),f)
+    assert serialization.load_file(fp) == dict(a=1,b=(1,2))
+    # update_file keeps the existing items
+    pawstools.update_file(fp,dict(c='x'))
+    assert serialization.load_file(fp) == dict(a=1,b=[1,2],c='x')
+    res = serialization.benchmark(5)
+    assert list(res.keys()) == ['yaml_python','yaml','json']
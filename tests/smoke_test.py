@@ -1,20 +1,22 @@
 import paws
+from paws import datcache, headerindex, imagetools, journal, patternstore, serialization
 from paws import operations
 from paws import workflows
 from paws import plugins
 
 from paws.operations import Operation, \
-    ARRAYS, BACKGROUND, CALIBRATION, FILESYSTEM, SMOOTHING, \
+    ARRAYS, BACKGROUND, CALIBRATION, FILESYSTEM, IMAGE, SMOOTHING, \
     SORTING, SSRL_BEAMLINE_1_5, TESTS, ZINGERS
-from paws.operations.ARRAYS import ArrayYMean, NoiseArray
-from paws.operations.BACKGROUND import BgSubtract
+from paws.operations.ARRAYS import ArrayYMean, ArrayRebin, NoiseArray
+from paws.operations.BACKGROUND import BgSubtract, BgSubtractBatch
 from paws.operations.CALIBRATION import ReadPONI, Fit2DToPONI, NikaToPONI, WXDToPONI 
 from paws.operations.FILESYSTEM import BuildFileList 
+from paws.operations.IMAGE import ImageCorrection
 from paws.operations.SMOOTHING import MovingAverage, SavitzkyGolay 
 from paws.operations.SORTING import SortBatch 
 from paws.operations.SSRL_BEAMLINE_1_5 import ReadSpecHeader
 from paws.operations.TESTS import Print, ListPrimes
-from paws.operations.ZINGERS import EasyZingers1d 
+from paws.operations.ZINGERS import EasyZingers1d, EasyZingers1dBatch, ExposureStack
 
 from paws.workflows import Workflow, SSRL_BEAMLINE_1_5
 from paws.workflows.SSRL_BEAMLINE_1_5 import Read, ReadBatch, ReadTimeSeries
@@ -23,8 +25,8 @@ from paws.workflows.SSRL_BEAMLINE_1_5.LEGACY import Read, ReadBatch, ReadTimeSer
 
 from paws.plugins import PawsPlugin, \
     BayesianDesigner, CitrinationClient, CitrinationDesigner, CryoConController, \
-    FlowReactor, MarCCDClient, MitosPPumpController, PyFAIIntegrator, SpecInfoClient, \
-    SSHClient, Timer 
+    FlowReactor, MarCCDClient, MitosPPumpController, OnlineIntegrator, PyFAIIntegrator, SparseIntegrator, \
+    SpecInfoClient, SSHClient, Timer 
 
 def test_imports():
     return True
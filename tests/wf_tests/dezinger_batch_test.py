@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+
+from paws.workflows.PATTERN_PROCESSING_1D.DezingerBatch import DezingerBatch
+
+def make_q_I(seed,q):
+    rng = np.random.RandomState(seed)
+    I = 1000.*np.exp(-3.*q)+5.*rng.rand(len(q))
+    I[rng.randint(0,len(q),10)] += 500.
+    return np.array([q,I]).T
+
+def test_dezinger_batch_stacked(tmpdir):
+    q = np.linspace(0.01,1.,300)
+    q_I_paths = []
+    for i in range(4):
+        q_I_paths.append(os.path.join(str(tmpdir),'sample{}.dat'.format(i)))
+        np.savetxt(q_I_paths[-1],make_q_I(i,q))
+    # a pattern on a different q grid sends the batch down the per-pattern path
+    q_I_paths.append(os.path.join(str(tmpdir),'other.dat'))
+    np.savetxt(q_I_paths[-1],make_q_I(4,q+0.005))
+    dz = DezingerBatch()
+    dz.message_callback = lambda msg: None
+    stack_dir = str(tmpdir.mkdir('stacked'))
+    outs = dz.run_with(q_I_paths=q_I_paths[:4],output_dir=stack_dir,window_width=10,sharpness_limit=10.)
+    assert outs['I_dz_stack'].shape == (4,300)
+    assert np.all(np.sum(outs['zmask_stack'],axis=1) > 0)
+    single_dir = str(tmpdir.mkdir('single'))
+    outs_single = dz.run_with(q_I_paths=q_I_paths,output_dir=single_dir,window_width=10,sharpness_limit=10.)
+    assert outs_single['I_dz_stack'] is None
+    assert len(outs_single['data']) == 5
+    for i in range(4):
+        assert np.allclose(outs['data'][i],outs_single['data'][i])
+        assert np.allclose(outs['I_dz_stack'][i],outs_single['data'][i][:,1])
+        assert os.path.basename(outs['data_paths'][i]) == os.path.basename(outs_single['data_paths'][i])
+        assert np.allclose(np.loadtxt(outs['data_paths'][i]),np.loadtxt(outs_single['data_paths'][i]))
+    # the same stack, given as I_stack
+    I_stack = np.array([make_q_I(i,q)[:,1] for i in range(4)])
+    outs_stack = dz.run_with(q=q,I_stack=I_stack,window_width=10,sharpness_limit=10.)
+    assert np.allclose(outs_stack['I_dz_stack'],outs['I_dz_stack'])
+
+def test_dezinger_batch_no_q():
+    msgs = []
+    dz = DezingerBatch()
+    dz.message_callback = msgs.append
+    outs = dz.run_with(I_stack=np.ones((3,100)))
+    assert outs['data'] == []
+    assert outs['I_dz_stack'] is None
+    assert any('q grid' in msg for msg in msgs)
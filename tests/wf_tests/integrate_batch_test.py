@@ -0,0 +1,106 @@
+import os
+
+import numpy as np
+import fabio
+
+from paws.plugins.PyFAIIntegrator import PyFAIIntegrator
+from paws.plugins.SparseIntegrator import SparseIntegrator
+from paws.workflows.IMAGE_INTEGRATION.IntegrateBatch import IntegrateBatch
+
+test_dir = os.path.join(os.path.dirname(__file__),'..')
+calib_path = os.path.join(test_dir,'test_data','calib','test.nika')
+img_paths = [os.path.join(test_dir,'test_data','images',fn) for fn in ['test1.tif','test2.tif']]
+
+def test_integrate_batch_no_integrator():
+    msgs = []
+    ib = IntegrateBatch()
+    ib.message_callback = msgs.append
+    outs = ib.run_with(image_paths=img_paths,n_processes=2)
+    assert outs['data'] == []
+    assert any('no integrator' in msg for msg in msgs)
+
+def test_integrate_batch_processes():
+    integ = PyFAIIntegrator(calib_path)
+    integ.message_callback = lambda msg: None
+    integ.start()
+    ib = IntegrateBatch()
+    ib.message_callback = lambda msg: None
+    outs = ib.run_with(integrator=integ,image_paths=img_paths*3,n_points=100)
+    # each worker builds its integrator from the calib_file of the integrator input
+    outs_par = ib.run_with(integrator=integ,image_paths=img_paths*3,n_points=100,n_processes=2)
+    assert len(outs_par['data']) == 6
+    for q_I,q_I_par in zip(outs['data'],outs_par['data']):
+        assert np.allclose(q_I_par,q_I,equal_nan=True)
+
+def test_integrate_batch_processes_sparse(tmpdir):
+    img = fabio.open(img_paths[0]).data
+    mask = np.zeros(img.shape,dtype=bool)
+    mask[:,:img.shape[1]//2] = True
+    integ = SparseIntegrator(calib_path,mask=mask,cache_dir=str(tmpdir))
+    integ.message_callback = lambda msg: None
+    integ.start()
+    ib = IntegrateBatch()
+    ib.message_callback = lambda msg: None
+    outs = ib.run_with(integrator=integ,image_paths=img_paths*2,n_points=100)
+    # the workers rebuild the integrator with its mask, splitting and cache
+    outs_par = ib.run_with(integrator=integ,image_paths=img_paths*2,n_points=100,n_processes=2)
+    assert len(outs_par['data']) == 4
+    for q_I,q_I_par in zip(outs['data'],outs_par['data']):
+        assert np.allclose(q_I_par,q_I,equal_nan=True)
+    # the mask changes the results
+    unmasked_integ = SparseIntegrator(calib_path,cache_dir=str(tmpdir))
+    unmasked_integ.message_callback = lambda msg: None
+    unmasked_integ.start()
+    q_I_unmasked = ib.run_with(integrator=unmasked_integ,image_paths=img_paths[:1],n_points=100)['data'][0]
+    assert not np.allclose(q_I_unmasked,outs['data'][0],equal_nan=True)
+
+def test_integrate_batch_processes_unsupported():
+    class ListIntegrator(object):
+        def integrate_to_1d(self,img,npt=1000,polz_factor=0.):
+            return np.arange(npt),np.zeros(npt)
+    msgs = []
+    ib = IntegrateBatch()
+    ib.message_callback = msgs.append
+    outs = ib.run_with(integrator=ListIntegrator(),image_paths=img_paths,
+        n_processes=2,error_model=None)
+    assert outs['data'] == []
+    assert any('n_processes=1' in msg for msg in msgs)
+
+def test_integrate_batch_stack():
+    integ = PyFAIIntegrator(calib_path)
+    integ.message_callback = lambda msg: None
+    integ.start()
+    ib = IntegrateBatch()
+    ib.message_callback = lambda msg: None
+    imgs = [fabio.open(p).data for p in img_paths]
+    outs = ib.run_with(integrator=integ,images=imgs,n_points=100)
+    outs_stack = ib.run_with(integrator=integ,images=np.array(imgs),n_points=100)
+    assert len(outs_stack['data']) == 2
+    for q_I,q_I_stack in zip(outs['data'],outs_stack['data']):
+        assert np.allclose(q_I_stack,q_I,equal_nan=True)
+
+def test_integrate_batch_errors(tmpdir):
+    integ = PyFAIIntegrator(calib_path)
+    integ.message_callback = lambda msg: None
+    integ.start()
+    ib = IntegrateBatch()
+    ib.message_callback = lambda msg: None
+    img = fabio.open(img_paths[0]).data
+    for error_model,n_cols in [('poisson',3),(None,2)]:
+        out_dir = str(tmpdir.mkdir('dat_{}'.format(n_cols)))
+        outs = ib.run_with(integrator=integ,image_paths=img_paths[:1],
+            n_points=100,output_dir=out_dir,error_model=error_model)
+        q_I = outs['data'][0]
+        assert q_I.shape == (100,n_cols)
+        # the saved .dat file has the same columns
+        with open(outs['data_paths'][0],'r') as f:
+            hdr = f.readline()
+        assert ('dI' in hdr) == (n_cols == 3)
+        assert np.allclose(np.loadtxt(outs['data_paths'][0]),q_I,equal_nan=True)
+    q,I,dI = integ.integrate_to_1d_with_error(img,100,polz_factor=1.)
+    q_I_err = ib.run_with(integrator=integ,images=[img],n_points=100)['data'][0]
+    assert np.allclose(q_I_err[:,2],dI,equal_nan=True)
+    # explicit variances
+    q_I_var = ib.run_with(integrator=integ,images=[img],variances=[4.*np.maximum(img,1)],
+        n_points=100)['data'][0]
+    assert np.allclose(q_I_var[:,2],2.*dI,equal_nan=True)
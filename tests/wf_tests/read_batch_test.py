@@ -0,0 +1,40 @@
+import os
+
+import numpy as np
+import pytest
+import yaml
+
+from paws.workflows.SSRL_BEAMLINE_1_5.ReadBatch import ReadBatch
+
+def test_prefetching_read_batch(tmpdir):
+    tmp_dir = str(tmpdir)
+    hdr_dir = os.path.join(tmp_dir,'headers')
+    q_I_dir = os.path.join(tmp_dir,'data')
+    os.mkdir(hdr_dir)
+    os.mkdir(q_I_dir)
+    for i in range(20):
+        with open(os.path.join(hdr_dir,'sample{}.yml'.format(i)),'w') as f:
+            yaml.dump(dict(time=float(i)),f)
+        np.savetxt(os.path.join(q_I_dir,'sample{}.dat'.format(i)),np.random.rand(50,3))
+    rb = ReadBatch()
+    rb.message_callback = lambda msg: None
+    outs = rb.run_with(header_dir=hdr_dir,q_I_dir=q_I_dir)
+    outs_threaded = rb.run_with(header_dir=hdr_dir,q_I_dir=q_I_dir,n_threads=4,max_in_flight=3)
+    assert outs_threaded['header_files'] == outs['header_files']
+    assert outs_threaded['time'] == outs['time']
+    for q_I, q_I_threaded in zip(outs['q_I'],outs_threaded['q_I']):
+        assert np.array_equal(q_I,q_I_threaded)
+
+def test_prefetching_read_batch_error(tmpdir):
+    tmp_dir = str(tmpdir)
+    for i in range(10):
+        with open(os.path.join(tmp_dir,'sample{}.yml'.format(i)),'w') as f:
+            yaml.dump(dict(time=float(i)),f)
+    # a malformed header
+    with open(os.path.join(tmp_dir,'sample5.yml'),'w') as f:
+        f.write('time: [1.\n')
+    rb = ReadBatch()
+    rb.message_callback = lambda msg: None
+    for n_threads in [1,4]:
+        with pytest.raises(yaml.YAMLError):
+            rb.run_with(header_dir=tmp_dir,n_threads=n_threads,max_in_flight=2)
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from paws.workflows.PATTERN_PROCESSING_1D.DezingerBatch import DezingerBatch
+
+def make_q_I_arrays(n_arrays=10,n_points=1000):
+    np.random.seed(0)
+    q = np.linspace(0.01,1.,n_points)
+    return [np.array([q,100.+np.random.rand(n_points)]).T for i in range(n_arrays)]
+
+def peak_run_with(wf,**kwargs):
+    # tracemalloc is not available in python 2
+    tracemalloc = pytest.importorskip('tracemalloc')
+    tracemalloc.start()
+    result = wf.run_with(**kwargs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, peak
+
+def test_zero_copy_workflow():
+    q_I_arrays = make_q_I_arrays()
+    q_I_paths = ['pattern_{}.dat'.format(i) for i in range(len(q_I_arrays))]
+    wf = DezingerBatch()
+    wf.message_callback = lambda msg: None
+    result, peak = peak_run_with(wf,q_I_arrays=q_I_arrays,q_I_paths=q_I_paths)
+    wf.zero_copy = True
+    result_zc, peak_zc = peak_run_with(wf,q_I_arrays=q_I_arrays,q_I_paths=q_I_paths)
+    assert len(result['data']) == len(result_zc['data'])
+    for q_I_dz, q_I_dz_zc in zip(result['data'],result_zc['data']):
+        assert np.array_equal(q_I_dz,q_I_dz_zc)
+        assert not q_I_dz_zc.flags.writeable
+    assert peak_zc < peak